@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compare YAML loaders and JSON encoders on large rendered templates.
+
+    $ python benchmarks/bench_codec.py
+"""
+
+import os
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from pacyam.codec import dump_manifest
+
+PROVISIONER_COUNTS = [100, 1000, 5000]
+REPEAT = 3
+
+
+def build_template(provisioner_count):
+    """A YAML template with one builder and many shell provisioners
+    """
+    lines = [
+        'builders:',
+        '- type: qemu',
+        '  vm_name: "ubuntu-18.04"',
+        '  boot_command:',
+    ]
+    lines += ['    - "<esc><wait>"'] * 20
+    lines.append('provisioners:')
+    for index in range(provisioner_count):
+        lines += [
+            '- type: shell',
+            '  execute_command: "echo \'vagrant\' | sudo -S -E bash \'{{.Path}}\'"',
+            '  environment_vars:',
+            '    - "INDEX=%d"' % index,
+            '  inline:',
+            '    - apt-get update',
+            '    - apt-get install -y package-%d' % index,
+        ]
+    return '\n'.join(lines)
+
+
+def best_of(function):
+    return min(timeit.Timer(function).repeat(repeat=REPEAT, number=1))
+
+
+def main():
+    loaders = [('SafeLoader', yaml.SafeLoader)]
+    if yaml.__with_libyaml__:
+        loaders.append(('CSafeLoader', yaml.CSafeLoader))
+
+    backends = ['json']
+    try:
+        import orjson  # pylint: disable=import-outside-toplevel,unused-import
+        backends.append('orjson')
+    except ImportError:
+        print('orjson is not installed, skipping its backend')
+
+    columns = [name for name, _ in loaders] + backends
+    print('%12s %s' % ('provisioners', ' '.join('%14s' % column for column in columns)))
+    for provisioner_count in PROVISIONER_COUNTS:
+        text = build_template(provisioner_count)
+        manifest = yaml.safe_load(text)
+        timings = [best_of(lambda loader=loader: yaml.load(text, Loader=loader))
+                   for _, loader in loaders]
+        timings += [best_of(lambda backend=backend: dump_manifest(manifest, backend))
+                    for backend in backends]
+        print('%12d %s' % (provisioner_count, ' '.join('%13.4fs' % timing for timing in timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Time each phase of compiling a generated, synthetic project.
+
+A project is generated in a temporary directory with configurable sizes, and
+each phase is timed on its own (best of --repeat runs, each with a new
+RenderEnvironment):
+
+    config      Configuration.load
+    variables   VariableManager, evaluating every variable
+    render      TemplateManager, rendering and parsing every template
+    merge       TemplateManager.merge_template_data
+    serialize   dump_manifest, with each installed JSON backend
+
+Results are printed, and can be written to a JSON baseline file. Keep the
+baseline in the repository, so a regression shows up as a diff of it, or
+compare against it directly:
+
+    $ python benchmarks/bench_compile.py --write-baseline benchmarks/baseline.json
+    $ python benchmarks/bench_compile.py --compare benchmarks/baseline.json
+"""
+
+from argparse import ArgumentParser
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from pacyam.codec import dump_manifest, json_encoder
+from pacyam.environment import RenderEnvironment
+from pacyam.pacyam import BuildException, Configuration, TemplateManager, VariableManager
+
+INCLUDE_MACRO = '# {% macro include_file(template) %}{% include template %}{% endmacro %}\n'
+
+# Ratio to the baseline above which a phase is reported as a regression
+REGRESSION_THRESHOLD = 1.5
+
+
+def _nested_yaml(depth, list_length, index, indent=0):
+    """YAML lines for a mapping nested `depth` levels deep, ending in a list
+    """
+    pad = '  ' * indent
+    if depth == 0:
+        return ['%s- "{{ key_%d }}-%d"' % (pad, (index + item) % 10, item)
+                for item in range(list_length)]
+    lines = ['%slevel_%d:' % (pad, depth)]
+    return lines + _nested_yaml(depth - 1, list_length, index, indent + 1)
+
+
+def generate_project(directory, templates=50, variable_blocks=500, depth=4,
+                     list_length=20, fan_out=3):
+    """Write a synthetic project into `directory`
+
+    Every template adds one builder and one provisioner, nests a mapping
+    `depth` levels deep ending in a list of `list_length` templated values,
+    and includes `fan_out` partial files through the `include_file` macro.
+    Variable blocks alternate between plain values and values referencing
+    an earlier block.
+    """
+    os.makedirs(os.path.join(directory, 'templates', 'partials'))
+    os.makedirs(os.path.join(directory, 'variables'))
+
+    with open(os.path.join(directory, 'variables', 'default.yaml'), 'w') as variable_file:
+        for index in range(variable_blocks):
+            if index % 2 and index > 10:
+                variable_file.write('key_%d: "{{ key_%d }}-%d"\n' % (index, index // 2, index))
+            else:
+                variable_file.write('key_%d: value-%d\n' % (index, index))
+
+    for index in range(fan_out):
+        path = os.path.join(directory, 'templates', 'partials', 'partial_%d.yaml' % index)
+        with open(path, 'w') as partial:
+            partial.write('partial_%d: "{{ key_%d }}"\n' % (index, index % variable_blocks))
+
+    template_paths = []
+    for index in range(templates):
+        path = 'templates/template_%d.yaml' % index
+        lines = [INCLUDE_MACRO, 'builders:', '- type: qemu', '  name: "builder-%d"' % index]
+        lines += ['  ' + line for line in _nested_yaml(depth, list_length, index)]
+        lines += ['provisioners:', '- type: shell', '  inline:']
+        lines += ['  - echo "{{ key_%d }}"' % (item % 10) for item in range(list_length)]
+        lines += ['variables:']
+        lines += [
+            "  {{ include_file('templates/partials/partial_%d.yaml')|indent(2) }}" % item
+            for item in range(fan_out)
+        ]
+        with open(os.path.join(directory, path), 'w') as template_file:
+            template_file.write('\n'.join(lines) + '\n')
+        template_paths.append(path)
+
+    with open(os.path.join(directory, 'config.json'), 'w') as config_file:
+        json.dump({'templates': template_paths, 'variables': ['variables/default.yaml']},
+                  config_file, indent=4)
+
+
+def best_of(function, repeat):
+    return min(timeit.Timer(function).repeat(repeat=repeat, number=1))
+
+
+def time_phases(directory, repeat):
+    """Time each compile phase of the project in `directory`, in seconds
+    """
+    results = {}
+    results['config'] = best_of(lambda: Configuration.load(directory, 'config.json'), repeat)
+    config = Configuration.load(directory, 'config.json')
+
+    def load_variables():
+        manager = VariableManager(
+            config.variable_paths, directory, environment=RenderEnvironment(directory)
+        )
+        dict(manager.variables)
+        return manager
+
+    results['variables'] = best_of(load_variables, repeat)
+    variable_manager = load_variables()
+
+    def render():
+        # A new environment each time, with the variables already evaluated
+        return TemplateManager(
+            variable_manager, config.template_paths, directory,
+            environment=RenderEnvironment(directory)
+        )
+
+    results['render'] = best_of(render, repeat)
+    template_manager = render()
+
+    results['merge'] = best_of(template_manager.merge_template_data, repeat)
+    manifest = template_manager.merge_template_data()
+
+    for backend in ('json', 'orjson'):
+        try:
+            json_encoder(backend)
+        except BuildException:
+            continue
+        results['serialize_%s' % backend] = best_of(
+            lambda backend=backend: dump_manifest(manifest, backend), repeat
+        )
+    return results
+
+
+def parse_arguments(args):
+    parser = ArgumentParser(description='Time each phase of compiling a synthetic project.')
+    parser.add_argument('--templates', type=int, default=50)
+    parser.add_argument('--variable-blocks', type=int, default=500)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--list-length', type=int, default=20)
+    parser.add_argument('--fan-out', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--write-baseline', metavar='FILE',
+                        help='Write the sizes and results to a JSON baseline file.')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Compare the results to a JSON baseline file.')
+    return parser.parse_args(args)
+
+
+def compare(results, baseline):
+    """Print each phase's ratio to the baseline, returning 1 if any regressed
+    """
+    regressed = False
+    print('%-18s %12s %12s %8s' % ('phase', 'baseline (s)', 'now (s)', 'ratio'))
+    for phase, seconds in results.items():
+        before = baseline['results'].get(phase)
+        if not before:
+            print('%-18s %12s %12.4f' % (phase, '-', seconds))
+            continue
+        ratio = seconds / before
+        marker = '  REGRESSED' if ratio > REGRESSION_THRESHOLD else ''
+        regressed = regressed or bool(marker)
+        print('%-18s %12.4f %12.4f %7.2fx%s' % (phase, before, seconds, ratio, marker))
+    return 1 if regressed else 0
+
+
+def main():
+    options = parse_arguments(sys.argv[1:])
+    sizes = {
+        'templates': options.templates,
+        'variable_blocks': options.variable_blocks,
+        'depth': options.depth,
+        'list_length': options.list_length,
+        'fan_out': options.fan_out
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        generate_project(directory, **sizes)
+        results = time_phases(directory, options.repeat)
+
+    if options.compare:
+        with open(options.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['sizes'] != sizes:
+            print('Warning: the baseline was recorded with sizes %s' % baseline['sizes'])
+        exit_code = compare(results, baseline)
+    else:
+        for phase, seconds in results.items():
+            print('%-18s %10.4f s' % (phase, seconds))
+        exit_code = 0
+
+    if options.write_baseline:
+        with open(options.write_baseline, 'w') as baseline_file:
+            json.dump({
+                'python': platform.python_version(),
+                'sizes': sizes,
+                'results': {phase: round(seconds, 6) for phase, seconds in results.items()}
+            }, baseline_file, indent=4, sort_keys=True)
+            baseline_file.write('\n')
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
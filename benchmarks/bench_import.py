@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Check the import time of the `pacyam` entry point against a budget.
+
+Runs `python -X importtime -c "import pacyam.cli"` in new interpreters and
+takes the best cumulative time of the entry point module, which is what
+`pacyam --help`, `--version` and argument errors pay for. The full compile
+stack (`pacyam.pacyam`, with Jinja and PyYAML) is reported for comparison.
+Exits with status 1 when the entry point goes over --budget milliseconds,
+listing the slowest modules it imported.
+
+    $ python benchmarks/bench_import.py --budget 50
+"""
+
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds `import pacyam.cli` may take
+DEFAULT_BUDGET = 50
+
+
+def import_times(module):
+    """(module, cumulative microseconds) for everything importing `module` loaded
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        cwd=ROOT, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, check=True
+    )
+    times = []
+    for line in result.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(cumulative)))
+    return times
+
+
+def best_import_time(module, repeat):
+    """Best cumulative import time of `module` in ms, and that run's slowest imports
+    """
+    runs = [import_times(module) for _ in range(repeat)]
+    best = min(runs, key=lambda times: dict(times)[module])
+    return dict(best)[module] / 1000, sorted(best, key=lambda item: -item[1])
+
+
+def main():
+    parser = ArgumentParser(description='Check the import time of the pacyam entry point.')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='Milliseconds importing pacyam.cli may take.')
+    parser.add_argument('--repeat', type=int, default=10)
+    options = parser.parse_args()
+
+    entry_point, slowest = best_import_time('pacyam.cli', options.repeat)
+    full, _ = best_import_time('pacyam.pacyam', options.repeat)
+    print('%-16s %8.1f ms (budget %.1f ms)' % ('pacyam.cli', entry_point, options.budget))
+    print('%-16s %8.1f ms' % ('pacyam.pacyam', full))
+
+    if entry_point > options.budget:
+        print('\nOver budget. Slowest imports:')
+        for name, cumulative in slowest[1:11]:
+            print('%-40s %8.1f ms' % (name, cumulative / 1000))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
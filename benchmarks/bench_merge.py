@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Compare the iterative, non-mutating merge engine against the previous
+recursive implementation, on manifests with thousands of provisioners.
+
+merge_dicts folds templates together two at a time, while merge_all (used by
+TemplateManager.merge_template_data) merges every template in a single pass.
+
+The previous implementation mutated its arguments, so callers merging the
+same templates more than once had to deep-copy them first; both the bare and
+the deep-copying variant are timed.
+
+    $ python benchmarks/bench_merge.py
+"""
+
+from copy import deepcopy
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from pacyam.pacyam import merge_all, merge_dicts
+
+TEMPLATE_COUNTS = [10, 50]
+PROVISIONERS_PER_TEMPLATE = [100, 500]
+REPEAT = 5
+
+
+def legacy_merge_dicts(source, destination):
+    """The recursive, mutating merge_dicts this engine replaced
+    """
+    for key, value in source.items():
+        if isinstance(value, dict):
+            node = destination.setdefault(key, {})
+            legacy_merge_dicts(value, node)
+        elif isinstance(value, list):
+            if key in destination:
+                destination[key].extend(value)
+            else:
+                destination[key] = value
+        else:
+            destination[key] = value
+    return destination
+
+
+def build_templates(template_count, provisioner_count):
+    """Rendered templates, each with one builder and many provisioners
+    """
+    templates = []
+    for index in range(template_count):
+        templates.append({
+            'variables': {'name_%d' % index: 'value', 'shared': {'nested': {'key': index}}},
+            'builders': [{'type': 'qemu', 'name': 'builder-%d' % index, 'disk_size': 1024}],
+            'provisioners': [
+                {
+                    'type': 'shell',
+                    'inline': ['echo %d' % line for line in range(5)],
+                    'environment_vars': {'INDEX': str(entry)}
+                }
+                for entry in range(provisioner_count)
+            ]
+        })
+    return templates
+
+
+def fold(merge, templates):
+    template = {}
+    for cur_template in reversed(templates):
+        template = merge(cur_template, template)
+    return template
+
+
+def best_of(function, setup='pass'):
+    return min(timeit.Timer(function, setup).repeat(repeat=REPEAT, number=1))
+
+
+def main():
+    print('%10s %13s %11s %16s %17s %14s' % (
+        'templates', 'provisioners', 'legacy (s)', 'legacy+copy (s)', 'merge_dicts (s)',
+        'merge_all (s)'
+    ))
+    for template_count in TEMPLATE_COUNTS:
+        for provisioner_count in PROVISIONERS_PER_TEMPLATE:
+            templates = build_templates(template_count, provisioner_count)
+            # The legacy merge consumes its input, so each run gets fresh templates
+            fresh = {}
+            legacy = best_of(
+                lambda: fold(legacy_merge_dicts, fresh['templates']),
+                setup=lambda: fresh.update(
+                    templates=build_templates(template_count, provisioner_count)
+                )
+            )
+            legacy_copy = best_of(lambda: fold(legacy_merge_dicts, deepcopy(templates)))
+            pairwise = best_of(lambda: fold(merge_dicts, templates))
+            single_pass = best_of(lambda: merge_all(list(reversed(templates))))
+            print('%10d %13d %11.4f %16.4f %17.4f %14.4f' % (
+                template_count, template_count * provisioner_count,
+                legacy, legacy_copy, pairwise, single_pass
+            ))
+
+
+if __name__ == '__main__':
+    main()
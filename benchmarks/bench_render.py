@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Measure how rendering templates scales with the render pool's workers.
+
+Generates the synthetic project of `bench_compile.py`, evaluates its
+variables once, then times TemplateManager rendering and parsing every
+template (best of --repeat runs, each with a new RenderEnvironment) for each
+pool and worker count:
+
+    $ python benchmarks/bench_render.py --templates 60 --workers 1 2 4 8
+"""
+
+from argparse import ArgumentParser
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from bench_compile import best_of, generate_project
+from pacyam.environment import RenderEnvironment
+from pacyam.pacyam import Configuration, TemplateManager, VariableManager
+
+
+def time_render(directory, pool, workers, repeat):
+    """Best time in seconds to render every template of the project
+    """
+    config = Configuration.load(directory, 'config.json')
+    variable_manager = VariableManager(
+        config.variable_paths, directory, environment=RenderEnvironment(directory)
+    )
+    dict(variable_manager.variables)
+
+    def render():
+        return TemplateManager(
+            variable_manager, config.template_paths, directory,
+            environment=RenderEnvironment(directory), workers=workers, pool=pool
+        )
+
+    return best_of(render, repeat)
+
+
+def main():
+    parser = ArgumentParser(description='Time rendering templates with each render pool size.')
+    parser.add_argument('--templates', type=int, default=60)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--list-length', type=int, default=50)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--pools', nargs='+', default=['thread', 'process'],
+                        choices=['thread', 'process'])
+    parser.add_argument('--repeat', type=int, default=3)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate_project(
+            directory, templates=options.templates, depth=options.depth,
+            list_length=options.list_length
+        )
+        serial = time_render(directory, 'thread', 1, options.repeat)
+        print('%-8s %8s %10s %8s' % ('pool', 'workers', 'render (s)', 'speedup'))
+        print('%-8s %8d %10.4f %7.2fx' % ('serial', 1, serial, 1))
+        for pool in options.pools:
+            for workers in options.workers:
+                if workers <= 1:
+                    continue
+                seconds = time_render(directory, pool, workers, options.repeat)
+                print('%-8s %8d %10.4f %7.2fx' % (pool, workers, seconds, serial / seconds))
+
+
+if __name__ == '__main__':
+    main()
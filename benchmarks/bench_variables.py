@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Measure how variable loading scales with the number of top-level blocks.
+
+Compares the previous per-block loader (a fresh Jinja environment, render and
+YAML parse for every block, against everything loaded so far) with
+VariableManager, both with a new RenderEnvironment and with a long-lived one
+that has already parsed the file and compiled its blocks. Variables are
+evaluated lazily, so these columns look up every variable; the last one looks
+up only ten, like a template using a few of many shared variables would.
+
+    $ python benchmarks/bench_variables.py
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+from jinja2 import BaseLoader, Environment
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from pacyam.environment import RenderEnvironment
+from pacyam.pacyam import VariableManager, merge_dicts
+
+BLOCK_COUNTS = [10, 100, 500, 1000, 2000]
+REPEAT = 5
+
+
+def legacy_block_to_dict(block_list, variables):
+    jinja_env = Environment(loader=BaseLoader, trim_blocks=True, lstrip_blocks=True)
+    var_template = jinja_env.from_string("\n".join(block_list))
+    new_data = yaml.safe_load(var_template.render(**variables))
+    return new_data if new_data else {}
+
+
+def legacy_load(full_path):
+    """The previous VariableManager._get_variables_from_file
+    """
+    with open(full_path, 'r') as variable_file:
+        yaml_data = {}
+        block = []
+        for line in variable_file.readlines():
+            if line.isspace() or line.startswith('#'):
+                continue
+            if line.startswith(' '):
+                block.append(line)
+            else:
+                yaml_data = merge_dicts(yaml_data, legacy_block_to_dict(block, yaml_data))
+                block = [line]
+        if block:
+            yaml_data = merge_dicts(yaml_data, legacy_block_to_dict(block, yaml_data))
+    return yaml_data
+
+
+def write_variable_file(directory, block_count):
+    """Write a variable file with `block_count` top-level keys
+    """
+    path = os.path.join(directory, 'variables-%d.yaml' % block_count)
+    with open(path, 'w') as variable_file:
+        variable_file.write('base: value\n')
+        for index in range(block_count):
+            variable_file.write('key_%d: "{{ base }}-%d"\n' % (index, index))
+    return os.path.basename(path)
+
+
+def best_of(function):
+    return min(timeit.Timer(function).repeat(repeat=REPEAT, number=1))
+
+
+def load_all(file_name, directory, environment=None):
+    manager = VariableManager([file_name], directory, environment=environment)
+    return dict(manager.variables)
+
+
+def load_some(file_name, directory):
+    manager = VariableManager([file_name], directory)
+    return [manager.variables['key_%d' % index] for index in range(10)]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        print('%8s %14s %14s %14s %14s' % (
+            'blocks', 'per-block (s)', 'cold env (s)', 'warm env (s)', '10 used (s)'
+        ))
+        for block_count in BLOCK_COUNTS:
+            file_name = write_variable_file(directory, block_count)
+            legacy = best_of(lambda: legacy_load(os.path.join(directory, file_name)))
+            cold = best_of(lambda: load_all(file_name, directory))
+            # A long-lived environment that has already seen this file
+            environment = RenderEnvironment(directory)
+            warm = best_of(
+                lambda: load_all(file_name, directory, environment=environment)
+            )
+            lazy = best_of(lambda: load_some(file_name, directory))
+            print('%8d %14.4f %14.4f %14.4f %14.4f' % (block_count, legacy, cold, warm, lazy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""
+Compile multi-environment Packer manifests from YAML templates and variables.
+
+`Compiler` and `compile_project` (see `pacyam.api`) are imported on first
+access, so that `import pacyam` stays cheap for the command line.
+"""
+
+# Provided by __getattr__ below, which pylint cannot see
+__all__ = ['Compiler', 'compile_project']  # pylint: disable=undefined-all-variable
+
+
+def __getattr__(name):
+    if name in __all__:
+        from pacyam import api  # pylint: disable=import-outside-toplevel
+        return getattr(api, name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,96 @@
+"""
+In-process API for compiling projects into Packer manifests.
+
+    from pacyam import Compiler, compile_project
+
+    manifest = compile_project('images/ubuntu', overrides={'version': '2.0'})
+
+    compiler = Compiler()
+    for root in roots:
+        manifests[root] = compiler.compile(root)
+
+Compiling never prints, exits, or writes files; errors are raised as
+BuildExceptions. A Compiler keeps one RenderEnvironment per project root, so
+later compiles reuse parsed variable files and compiled templates until the
+files behind them are modified. Variable files are parsed once for all
+projects using them. With a `cache_dir`, compiled templates are also kept on
+disk, for later processes to reuse, along with the digests of files hashed
+with `file_hash`.
+"""
+
+from pacyam.cache import CacheDirectory
+from pacyam.hashing import FileHasher
+from pacyam.environment import RenderEnvironment
+from pacyam.pacyam import Configuration, TemplateManager, VariableManager
+
+
+class Compiler:
+    """Compiles projects, keeping their environments between calls
+
+    With `share_renders`, a template rendered with the same files and variable
+    values as before, such as one shared between projects through a relative
+    path, is not rendered again. Manifests then share structure with each other
+    and must not be modified.
+    """
+
+    def __init__(self, share_renders=False, cache_dir=None):
+        self.environments = {}
+        self.variable_files = {}
+        self.render_cache = {} if share_renders else None
+        self.bytecode_cache = None
+        self.file_hasher = FileHasher(CacheDirectory(cache_dir) if cache_dir else None)
+        if cache_dir:
+            # pylint: disable=import-outside-toplevel
+            from pacyam.bytecode import TemplateBytecodeCache
+            self.bytecode_cache = TemplateBytecodeCache(cache_dir)
+
+    def environment(self, root_directory):
+        """The long-lived RenderEnvironment for a project root
+        """
+        if root_directory not in self.environments:
+            self.environments[root_directory] = RenderEnvironment(
+                root_directory,
+                variable_files=self.variable_files,
+                bytecode_cache=self.bytecode_cache,
+                file_hasher=self.file_hasher
+            )
+        return self.environments[root_directory]
+
+    def compile(self, root_directory, config='config.json', variables=None, overrides=None):
+        """Compile the project in `root_directory` into a manifest dictionary
+
+        `config` is the path of the config file within the project. `variables`
+        lists variable files loaded after the ones in the config, and `overrides`
+        takes precedence over every file, either as a mapping of values or as a
+        list of "name=value" strings like `--var`.
+        """
+        configuration = Configuration.load(root_directory, config)
+        return self.compile_configuration(configuration, variables, overrides)
+
+    def compile_configuration(self, configuration, variables=None, overrides=None):
+        """Compile an already loaded Configuration, see `compile`
+        """
+        root = configuration.root_directory
+        variable_manager = VariableManager(
+            variable_paths=list(configuration.variable_paths) + list(variables or []),
+            variable_root=root,
+            global_variables=overrides,
+            environment=self.environment(root)
+        )
+        template_manager = TemplateManager(
+            variable_manager=variable_manager,
+            template_paths=configuration.template_paths,
+            template_root=root,
+            render_cache=self.render_cache
+        )
+        manifest = template_manager.merge_template_data()
+        if self.bytecode_cache:
+            self.bytecode_cache.flush()
+        self.file_hasher.flush()
+        return manifest
+
+
+def compile_project(root_directory, config='config.json', variables=None, overrides=None):
+    """Compile one project into a manifest dictionary, see `Compiler.compile`
+    """
+    return Compiler().compile(root_directory, config, variables, overrides)
@@ -0,0 +1,114 @@
+"""
+Compiled Jinja templates kept on disk between runs.
+
+Jinja compiles every template file and templated variable block to Python
+code before rendering it, which dominates cold compiles of projects with
+large, macro-heavy templates. With a cache directory, the compiled code is
+stored in its "bytecode" namespace, keyed by the template's name, file and
+source checksum, so a template is only compiled again after it is edited.
+Entries for old sources are never read again, and are evicted with the
+rest of the directory's least recently used entries.
+
+The static analysis of template files (the variables they look up, the
+templates they include and the files they hash) is kept alongside, in the
+"analysis" namespace, so warm compiles in a new process skip parsing the
+templates for it.
+"""
+
+import json
+
+from jinja2 import __version__ as jinja_version
+from jinja2.bccache import Bucket, BytecodeCache
+
+from pacyam.cache import DEFAULT_CACHE_SIZE, CacheDirectory, hash_inputs
+from pacyam.version import __version__
+
+NAMESPACE = 'bytecode'
+ANALYSIS_NAMESPACE = 'analysis'
+
+
+class TemplateBytecodeCache(BytecodeCache):
+    """Jinja bytecode cache storing entries in a CacheDirectory
+
+    Eviction runs once per `flush()` rather than after every entry written,
+    since a cold compile writes an entry for each template and variable block.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        self.cache = CacheDirectory(directory, max_size)
+        self.written = False
+
+    def get_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        key = hash_inputs(jinja_version, name, filename, checksum)
+        bucket = Bucket(environment, key, checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket):
+        data = self.cache.read(NAMESPACE, bucket.key)
+        if data is not None:
+            bucket.bytecode_from_string(data)
+
+    def dump_bytecode(self, bucket):
+        self.cache.write(NAMESPACE, bucket.key, bucket.bytecode_to_string(), evict=False)
+        self.written = True
+
+    def compile(self, environment, source, name=None):
+        """Compile a template from source, such as a variable block, through the cache
+        """
+        bucket = self.get_bucket(environment, name, None, source)
+        if bucket.code is None:
+            bucket.code = environment.compile(source, name)
+            self.set_bucket(bucket)
+        return environment.template_class.from_code(
+            environment, bucket.code, environment.make_globals(None)
+        )
+
+    def _analysis_key(self, root_directory, filename, source):
+        # Files hashed are resolved against the root, so it is part of the key
+        return hash_inputs(
+            __version__, jinja_version, root_directory, filename,
+            self.get_source_checksum(source)
+        )
+
+    def load_analysis(self, root_directory, filename, source):
+        """Return the (variables, included, hashed) analysis stored for a
+        template's source, or None
+        """
+        data = self.cache.read(
+            ANALYSIS_NAMESPACE, self._analysis_key(root_directory, filename, source)
+        )
+        if data is None:
+            return None
+        try:
+            variables, included, hashed = json.loads(data.decode('utf-8'))
+        except ValueError:
+            return None
+        return (
+            set(variables),
+            None if included is None else set(included),
+            None if hashed is None else [tuple(request) for request in hashed]
+        )
+
+    def dump_analysis(self, root_directory, filename, source, analysis):
+        """Store the (variables, included, hashed) analysis of a template's source
+        """
+        variables, included, hashed = analysis
+        data = json.dumps([
+            sorted(variables),
+            None if included is None else sorted(included),
+            hashed
+        ])
+        self.cache.write(
+            ANALYSIS_NAMESPACE, self._analysis_key(root_directory, filename, source),
+            data.encode('utf-8'), evict=False
+        )
+        self.written = True
+
+    def flush(self):
+        """Evict old entries if any were written since the last flush
+        """
+        if self.written:
+            self.written = False
+            self.cache.evict()
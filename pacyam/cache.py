@@ -0,0 +1,236 @@
+"""
+Content-addressed, size-bounded caches kept on disk between runs.
+
+`tempfile` is only imported when an entry is written, so the CLI can read the
+defaults here without paying for it.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+# Default upper bound for a cache directory, in bytes
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# Read files in 1MB chunks when hashing
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def user_cache_dir():
+    """Per-user cache location, following the XDG base directory spec
+    """
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pacyam')
+
+
+def hash_bytes(data):
+    """SHA-256 hex digest of a bytes or str object
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    """SHA-256 hex digest of a file's content, or None if it does not exist
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as hashed_file:
+            for chunk in iter(lambda: hashed_file.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+    return digest.hexdigest()
+
+
+def hash_inputs(*parts):
+    """Combine several JSON serializable parts into one stable key
+    """
+    return hash_bytes(json.dumps(parts, sort_keys=True))
+
+
+class CacheDirectory:
+    """A directory of cache entries with least-recently-used, size-based eviction
+
+    A directory that cannot be read or written, such as under a read-only home,
+    behaves like an empty cache that keeps nothing.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def entry_path(self, namespace, key):
+        """Location of an entry, fanned out over sub-directories by key prefix
+        """
+        return os.path.join(self.directory, namespace, key[:2], key)
+
+    def read(self, namespace, key):
+        """Return an entry's bytes, or None when it is not cached
+        """
+        path = self.entry_path(namespace, key)
+        try:
+            with open(path, 'rb') as entry:
+                data = entry.read()
+            # Mark as recently used for eviction
+            os.utime(path, None)
+        except OSError:
+            return None
+        return data
+
+    def write(self, namespace, key, data, evict=True):
+        """Atomically store an entry, then evict old entries if over the size limit
+        """
+        from tempfile import NamedTemporaryFile  # pylint: disable=import-outside-toplevel
+        path = self.entry_path(namespace, key)
+        entry = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as entry:
+                entry.write(data)
+            os.replace(entry.name, path)
+        except OSError:
+            if entry is not None and os.path.exists(entry.name):
+                os.unlink(entry.name)
+            return
+        if evict:
+            self.evict()
+
+    def entries(self):
+        """List (mtime, size, path) for every entry in the cache
+        """
+        found = []
+        for directory, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, path))
+        return found
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_size
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class ManifestCache(CacheDirectory):
+    """Caches merged manifests keyed by the content of every input file
+
+    The key is computed in two steps. The config, variable files, template files,
+    overrides and pacyam version make up the base key. Files pulled in while
+    rendering (such as through `include_file`) are only known after a compile, so
+    they are recorded in an index under the base key and hashed into the final key.
+    These include files hashed with `file_hash`, such as ISOs, so their digests
+    are kept by path, size, modification time and inode, see `pacyam.hashing`.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE, version=''):
+        super().__init__(directory, max_size)
+        self.version = version
+        self.file_hasher = None
+
+    def base_key(self, config, overrides):
+        """Key over everything known before rendering
+        """
+        root = config.root_directory
+        files = [config.config_file_path]
+        files += [os.path.join(root, path) for path in config.variable_paths]
+        files += [os.path.join(root, path) for path in config.template_paths]
+        return hash_inputs(
+            self.version,
+            overrides or [],
+            [(path, hash_file(path)) for path in files]
+        )
+
+    def _hash_dependency(self, path):
+        if self.file_hasher is None:
+            from pacyam.hashing import FileHasher  # pylint: disable=import-outside-toplevel
+            self.file_hasher = FileHasher(self)
+        try:
+            return self.file_hasher.hash(path)
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def manifest_key(self, base_key, dependencies):
+        return hash_inputs(
+            base_key,
+            [(path, self._hash_dependency(path)) for path in sorted(dependencies)]
+        )
+
+    def lookup(self, config, overrides):
+        """Return the cached manifest for this configuration, or None
+        """
+        base_key = self.base_key(config, overrides)
+        index = self.read('index', base_key)
+        if index is None:
+            return None
+        dependencies = json.loads(index.decode('utf-8'))
+        data = self.read('manifests', self.manifest_key(base_key, dependencies))
+        if self.file_hasher is not None:
+            self.file_hasher.flush()
+        if data is None:
+            return None
+        return json.loads(data.decode('utf-8'))
+
+    def store(self, config, overrides, manifest, dependencies):
+        """Save a compiled manifest along with the files it was rendered from
+        """
+        base_key = self.base_key(config, overrides)
+        dependencies = sorted(set(dependencies))
+        self.write('manifests', self.manifest_key(base_key, dependencies),
+                   json.dumps(manifest).encode('utf-8'))
+        self.write('index', base_key, json.dumps(dependencies).encode('utf-8'))
+
+
+class ValidationCache(CacheDirectory):
+    """Remembers successful `packer validate` results by manifest content, Packer
+    install and working directory, against which Packer resolves relative paths
+
+    The Packer install is identified by the resolved binary's path, size and
+    modification time along with PACKER_PLUGIN_PATH, which change whenever Packer
+    or its plugin location does, without spawning `packer version` to find out.
+    """
+
+    @staticmethod
+    def packer_identity(packer='packer'):
+        path = shutil.which(packer)
+        if not path:
+            return None
+        stat = os.stat(path)
+        return [os.path.realpath(path), stat.st_size, stat.st_mtime_ns,
+                os.getenv('PACKER_PLUGIN_PATH')]
+
+    def key(self, manifest_file):
+        """Key for validating this manifest with the current Packer, or None
+        """
+        identity = self.packer_identity()
+        if identity is None:
+            return None
+        return hash_inputs(hash_file(manifest_file), identity, os.getcwd())
+
+    def lookup(self, key):
+        """Return the stored (returncode, stdout, stderr) for a key, or None
+        """
+        data = self.read('validation', key)
+        if data is None:
+            return None
+        result = json.loads(data.decode('utf-8'))
+        return result['returncode'], result['stdout'], result['stderr']
+
+    def store(self, key, returncode, stdout, stderr):
+        data = {'returncode': returncode, 'stdout': stdout, 'stderr': stderr}
+        self.write('validation', key, json.dumps(data).encode('utf-8'))
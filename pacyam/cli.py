@@ -0,0 +1,307 @@
+"""
+Command line entry point.
+
+Only what parsing the arguments needs is imported here. Jinja, PyYAML and
+the rest of pacyam are imported once the arguments are valid, so `--help`,
+`--version` and usage errors return without loading them.
+"""
+
+from argparse import ArgumentParser
+import os
+import sys
+
+from pacyam import profiling
+from pacyam.cache import DEFAULT_CACHE_SIZE
+from pacyam.codec import DEFAULT_JSON_BACKEND, JSON_BACKENDS
+from pacyam.daemon import default_socket_path
+from pacyam.version import __version__
+
+
+def parse_arguments(args):
+    """
+    Creates the Argument Parser for running from the
+    command line, and returns the parsed args
+    """
+    parser = ArgumentParser(
+        description='Validate & build Packer images from template files.'
+    )
+    parser.add_argument(
+        'directory',
+        metavar='directory',
+        help='The top level directory containing the templates.'
+    )
+    parser.add_argument(
+        '--config', '-c',
+        dest='config_path',
+        default=os.getenv('CONFIG', 'config.json'),
+        help='The path to the configuration file, if not in "directory".'
+    )
+    parser.add_argument(
+        '--var', '-v',
+        dest='vars',
+        action='append',
+        help='Overwrite template variables with "-v name=value".'
+             'Defined template variables may be used.'
+    )
+    parser.add_argument(
+        '--out', '-o',
+        dest='out_file',
+        default=None,
+        help='Output the Packer manifest to a file.'
+    )
+    parser.add_argument(
+        '--skip', '-s',
+        dest='skip_build',
+        action='store_true',
+        help='Skip actually building the image using Packer.'
+    )
+    parser.add_argument(
+        '--dry-run', '-d',
+        dest='dry_run',
+        action='store_true',
+        help='Output the compiled manifest to the console, don\'t actually run anything.'
+    )
+    parser.add_argument(
+        '--build-type',
+        dest='build_type',
+        default="",
+        type=str,
+        help='Run a specific builder from the compiled manifest'
+    )
+    parser.add_argument(
+        '--json-backend',
+        dest='json_backend',
+        default=DEFAULT_JSON_BACKEND,
+        choices=JSON_BACKENDS,
+        help='Library used to write the manifest. "orjson" is faster but indents by 2, '
+             '"auto" uses it when installed.'
+    )
+    parser.add_argument(
+        '--parallel', '-p',
+        dest='parallel',
+        default=0,
+        type=int,
+        metavar='N',
+        help='Build each builder in its own Packer process, running at most N at once.'
+    )
+    parser.add_argument(
+        '--render-workers',
+        dest='render_workers',
+        default=1,
+        type=int,
+        metavar='N',
+        help='Render and parse templates on N workers at once.'
+    )
+    parser.add_argument(
+        '--render-pool',
+        dest='render_pool',
+        default='thread',
+        choices=['thread', 'process'],
+        help='Render templates on threads, or on processes, which scale further '
+             'for projects with many large templates but take longer to start.'
+    )
+    parser.add_argument(
+        '--incremental',
+        dest='incremental',
+        action='store_true',
+        help='Only build the builders whose manifest sections or local files changed since '
+             'their last successful build, recorded in the project\'s ".pacyam-ledger.json".'
+    )
+    parser.add_argument(
+        '--keep-output',
+        dest='keep_output',
+        action='store_true',
+        help='Leave the builders\' output directories in place after running.'
+    )
+    parser.add_argument(
+        '--matrix', '-m',
+        dest='matrix',
+        nargs='?',
+        const='',
+        default=None,
+        metavar='FILE',
+        help='Only compile, writing one manifest per combination of the "matrix" key in the '
+             'config file, or of the combinations listed in this JSON/YAML file.'
+    )
+    parser.add_argument(
+        '--all',
+        dest='all_projects',
+        action='store_true',
+        help='Compile every project with a config file under "directory", writing '
+             'one manifest each to --out (default "{project}/manifest.json").'
+    )
+    parser.add_argument(
+        '--workers', '-j',
+        dest='workers',
+        default=None,
+        type=int,
+        help='Number of processes used to compile matrix combinations or --all projects.'
+    )
+    parser.add_argument(
+        '--skip-schema',
+        dest='skip_schema',
+        action='store_true',
+        help='Skip checking the manifest against the bundled schema before running Packer.'
+    )
+    parser.add_argument(
+        '--force-validate',
+        dest='force_validate',
+        action='store_true',
+        help='Always run `packer validate`, even for a manifest validated before.'
+    )
+    parser.add_argument(
+        '--timeout',
+        dest='timeout',
+        default=None,
+        type=float,
+        help='Stop `packer validate` and `packer build` after this many seconds.'
+    )
+    parser.add_argument(
+        '--watch', '-w',
+        dest='watch',
+        action='store_true',
+        help='Recompile whenever a file the manifest depends on changes.'
+    )
+    parser.add_argument(
+        '--watch-interval',
+        dest='watch_interval',
+        default=0.5,
+        type=float,
+        help='Seconds between checks for changed files in watch mode.'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        dest='cache_dir',
+        default=os.getenv('PACYAM_CACHE_DIR'),
+        help='Reuse compiled manifests and templates from this directory, such as '
+             '".pacyam-cache". Defaults to the "cache_dir" in the config file.'
+    )
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+        type=int,
+        help='Maximum size of the cache directory in megabytes.'
+    )
+    parser.add_argument(
+        '--depfile',
+        dest='depfile',
+        default=None,
+        metavar='PATH',
+        help='Write the files the manifest was built from to PATH as a Make/Ninja depfile, '
+             'for the --out target.'
+    )
+    parser.add_argument(
+        '--unused-variables',
+        dest='unused_variables',
+        action='store_true',
+        help='List the variables defined in variable files that no template uses.'
+    )
+    parser.add_argument(
+        '--daemon',
+        dest='daemon_socket',
+        nargs='?',
+        const=default_socket_path(),
+        default=os.getenv('PACYAM_DAEMON_SOCKET'),
+        metavar='SOCKET',
+        help='Compile through a running `pacyam serve`, or in this process when there is none.'
+    )
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        nargs='?',
+        const='pacyam-profile.json',
+        default=None,
+        metavar='TRACE_FILE',
+        help='Print the time spent in each phase and file, and write a Chrome trace '
+             '(default "pacyam-profile.json").'
+    )
+    parser.add_argument(
+        '--profile-memory',
+        dest='profile_memory',
+        action='store_true',
+        help='Also trace memory use while profiling. Slows down compiling.'
+    )
+    parser.add_argument(
+        '--version',
+        action='version',
+        help='Show the current version of PyYam installed.',
+        version='%(prog)s {version}'.format(version=__version__)
+    )
+
+    return parser.parse_args(args)
+
+
+def report_profile(trace_file):
+    """Print the profile summary and write the Chrome trace
+    """
+    profiler = profiling.disable()
+    print('-' * 80)
+    for line in profiler.summary():
+        print(line)
+    profiler.write_trace(trace_file)
+    print('Trace written to %s' % trace_file)
+
+
+def run_project(command_line_args):
+    """Compile the project in the directory given, returning the exit code
+    """
+    # pylint: disable=import-outside-toplevel
+    from pacyam.pacyam import Configuration, PackerTemplateMerger
+    from pacyam.trash import cleanup
+
+    with profiling.span('config', command_line_args.config_path):
+        configuration = Configuration.load(
+            root_directory=command_line_args.directory,
+            config_file_name=command_line_args.config_path
+        )
+    if command_line_args.matrix is not None:
+        from pacyam.matrix import MatrixBuilder
+        MatrixBuilder(command_line_args, configuration).assemble_templates()
+        return 0
+    if command_line_args.watch:
+        from pacyam.watch import WatchingTemplateMerger
+        WatchingTemplateMerger(command_line_args, configuration).watch()
+        return 0
+    merger = PackerTemplateMerger(command_line_args, configuration)
+    try:
+        return merger.assemble_template()
+    finally:
+        # Only once Packer built, as it may have written to them
+        if merger.built and not command_line_args.keep_output:
+            cleanup(merger.output_directories(), configuration.root_directory)
+
+
+def main():
+    """Setup and run the merger after figuring out command line arguments
+    """
+    if sys.argv[1:2] == ['serve']:
+        # pylint: disable=import-outside-toplevel
+        from pacyam.daemon import serve_main
+        sys.exit(serve_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['gc']:
+        from pacyam.trash import gc_main  # pylint: disable=import-outside-toplevel
+        sys.exit(gc_main(sys.argv[2:]))
+
+    # Only for the command line, so programs using pacyam keep full tracebacks
+    sys.tracebacklimit = 1
+    command_line_args = parse_arguments(sys.argv[1:])
+    exit_code = 0
+    if command_line_args.profile:
+        profiling.enable(memory=command_line_args.profile_memory)
+    try:
+        if command_line_args.all_projects:
+            from pacyam.monorepo import MonorepoBuilder  # pylint: disable=import-outside-toplevel
+            exit_code = MonorepoBuilder(command_line_args).assemble_templates()
+        else:
+            exit_code = run_project(command_line_args)
+    except KeyboardInterrupt:
+        exit_code = 130
+    finally:
+        if command_line_args.profile:
+            report_profile(command_line_args.profile)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
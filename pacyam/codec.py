@@ -0,0 +1,76 @@
+"""
+YAML loading and manifest serialization, using the fastest available backends.
+
+YAML is parsed with libyaml's CSafeLoader when PyYAML was built with it,
+falling back to the pure Python SafeLoader otherwise. Manifests are encoded
+with the standard library `json` module by default, or with `orjson` when it
+is selected and installed. PyYAML and orjson are imported on first use.
+"""
+
+from functools import lru_cache
+import json
+import os
+
+from pacyam.errors import BuildException
+
+JSON_BACKENDS = ['json', 'orjson', 'auto']
+
+DEFAULT_JSON_BACKEND = os.getenv('PACYAM_JSON_BACKEND', 'json')
+
+
+@lru_cache(maxsize=None)
+def _yaml():
+    """PyYAML and its fastest safe loader, imported on first use
+    """
+    # pylint: disable=import-outside-toplevel
+    import yaml
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
+    return yaml, SafeLoader
+
+
+def safe_loader():
+    """The YAML loader class used by `load_yaml`
+    """
+    return _yaml()[1]
+
+
+def load_yaml(stream):
+    """Safely parse a YAML string or file, like `yaml.safe_load`
+    """
+    yaml, loader = _yaml()
+    return yaml.load(stream, Loader=loader)
+
+
+def _encode_json(manifest):
+    return json.dumps(manifest, sort_keys=True, indent=4).encode('utf-8')
+
+
+def _encode_orjson(manifest):
+    import orjson  # pylint: disable=import-outside-toplevel
+    option = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    return orjson.dumps(manifest, option=option)
+
+
+def json_encoder(backend=DEFAULT_JSON_BACKEND):
+    """Return the function encoding a manifest to bytes for a backend name
+    """
+    if backend not in JSON_BACKENDS:
+        raise BuildException('Unknown JSON backend "%s".' % backend)
+    if backend == 'json':
+        return _encode_json
+    try:
+        import orjson  # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        if backend == 'auto':
+            return _encode_json
+        raise BuildException('The "orjson" JSON backend requires `pip install orjson`.')
+    return _encode_orjson
+
+
+def dump_manifest(manifest, backend=DEFAULT_JSON_BACKEND):
+    """Serialize a manifest to JSON bytes, sorted and indented for reading
+    """
+    return json_encoder(backend)(manifest)
@@ -0,0 +1,247 @@
+"""
+Long-running compile server, and the client used by `pacyam --daemon`.
+
+`pacyam serve` listens on a Unix socket, compiling with one long-lived
+`pacyam.api.Compiler`, which keeps a RenderEnvironment per project in
+memory. Parsed variable files, template analysis and compiled templates
+are reused across requests, until the files behind them are
+modified (Jinja checks templates' modification times, and RenderEnvironment
+variable files' modification times and sizes).
+
+The protocol is one JSON request line from the client:
+
+    {"directory": "/abs/project", "config": "config.json", "vars": ["a=b"]}
+
+answered by one JSON header line, followed by the manifest itself:
+
+    {"ok": true, "length": 1234}\\n{...manifest...}
+    {"ok": false, "error": "Could not find the config file ..."}\\n
+
+The client only needs `json` and `socket`, and returns None when no server is
+running, so callers can compile in-process instead. `socket` is imported on
+first use, so the CLI can read the default socket path cheaply.
+
+The socket's directory must belong to the user and be closed to everyone
+else, or the server refuses to listen and the client to connect. Otherwise
+another user could create it first, and serve manifests whose provisioners
+would run as this one. Where the platform tells, the client also checks the
+server runs as the same user.
+"""
+
+from argparse import ArgumentParser
+import json
+import os
+import stat
+import struct
+
+from pacyam.errors import BuildException
+
+# Seconds between checks for a shutdown while waiting for requests
+ACCEPT_TIMEOUT = 0.5
+
+# Seconds a client may take to send its request before it is dropped
+REQUEST_TIMEOUT = 5
+
+
+def default_socket_path():
+    """Per-user socket location, in the runtime directory when there is one
+    """
+    runtime = os.getenv('XDG_RUNTIME_DIR')
+    if runtime and os.path.isdir(runtime):
+        return os.path.join(runtime, 'pacyam.sock')
+    return os.path.join('/tmp', 'pacyam-%d' % os.getuid(), 'pacyam.sock')
+
+
+def check_socket_directory(directory):
+    """Raise a BuildException unless the directory is owned by this user and
+    private to them
+    """
+    status = os.lstat(directory)
+    if not stat.S_ISDIR(status.st_mode):
+        raise BuildException('The socket directory "%s" is not a directory.' % directory)
+    if status.st_uid != os.getuid():
+        raise BuildException(
+            'The socket directory "%s" belongs to another user.' % directory
+        )
+    if status.st_mode & 0o077:
+        raise BuildException(
+            'The socket directory "%s" is open to other users, its mode must be 0700.'
+            % directory
+        )
+
+
+def _check_peer(connection):
+    """Raise a BuildException when the server runs as another user, where
+    the platform reports it
+    """
+    import socket  # pylint: disable=import-outside-toplevel
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')
+    )
+    _, uid, _ = struct.unpack('3i', credentials)
+    if uid != os.getuid():
+        raise BuildException('The server on the socket runs as another user.')
+
+
+def _read_response(stream):
+    header = json.loads(stream.readline().decode('utf-8'))
+    if not header['ok']:
+        raise BuildException(header['error'])
+    return stream.read(header['length'])
+
+
+def request_manifest(socket_path, directory, config_path='config.json', overrides=None):
+    """Ask the server on `socket_path` to compile a project
+
+    Returns the manifest as JSON bytes, or None when no server is listening.
+    Errors compiling the project, and a socket other users could have put
+    there, are raised as BuildExceptions.
+    """
+    import socket  # pylint: disable=import-outside-toplevel
+    try:
+        check_socket_directory(os.path.dirname(os.path.abspath(socket_path)))
+    except FileNotFoundError:
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            connection.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        _check_peer(connection)
+        request = {
+            'directory': os.path.abspath(directory),
+            'config': config_path,
+            'vars': list(overrides or [])
+        }
+        connection.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as stream:
+            return _read_response(stream)
+    finally:
+        connection.close()
+
+
+class CompileServer:
+    """Compiles projects on request, keeping their environments between requests
+    """
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.compiler = None
+        self.server = None
+        self.running = False
+
+    def compile(self, request):
+        """Compile one request into manifest JSON bytes
+        """
+        if self.compiler is None:
+            from pacyam.api import Compiler  # pylint: disable=import-outside-toplevel
+            self.compiler = Compiler()
+        manifest = self.compiler.compile(
+            request['directory'],
+            request.get('config', 'config.json'),
+            overrides=request.get('vars')
+        )
+        return json.dumps(manifest).encode('utf-8')
+
+    def respond(self, request_line):
+        """Header and body bytes answering one request line
+        """
+        try:
+            manifest = self.compile(json.loads(request_line.decode('utf-8')))
+        except Exception as error:  # pylint: disable=broad-except
+            header = {'ok': False, 'error': str(error)}
+            return json.dumps(header).encode('utf-8') + b'\n'
+        header = {'ok': True, 'length': len(manifest)}
+        return json.dumps(header).encode('utf-8') + b'\n' + manifest
+
+    def _bind(self):
+        import socket  # pylint: disable=import-outside-toplevel
+        directory = os.path.dirname(os.path.abspath(self.socket_path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        check_socket_directory(directory)
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except ConnectionRefusedError:
+                os.unlink(self.socket_path)  # Left behind by a server that died
+            else:
+                raise BuildException('A server is already listening on "%s".' % self.socket_path)
+            finally:
+                probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        listener.listen()
+        # Wake up regularly to notice shutdown()
+        listener.settimeout(ACCEPT_TIMEOUT)
+        return listener
+
+    def serve(self, ready=None):
+        """Answer requests one at a time until interrupted or `shutdown()`
+        """
+        import socket  # pylint: disable=import-outside-toplevel
+        self.server = self._bind()
+        self.running = True
+        if ready:
+            ready.set()
+        try:
+            while self.running:
+                try:
+                    connection, _ = self.server.accept()
+                except socket.timeout:
+                    continue
+                # An idle client must not hold up everyone else's requests
+                connection.settimeout(REQUEST_TIMEOUT)
+                with connection, connection.makefile('rb') as stream:
+                    try:
+                        request_line = stream.readline()
+                        if request_line:
+                            connection.sendall(self.respond(request_line))
+                    except OSError:  # Timed out, or the client went away
+                        continue
+        finally:
+            self._close()
+
+    def shutdown(self):
+        """Stop serving, from another thread
+        """
+        self.running = False
+
+    def _close(self):
+        self.running = False
+        if self.server is None:
+            return
+        self.server.close()
+        self.server = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def serve_main(args):
+    """Entry point for `pacyam serve`
+    """
+    parser = ArgumentParser(
+        prog='pacyam serve',
+        description='Keep compiled projects in memory, and compile them for `pacyam --daemon`.'
+    )
+    parser.add_argument(
+        '--socket',
+        dest='socket_path',
+        default=os.getenv('PACYAM_DAEMON_SOCKET') or default_socket_path(),
+        help='The Unix socket to listen on.'
+    )
+    options = parser.parse_args(args)
+    server = CompileServer(options.socket_path)
+    print('-- Listening on %s --' % options.socket_path)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    return 0
@@ -0,0 +1,38 @@
+"""
+Write the files a manifest was built from as a Make/Ninja depfile.
+
+    images/ubuntu.json: images/ubuntu/config.json \\
+      images/ubuntu/variables/default.yaml \\
+      images/ubuntu/builders/qemu.yaml
+
+Paths within the working directory are written relative to it, like the
+paths of a Makefile or build.ninja, and the others are written absolute.
+"""
+
+import os
+
+
+def escape(path):
+    """Escape a path for a depfile, as read by both Make and Ninja
+    """
+    return path.replace('\\', '\\\\').replace(' ', '\\ ').replace('#', '\\#').replace('$', '$$')
+
+
+def _display_path(path):
+    relative = os.path.relpath(os.path.abspath(path))
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        return os.path.abspath(path)
+    return relative
+
+
+def format_depfile(target, dependencies):
+    """Depfile text listing sorted, unique `dependencies` for `target`
+    """
+    paths = sorted({_display_path(path) for path in dependencies})
+    lines = ['%s:' % escape(target)] + ['  %s' % escape(path) for path in paths]
+    return ' \\\n'.join(lines) + '\n'
+
+
+def write_depfile(path, target, dependencies):
+    with open(path, 'w') as depfile:
+        depfile.write(format_depfile(target, dependencies))
@@ -0,0 +1,292 @@
+"""
+Jinja environments for rendering the templates and variable files of a project.
+
+A RenderEnvironment is shared by the variable and template managers of one
+project root. It loads templates through a ProjectLoader, which resolves
+paths against the root, and a TrackingEnvironment, which records the files
+behind the templates loaded so that callers know what a rendering read.
+"""
+
+from contextlib import contextmanager
+from functools import lru_cache
+import os
+import threading
+
+from jinja2 import BaseLoader, Environment, TemplateNotFound, meta, nodes
+
+from pacyam.errors import BuildException
+from pacyam.hashing import DEFAULT_ALGORITHM, FileHasher, check_algorithm, file_hash_calls
+from pacyam.resolver import parse_variables, referenced_templates
+
+# Number of compiled variable blocks kept by each RenderEnvironment
+BLOCK_CACHE_SIZE = 1024
+
+
+class TrackingEnvironment(Environment):
+    """Jinja environment that records the file behind every template it loads,
+    including those pulled in through `include` and `import`
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recorders = threading.local()
+
+    def get_template(self, name, parent=None, globals=None):  # pylint: disable=redefined-builtin
+        template = super().get_template(name, parent, globals)
+        for recorder in getattr(self.recorders, 'stack', []):
+            recorder.add(os.path.abspath(template.filename))
+        return template
+
+
+class ProjectLoader(BaseLoader):
+    """Loads templates by their path relative to the project root
+
+    Unlike Jinja's FileSystemLoader, paths may go up out of the root, such as
+    "../shared/builders/qemu.yaml", for files shared between projects.
+    """
+
+    def __init__(self, root_directory):
+        self.root_directory = root_directory
+
+    def filename(self, template):
+        return os.path.normpath(os.path.join(self.root_directory, *template.split('/')))
+
+    def get_source(self, environment, template):
+        filename = self.filename(template)
+        try:
+            with open(filename, 'r', encoding='utf-8') as template_file:
+                source = template_file.read()
+        except (FileNotFoundError, IsADirectoryError):
+            raise TemplateNotFound(template)
+        mtime = os.path.getmtime(filename)
+
+        def uptodate():
+            try:
+                return os.path.getmtime(filename) == mtime
+            except OSError:
+                return False
+        return source, filename, uptodate
+
+
+class RenderEnvironment:
+    """Long-lived Jinja environment shared by the variable and template managers
+
+    Variable blocks are compiled through an LRU cache keyed by their source
+    text, so repeated snippets are only ever compiled once. Parsed variable
+    files and the static analysis of templates are kept until the files are
+    modified, for managers loading them again. Environments of several projects
+    may share one `variable_files` dictionary, keyed by absolute path.
+
+    With a `bytecode_cache` (see `pacyam.bytecode`), compiled template files
+    and variable blocks, and the analysis of templates, are also kept on disk
+    between runs.
+
+    Templates and variables may call `file_hash(path, algorithm='sha256')`,
+    with paths relative to the root directory, see `pacyam.hashing`. Files
+    hashed are collected apart from templates loaded (see `track_hashed`),
+    as they are inputs of the manifest but not templates to parse.
+    """
+
+    def __init__(self, root_directory, block_cache_size=BLOCK_CACHE_SIZE, variable_files=None,
+                 bytecode_cache=None, file_hasher=None):
+        self.root_directory = root_directory
+        self.variable_files = {} if variable_files is None else variable_files
+        self.template_analysis = {}
+        self.bytecode_cache = bytecode_cache
+        self.file_hasher = file_hasher or FileHasher()
+        self.jinja_env = TrackingEnvironment(
+            loader=ProjectLoader(root_directory),
+            trim_blocks=True,
+            lstrip_blocks=True,
+            bytecode_cache=bytecode_cache
+        )
+        self.jinja_env.globals['file_hash'] = self.file_hash
+        self.compile_block = lru_cache(maxsize=block_cache_size)(self._compile_block)
+
+    def _compile_block(self, source):
+        if self.bytecode_cache is None:
+            return self.jinja_env.from_string(source)
+        return self.bytecode_cache.compile(self.jinja_env, source)
+
+    def load_variable_file(self, full_path):
+        """Parse a variable file into definitions, reusing them while it is unchanged
+        """
+        full_path = os.path.abspath(full_path)
+        stat = os.stat(full_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self.variable_files.get(full_path)
+        if cached and cached[0] == version:
+            return cached[1]
+        with open(full_path, 'r') as variable_file:
+            definitions = parse_variables(self, variable_file.read(), full_path)
+        self.variable_files[full_path] = (version, definitions)
+        return definitions
+
+    def hash_path(self, path):
+        """Location of a file given to `file_hash`
+        """
+        return os.path.normpath(os.path.join(self.root_directory, path))
+
+    def file_hash(self, path, algorithm=DEFAULT_ALGORITHM):
+        """Hex digest of a file relative to the root directory, for templates
+        """
+        check_algorithm(algorithm)
+        full_path = self.hash_path(path)
+        try:
+            digest = self.file_hasher.hash(full_path, algorithm)
+        except (FileNotFoundError, IsADirectoryError):
+            raise BuildException('file_hash: no file at "%s".' % full_path)
+        self.record_hashed([full_path])
+        return digest
+
+    def hash_requests(self, ast, variables=None):
+        """(path, algorithm) of the `file_hash` calls in a parsed template whose
+        arguments are constants, or variables from `variables`
+
+        Returns None if there is a call with any other arguments.
+        """
+        requests = []
+        for path, algorithm in file_hash_calls(ast):
+            if isinstance(path, nodes.Name) and variables is not None and path.name in variables:
+                value = variables[path.name]
+            elif isinstance(path, nodes.Const):
+                value = path.value
+            else:
+                return None
+            if algorithm is None:
+                algorithm = DEFAULT_ALGORITHM
+            elif isinstance(algorithm, nodes.Const):
+                algorithm = algorithm.value
+            else:
+                return None
+            if not isinstance(value, str):
+                return None
+            requests.append((self.hash_path(value), algorithm))
+        return requests
+
+    def get_template(self, path):
+        """Load a template file relative to the root directory
+        """
+        return self.jinja_env.get_template(path)
+
+    def _analyze_template(self, path):
+        """Return (filename, version, variables looked up, templates included,
+        files hashed) for one template file
+        """
+        filename = self.jinja_env.loader.filename(path)
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            raise TemplateNotFound(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self.template_analysis.get(filename)
+        if cached and cached[0] == version:
+            return (filename, version) + cached[1]
+        source, _, _ = self.jinja_env.loader.get_source(self.jinja_env, path)
+        analysis = None
+        if self.bytecode_cache is not None:
+            analysis = self.bytecode_cache.load_analysis(self.root_directory, filename, source)
+        if analysis is None:
+            ast = self.jinja_env.parse(source)
+            analysis = (
+                meta.find_undeclared_variables(ast),
+                referenced_templates(ast),
+                self.hash_requests(ast)
+            )
+            if self.bytecode_cache is not None:
+                self.bytecode_cache.dump_analysis(
+                    self.root_directory, filename, source, analysis
+                )
+        self.template_analysis[filename] = (version, analysis)
+        return (filename, version) + analysis
+
+    def template_inputs(self, path):
+        """Return (variable names, {filename: version}, files hashed) for a template
+        and every template it includes, or None when it includes one chosen at
+        render time
+
+        The files hashed are (path, algorithm) pairs, whose versions are among
+        the files, or None when a path is only known while rendering.
+        """
+        names = set()
+        files = {}
+        hashed = []
+        pending = [path]
+        visited = set()
+        while pending:
+            current = pending.pop()
+            if current in visited:
+                continue
+            visited.add(current)
+            filename, version, variables, included, requests = self._analyze_template(current)
+            if included is None:
+                return None
+            names |= variables
+            files[filename] = version
+            if requests is None or hashed is None:
+                hashed = None
+            else:
+                hashed.extend(requests)
+            pending.extend(included)
+        for hashed_path, _ in hashed or []:
+            try:
+                stat = os.stat(hashed_path)
+                files[hashed_path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                files[hashed_path] = None
+        return names, files, hashed
+
+    def template_variables(self, path):
+        """Names of the variables a template, and every template it includes, may look up
+
+        Returns None when the template includes another chosen at render time,
+        which could look up any variable.
+        """
+        inputs = self.template_inputs(path)
+        return None if inputs is None else inputs[0]
+
+    def referenced_variables(self, filenames):
+        """Names of the variables looked up by a set of template files
+        """
+        names = set()
+        for filename in filenames:
+            with open(filename, 'r') as template_file:
+                ast = self.jinja_env.parse(template_file.read())
+            names |= meta.find_undeclared_variables(ast)
+        return names
+
+    def record(self, filenames):
+        """Add files to every collection in progress, as if they had been loaded
+        """
+        for recorder in getattr(self.jinja_env.recorders, 'stack', []):
+            recorder.update(filenames)
+
+    def record_hashed(self, filenames):
+        """Add files to every collection of hashed files in progress, as if they
+        had been hashed
+        """
+        for recorder in getattr(self.jinja_env.recorders, 'hashed', []):
+            recorder.update(filenames)
+
+    @contextmanager
+    def _collect(self, stack_name):
+        recorders = self.jinja_env.recorders
+        if not hasattr(recorders, stack_name):
+            setattr(recorders, stack_name, [])
+        stack = getattr(recorders, stack_name)
+        collected = set()
+        stack.append(collected)
+        try:
+            yield collected
+        finally:
+            stack.pop()
+
+    def track(self):
+        """Collect the path of every template file loaded in this thread
+        """
+        return self._collect('stack')
+
+    def track_hashed(self):
+        """Collect the path of every file hashed through `file_hash` in this thread
+        """
+        return self._collect('hashed')
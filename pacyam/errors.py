@@ -0,0 +1,9 @@
+"""
+Exceptions shared by the pacyam modules.
+"""
+
+
+class BuildException(Exception):
+    """General exception raised for errors in the build process
+    """
+    pass
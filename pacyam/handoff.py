@@ -0,0 +1,48 @@
+"""
+Hand a serialized manifest to Packer without writing it to a temporary file.
+
+On Linux the manifest is written to an anonymous, memory-backed file from
+`memfd_create`, which child processes inherit and open as `/dev/fd/N`. It
+never touches the disk and disappears with the last process holding it, even
+after a crash. Elsewhere, it falls back to a temporary file removed on exit.
+"""
+
+from contextlib import contextmanager
+import os
+from tempfile import NamedTemporaryFile
+
+
+def memfd_supported():
+    return hasattr(os, 'memfd_create') and os.path.isdir('/dev/fd')
+
+
+@contextmanager
+def manifest_file(data, out_file=None):
+    """Yield (path, file descriptors) for Packer to read the manifest `data` from
+
+    The file descriptors must be passed on to the Packer processes, which is
+    empty unless the manifest is in memory. With `out_file`, the manifest is
+    written there and kept.
+    """
+    if out_file:
+        with open(out_file, 'wb') as output:
+            output.write(data)
+        yield out_file, ()
+        return
+
+    if memfd_supported():
+        descriptor = os.memfd_create('pacyam-manifest')
+        try:
+            with os.fdopen(os.dup(descriptor), 'wb') as memory_file:
+                memory_file.write(data)
+            yield '/dev/fd/%d' % descriptor, (descriptor,)
+        finally:
+            os.close(descriptor)
+        return
+
+    with NamedTemporaryFile(suffix='.json', delete=False) as temporary:
+        temporary.write(data)
+    try:
+        yield temporary.name, ()
+    finally:
+        os.unlink(temporary.name)
@@ -0,0 +1,142 @@
+"""
+Checksums of local files for templates, through `{{ file_hash(path) }}`.
+
+    iso_checksum: "{{ file_hash('iso/ubuntu-18.04.iso', 'sha256') }}"
+    iso_checksum: "{{ file_hash(iso_path) }}"
+
+Files are read through memory maps in large chunks, which hashlib digests
+without holding the GIL, so several files are hashed at once on a thread
+pool. Before rendering, the files that templates and the variables they use
+will hash are found by static analysis and hashed together (see `prefetch`).
+
+Digests are kept in memory, and on disk in a CacheDirectory, keyed by each
+file's path, size, modification time and inode, so a multi-gigabyte ISO is
+only read again once it changed. Like the bytecode cache, the directory is
+only evicted on `flush()`, not after every digest written.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import mmap
+import os
+import threading
+
+from jinja2 import nodes
+
+from pacyam.cache import hash_inputs
+from pacyam.errors import BuildException
+
+DEFAULT_ALGORITHM = 'sha256'
+
+# Bytes of a memory mapped file handed to hashlib at once
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Threads hashing files at once
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+NAMESPACE = 'file-hashes'
+
+
+def digest_file(path, algorithm=DEFAULT_ALGORITHM):
+    """Hex digest of a file's content, reading it through a memory map
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as hashed_file:
+        size = os.fstat(hashed_file.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(hashed_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for start in range(0, size, CHUNK_SIZE):
+                    digest.update(view[start:start + CHUNK_SIZE])
+    return digest.hexdigest()
+
+
+def file_hash_calls(ast):
+    """(path, algorithm) argument nodes of every `file_hash` call in a parsed template
+    """
+    calls = []
+    for call in ast.find_all(nodes.Call):
+        if not isinstance(call.node, nodes.Name) or call.node.name != 'file_hash':
+            continue
+        arguments = list(call.args) + [
+            keyword.value for keyword in call.kwargs if keyword.key in ('path', 'algorithm')
+        ]
+        if arguments:
+            calls.append((arguments[0], arguments[1] if len(arguments) > 1 else None))
+    return calls
+
+
+class FileHasher:
+    """Hashes files, remembering digests until the files change
+
+    With a `cache` (a `pacyam.cache.CacheDirectory`), digests are also kept
+    on disk between runs.
+    """
+
+    def __init__(self, cache=None, workers=DEFAULT_WORKERS):
+        self.cache = cache
+        self.workers = workers
+        self.digests = {}
+        self.lock = threading.Lock()
+        self.written = False
+
+    @staticmethod
+    def _key(path, algorithm):
+        stat = os.stat(path)
+        return (
+            os.path.realpath(path), algorithm,
+            stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev
+        )
+
+    def hash(self, path, algorithm=DEFAULT_ALGORITHM):
+        """Hex digest of a file, read only when it is not cached
+        """
+        key = self._key(path, algorithm)
+        with self.lock:
+            if key in self.digests:
+                return self.digests[key]
+        cache_key = hash_inputs(*key)
+        digest = None
+        if self.cache is not None:
+            cached = self.cache.read(NAMESPACE, cache_key)
+            digest = cached.decode('utf-8') if cached else None
+        if digest is None:
+            digest = digest_file(path, algorithm)
+            if self.cache is not None:
+                self.cache.write(NAMESPACE, cache_key, digest.encode('utf-8'), evict=False)
+                self.written = True
+        with self.lock:
+            self.digests[key] = digest
+        return digest
+
+    def prefetch(self, requests):
+        """Hash (path, algorithm) pairs at once on a thread pool, ahead of rendering
+
+        Failures are left for rendering to report.
+        """
+        requests = sorted(set(requests))
+        if len(requests) < 2:
+            return
+
+        def hash_quietly(request):
+            try:
+                self.hash(*request)
+            except (OSError, ValueError):
+                pass
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(requests))) as executor:
+            list(executor.map(hash_quietly, requests))
+        self.flush()
+
+    def flush(self):
+        """Evict old cache entries if any digests were written since the last flush
+        """
+        if self.written:
+            self.written = False
+            self.cache.evict()
+
+
+def check_algorithm(algorithm):
+    if algorithm not in hashlib.algorithms_available:
+        raise BuildException('file_hash: unknown algorithm "%s".' % algorithm)
@@ -0,0 +1,238 @@
+"""
+Ledger of builds, for `--incremental` to skip builders whose inputs are unchanged.
+
+Each builder's fingerprint covers what Packer builds it from:
+
+- its section of the manifest, and the user `variables` these refer to
+- the provisioners and post-processors applying to it, by their `only`/`except`
+- the content of the local files these read, such as the ISO, the files
+  under `http_directory` (like a preseed), and provisioner scripts
+
+Only the keys listed in INPUT_KEYS are taken as local files, so that paths on
+the guest, like a file provisioner's `destination`, are never read on the host.
+
+After a successful build, the ledger records the fingerprint along with the
+artifacts the builder wrote: the `output` of its post-processors, or else its
+`output_directory`. A builder is up to date while its fingerprint is the same
+and those artifacts still exist. Before an outdated builder is built again,
+the output directories recorded for it are moved to the trash, as Packer
+will not build into an existing one.
+"""
+
+import json
+import os
+import re
+from tempfile import NamedTemporaryFile
+import time
+
+from pacyam.cache import hash_file, hash_inputs
+
+LEDGER_FILE = '.pacyam-ledger.json'
+
+# Keys naming local files or directories a build reads, by section, for any type
+INPUT_KEYS = {
+    'builder': {
+        'iso_url', 'iso_urls', 'http_directory', 'floppy_files', 'floppy_dirs', 'cd_files',
+        'source_path', 'config_file'
+    },
+    'provisioners': {
+        'script', 'scripts', 'playbook_file', 'playbook_dir', 'playbook_paths', 'role_paths',
+        'galaxy_file', 'inventory_file', 'group_vars', 'host_vars', 'manifest_file',
+        'manifest_dir', 'module_paths', 'hiera_config_path', 'cookbook_paths', 'roles_path',
+        'data_bags_path', 'environments_path', 'local_state_tree', 'local_pillar_roots',
+        'minion_config'
+    },
+    'post-processors': {'script', 'scripts', 'vagrantfile_template', 'include'}
+}
+
+# Keys of the file builder and provisioner, read from the host unless
+# the provisioner downloads from the guest
+FILE_KEYS = {'source', 'sources'}
+
+USER_VARIABLE = re.compile(r'{{\s*user\s+`(?P<name>[^`]+)`\s*}}')
+
+# Any reference to a user variable, including inside a larger expression
+USER_REFERENCE = re.compile(r'\buser\s+`(?P<name>[^`]+)`')
+
+
+def builder_name(builder):
+    return builder.get('name', builder.get('type'))
+
+
+def applies_to(section, name):
+    """Whether a provisioner or post-processor runs for the named builder
+    """
+    if not isinstance(section, dict):
+        return True
+    if 'only' in section and name not in section['only']:
+        return False
+    return name not in section.get('except', [])
+
+
+def referenced_variables(sections, variables):
+    """The user variables the sections refer to, along with those these refer to
+    """
+    referenced = {}
+    pending = USER_REFERENCE.findall(json.dumps(sections))
+    while pending:
+        name = pending.pop()
+        if name in referenced or name not in variables:
+            continue
+        referenced[name] = variables[name]
+        pending.extend(USER_REFERENCE.findall(json.dumps(variables[name])))
+    return referenced
+
+
+def builder_sections(manifest, name):
+    """The parts of the manifest that build the named builder, and the user
+    variables they refer to
+    """
+    builders = [
+        builder for builder in manifest.get('builders', []) if builder_name(builder) == name
+    ]
+    post_processors = []
+    for entry in manifest.get('post-processors', []):
+        if isinstance(entry, list):
+            entry = [step for step in entry if applies_to(step, name)]
+            if entry:
+                post_processors.append(entry)
+        elif applies_to(entry, name):
+            post_processors.append(entry)
+    sections = {
+        'builder': builders[0] if builders else None,
+        'provisioners': [
+            provisioner for provisioner in manifest.get('provisioners', [])
+            if applies_to(provisioner, name)
+        ],
+        'post-processors': post_processors
+    }
+    sections['variables'] = referenced_variables(sections, manifest.get('variables') or {})
+    return sections
+
+
+def _input_keys(section, item):
+    keys = INPUT_KEYS[section]
+    if item.get('type') == 'file' and section != 'post-processors' \
+            and item.get('direction') != 'download':
+        return keys | FILE_KEYS
+    return keys
+
+
+def input_paths(sections):
+    """Values of the sections' keys naming local inputs, with `{{user `name`}}`
+    replaced from the manifest's variables
+    """
+    items = [('builder', sections['builder'])]
+    items += [('provisioners', provisioner) for provisioner in sections['provisioners']]
+    for entry in sections['post-processors']:
+        for step in entry if isinstance(entry, list) else [entry]:
+            items.append(('post-processors', step))
+
+    variables = sections.get('variables') or {}
+
+    def user_variable(match):
+        value = variables.get(match.group('name'))
+        return value if isinstance(value, str) else match.group(0)
+
+    paths = []
+    for section, item in items:
+        if not isinstance(item, dict):
+            continue
+        for key in _input_keys(section, item):
+            values = item.get(key)
+            for value in values if isinstance(values, list) else [values]:
+                if isinstance(value, str):
+                    paths.append(USER_VARIABLE.sub(user_variable, value))
+    return paths
+
+
+def local_files(sections):
+    """Sorted local files the sections read, with directories expanded
+    """
+    files = set()
+    for value in input_paths(sections):
+        if value.startswith('file://'):
+            value = value[len('file://'):]
+        if not value or '://' in value or '\n' in value or '{{' in value:
+            continue
+        try:
+            if os.path.isfile(value):
+                files.add(os.path.abspath(value))
+            elif os.path.isdir(value):
+                for directory, _, names in os.walk(value):
+                    files.update(os.path.abspath(os.path.join(directory, name)) for name in names)
+        except ValueError:  # Such as embedded null bytes
+            continue
+    return sorted(files)
+
+
+def builder_fingerprint(manifest, name, file_hasher=None):
+    """Key over the named builder's sections and the local files they refer to
+
+    With a `pacyam.hashing.FileHasher`, files unchanged since they were last
+    hashed, such as ISOs, are not read again.
+    """
+    sections = builder_sections(manifest, name)
+    hash_local = file_hasher.hash if file_hasher else hash_file
+    return hash_inputs(sections, [(path, hash_local(path)) for path in local_files(sections)])
+
+
+def builder_artifacts(manifest, name):
+    """Absolute paths of what a successful build of the named builder leaves behind
+
+    Post-processor outputs are used when they are known before building,
+    otherwise the builder's output directory.
+    """
+    sections = builder_sections(manifest, name)
+    outputs = []
+    for entry in sections['post-processors']:
+        for step in entry if isinstance(entry, list) else [entry]:
+            if isinstance(step, dict) and step.get('output') and '{{' not in step['output']:
+                outputs.append(step['output'])
+    if not outputs and sections['builder'] is not None:
+        output_directory = sections['builder'].get('output_directory', 'output-%s' % name)
+        if '{{' not in output_directory:
+            outputs.append(output_directory)
+    return [os.path.abspath(output) for output in outputs]
+
+
+class BuildLedger:
+    """Fingerprints and artifacts of the last successful build of each builder
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.builders = {}
+        try:
+            with open(path, 'r') as ledger_file:
+                self.builders = json.load(ledger_file).get('builders', {})
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            print('-- Ignoring unreadable build ledger "%s" --' % path)
+
+    def up_to_date(self, name, fingerprint):
+        """Whether the builder was built from this fingerprint and its artifacts remain
+        """
+        entry = self.builders.get(name)
+        if not entry or entry['fingerprint'] != fingerprint:
+            return False
+        return all(os.path.exists(path) for path in entry['artifacts'])
+
+    def artifacts(self, name):
+        return self.builders.get(name, {}).get('artifacts', [])
+
+    def record(self, name, fingerprint, artifacts):
+        self.builders[name] = {
+            'fingerprint': fingerprint,
+            'artifacts': artifacts,
+            'built': time.time()
+        }
+
+    def save(self):
+        """Atomically write the ledger
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with NamedTemporaryFile('w', dir=directory, delete=False) as ledger_file:
+            json.dump({'builders': self.builders}, ledger_file, indent=2, sort_keys=True)
+        os.replace(ledger_file.name, self.path)
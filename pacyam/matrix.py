@@ -0,0 +1,154 @@
+"""
+Compile many variable/override combinations of one project in a single run.
+
+A matrix is either a list of combinations:
+
+    [{"name": "prod-qemu", "variables": ["variables/prod.yaml"], "vars": ["builder=qemu"]}]
+
+or a mapping of axes, which is expanded into their cross product:
+
+    {
+        "env": {"dev": {"variables": ["variables/dev.yaml"]}, "prod": {...}},
+        "builder": {"qemu": {"vars": ["builder=qemu"]}, "docker": {...}}
+    }
+
+Combination variable files are loaded after the ones in `config.json`, and
+combination overrides are applied before those given on the command line.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import math
+import os
+
+from yaml import YAMLError
+
+from pacyam.api import Compiler
+from pacyam.codec import dump_manifest, load_yaml
+from pacyam.pacyam import BuildException
+
+# Kept alive in each worker process, so combinations of a project share
+# parsed variable files, compiled templates, and templates rendered with the
+# same variable values.
+_COMPILER = Compiler(share_renders=True)
+
+
+def load_matrix(path):
+    """Read a matrix definition from a JSON or YAML file
+    """
+    if not os.path.isfile(path):
+        raise BuildException('Could not find the matrix file "%s".' % path)
+    with open(path, 'r') as matrix_file:
+        try:
+            return load_yaml(matrix_file)
+        except YAMLError:
+            raise BuildException('Error parsing matrix file at "%s".' % path)
+
+
+def expand_matrix(matrix):
+    """Turn a matrix definition into a list of named combinations
+    """
+    if isinstance(matrix, dict):
+        axes = [list(values.items()) for values in matrix.values()]
+        combinations = []
+        for entries in product(*axes):
+            combinations.append({
+                'name': '-'.join(str(name) for name, _ in entries),
+                'variables': [path for _, entry in entries for path in entry.get('variables', [])],
+                'vars': [var for _, entry in entries for var in entry.get('vars', [])]
+            })
+    elif isinstance(matrix, list):
+        combinations = [
+            {
+                'name': str(entry.get('name', index)),
+                'variables': list(entry.get('variables', [])),
+                'vars': list(entry.get('vars', []))
+            }
+            for index, entry in enumerate(matrix)
+        ]
+    else:
+        raise BuildException('A matrix must be a list of combinations or a mapping of axes.')
+
+    names = [combination['name'] for combination in combinations]
+    if len(set(names)) != len(names):
+        raise BuildException('Matrix combination names must be unique.')
+    return combinations
+
+
+def compile_combination(config, combination, overrides=None):
+    """Compile one combination, reusing this process's environment for the project
+    """
+    manifest = _COMPILER.compile_configuration(
+        config, combination['variables'], combination['vars'] + list(overrides or [])
+    )
+    return combination['name'], manifest
+
+
+def _compile_chunk(config, combinations, overrides):
+    return [compile_combination(config, combination, overrides) for combination in combinations]
+
+
+def compile_matrix(config, combinations, overrides=None, workers=1):
+    """Compile every combination, in order, on a pool of `workers` processes
+    """
+    if workers <= 1 or len(combinations) <= 1:
+        return _compile_chunk(config, combinations, overrides)
+
+    # Combinations sharing variable files are kept on the same worker,
+    # so they can reuse what it already parsed.
+    ordered = sorted(
+        enumerate(combinations), key=lambda item: tuple(item[1]['variables'])
+    )
+    size = math.ceil(len(ordered) / workers)
+    chunks = [ordered[start:start + size] for start in range(0, len(ordered), size)]
+
+    results = [None] * len(combinations)
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        futures = [
+            (chunk, executor.submit(
+                _compile_chunk, config, [combination for _, combination in chunk], overrides
+            ))
+            for chunk in chunks
+        ]
+        for chunk, future in futures:
+            for (index, _), result in zip(chunk, future.result()):
+                results[index] = result
+    return results
+
+
+class MatrixBuilder:
+    """Compiles and writes one manifest per matrix combination
+    """
+
+    def __init__(self, options, configuration):
+        self.options = options
+        self.config = configuration
+        matrix = configuration.matrix
+        if options.matrix:
+            matrix = load_matrix(options.matrix)
+        if matrix is None:
+            raise BuildException(
+                'No "matrix" in the config file, give --matrix a matrix file instead.'
+            )
+        self.combinations = expand_matrix(matrix)
+
+        self.out_pattern = options.out_file or '{name}.json'
+        if '{name}' not in self.out_pattern:
+            raise BuildException('In matrix mode, --out must contain "{name}".')
+
+    def assemble_templates(self):
+        """Compile every combination, then write or print its manifest
+        """
+        workers = self.options.workers or os.cpu_count() or 1
+        results = compile_matrix(self.config, self.combinations, self.options.vars, workers)
+        for name, template in results:
+            manifest_data = dump_manifest(template, self.options.json_backend)
+            if self.options.dry_run:
+                print('-' * 80)
+                print('-- %s --' % name)
+                print(manifest_data.decode('utf-8'))
+                continue
+            manifest_file = self.out_pattern.format(name=name)
+            with open(manifest_file, 'wb') as out_file:
+                out_file.write(manifest_data)
+            print('-- Wrote %s --' % manifest_file)
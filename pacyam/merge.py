@@ -0,0 +1,60 @@
+"""
+Deep merging of rendered templates and variables.
+"""
+
+from collections import OrderedDict
+
+
+def merge_dicts(source, destination):
+    """
+    Deeply merges two dictionaries, included nested
+    keys, merging lists, and updating values.
+
+    Neither argument is modified, see `merge_all`.
+
+    NOTE: source has precendence over duplicated keys
+    """
+    return merge_all([destination, source])
+
+
+def merge_all(dicts):
+    """
+    Deeply merges a sequence of dictionaries in one pass, as if each
+    were merged into the result of the ones before it with `merge_dicts`.
+    Later dictionaries take precedence, and lists are concatenated in order.
+
+    No input is modified. Dictionaries are only created where two or more
+    inputs define the same key, every other subtree is shared with the inputs.
+    Nesting is walked with an explicit stack instead of recursion.
+    """
+    merged = {}
+    pending = [(dicts, merged)]
+    while pending:
+        nodes, merged_node = pending.pop()
+        values = OrderedDict()
+        for node in nodes:
+            for key, value in node.items():
+                values.setdefault(key, []).append(value)
+
+        for key, candidates in values.items():
+            # Only the trailing run of dicts (or of lists) survives, anything
+            # before a value of another kind is overwritten by it.
+            last = candidates[-1]
+            run = [last]
+            for value in reversed(candidates[:-1]):
+                if isinstance(last, dict) and isinstance(value, dict) or \
+                        isinstance(last, list) and isinstance(value, list):
+                    run.append(value)
+                else:
+                    break
+            run.reverse()
+
+            if len(run) == 1:
+                merged_node[key] = run[0]
+            elif isinstance(run[0], dict):
+                merged_node[key] = {}
+                pending.append((run, merged_node[key]))
+            else:
+                merged_node[key] = [item for value in run for item in value]
+
+    return merged
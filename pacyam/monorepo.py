@@ -0,0 +1,153 @@
+"""
+Compile every project found under a directory tree, with `pacyam --all ROOT`.
+
+A project is any directory holding a config file (`config.json`, or the
+`--config` name) with the required keys. Projects are compiled on a pool of
+processes, each keeping one `Compiler` between the projects it is given.
+Projects next to each other in the tree are handed to the same process, so
+variable files and templates they share through relative paths (such as
+"../shared/builders/qemu.yaml") are parsed once, and templates are rendered
+once for each distinct set of variable values they use.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import math
+import os
+import time
+
+from pacyam.api import Compiler
+from pacyam.codec import dump_manifest
+from pacyam.pacyam import BuildException, Configuration
+
+# Directories never searched for projects
+SKIPPED_DIRECTORIES = {'node_modules', '__pycache__'}
+
+# Chunks of projects handed out per worker, trading sharing for balance
+CHUNKS_PER_WORKER = 4
+
+_COMPILER = Compiler(share_renders=True)
+
+
+def _is_config(path):
+    try:
+        with open(path, 'r') as config_file:
+            data = json.load(config_file)
+    except (OSError, ValueError):
+        return False
+    return isinstance(data, dict) and all(key in data for key in Configuration.required_keys)
+
+
+def find_projects(root, config_name='config.json'):
+    """Sorted project directories under `root` holding a pacyam config file
+    """
+    projects = []
+    for directory, directories, files in os.walk(root):
+        directories[:] = sorted(
+            name for name in directories
+            if not name.startswith('.') and name not in SKIPPED_DIRECTORIES
+        )
+        if config_name in files and _is_config(os.path.join(directory, config_name)):
+            projects.append(directory)
+    return projects
+
+
+def compile_project(project, config_name, overrides=None):
+    """Compile one project with this process's Compiler
+
+    Returns (project, manifest, error, seconds), with either the manifest
+    or the error message set.
+    """
+    start = time.perf_counter()
+    try:
+        manifest = _COMPILER.compile(project, config_name, overrides=overrides)
+        error = None
+    except BuildException as exception:
+        manifest, error = None, str(exception)
+    except Exception as exception:  # pylint: disable=broad-except
+        manifest, error = None, '%s: %s' % (type(exception).__name__, exception)
+    return project, manifest, error, time.perf_counter() - start
+
+
+def _compile_chunk(projects, config_name, overrides):
+    return [compile_project(project, config_name, overrides) for project in projects]
+
+
+def compile_projects(projects, config_name='config.json', overrides=None, workers=1):
+    """Compile every project, in order, on a pool of `workers` processes
+    """
+    if workers <= 1 or len(projects) <= 1:
+        return _compile_chunk(projects, config_name, overrides)
+
+    size = math.ceil(len(projects) / (workers * CHUNKS_PER_WORKER))
+    chunks = [projects[start:start + size] for start in range(0, len(projects), size)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        futures = [
+            executor.submit(_compile_chunk, chunk, config_name, overrides) for chunk in chunks
+        ]
+        return [result for future in futures for result in future.result()]
+
+
+def project_name(root, project):
+    """Name of a project for output files, from its path within `root`
+    """
+    relative = os.path.relpath(project, root)
+    if relative == os.curdir:
+        return os.path.basename(os.path.abspath(root))
+    return relative.replace(os.sep, '-')
+
+
+class MonorepoBuilder:
+    """Compiles every project under a directory and writes one manifest for each
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.root = options.directory
+        if not os.path.isdir(self.root):
+            raise BuildException('Root directory "%s" not found.' % self.root)
+        self.config_name = os.path.basename(options.config_path)
+        self.out_pattern = options.out_file or os.path.join('{project}', 'manifest.json')
+        if '{name}' not in self.out_pattern and '{project}' not in self.out_pattern:
+            raise BuildException('With --all, --out must contain "{name}" or "{project}".')
+
+    def assemble_templates(self):
+        """Compile every project, write or print its manifest, then print a summary
+
+        Returns 1 if any project failed to compile.
+        """
+        start = time.perf_counter()
+        projects = find_projects(self.root, self.config_name)
+        if not projects:
+            raise BuildException('No "%s" found under "%s".' % (self.config_name, self.root))
+
+        workers = self.options.workers or os.cpu_count() or 1
+        results = compile_projects(projects, self.config_name, self.options.vars, workers)
+
+        summary = []
+        for project, manifest, error, seconds in results:
+            name = project_name(self.root, project)
+            if error is not None:
+                summary.append((name, 'failed: %s' % error.splitlines()[0], seconds))
+                continue
+            manifest_data = dump_manifest(manifest, self.options.json_backend)
+            if self.options.dry_run:
+                print('-' * 80)
+                print('-- %s --' % name)
+                print(manifest_data.decode('utf-8'))
+            else:
+                manifest_file = self.out_pattern.format(name=name, project=project)
+                with open(manifest_file, 'wb') as out_file:
+                    out_file.write(manifest_data)
+            summary.append((name, 'compiled', seconds))
+
+        width = max(len(name) for name, _, _ in summary)
+        print('-' * 80)
+        print('-- Compile Summary --')
+        for name, status, seconds in summary:
+            print('%s | %7.3fs | %s' % (name.ljust(width), seconds, status))
+        failed = len([status for _, status, _ in summary if status != 'compiled'])
+        print('-- %d projects, %d failed, %.2fs with %d workers --' % (
+            len(summary), failed, time.perf_counter() - start, min(workers, len(projects))
+        ))
+        return 1 if failed else 0
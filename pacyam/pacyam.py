@@ -1,110 +1,25 @@
 #!/usr/bin/env python3
 
-from argparse import ArgumentParser
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import json
 import os
-import shutil
-import subprocess
-import sys
-from tempfile import NamedTemporaryFile
 
-from jinja2 import Environment, FileSystemLoader, BaseLoader
-import yaml
+from pacyam import profiling
+from pacyam.daemon import request_manifest
+from pacyam.codec import dump_manifest, load_yaml
+from pacyam.environment import RenderEnvironment
+from pacyam.errors import BuildException
+from pacyam.handoff import manifest_file as open_manifest_file
+from pacyam.hashing import FileHasher
+from pacyam.merge import merge_all, merge_dicts  # pylint: disable=unused-import
+from pacyam.resolver import VariableDefinition, VariableResolver, Variables, parse_variables
+from pacyam.cache import CacheDirectory, ManifestCache, ValidationCache, user_cache_dir
+from pacyam.version import __version__
 
-__version__ = '1.1.1'
-
-sys.tracebacklimit = 1
-
-
-def parse_arguments(args):
-    """
-    Creates the Argument Parser for running from the
-    command line, and returns the parsed args
-    """
-    parser = ArgumentParser(
-        description='Validate & build Packer images from template files.'
-    )
-    parser.add_argument(
-        'directory',
-        metavar='directory',
-        help='The top level directory containing the templates.'
-    )
-    parser.add_argument(
-        '--config', '-c',
-        dest='config_path',
-        default=os.getenv('CONFIG', 'config.json'),
-        help='The path to the configuration file, if not in "directory".'
-    )
-    parser.add_argument(
-        '--var', '-v',
-        dest='vars',
-        action='append',
-        help='Overwrite template variables with "-v name=value".'
-             'Defined template variables may be used.'
-    )
-    parser.add_argument(
-        '--out', '-o',
-        dest='out_file',
-        default=None,
-        help='Output the Packer manifest to a file.'
-    )
-    parser.add_argument(
-        '--skip', '-s',
-        dest='skip_build',
-        action='store_true',
-        help='Skip actually building the image using Packer.'
-    )
-    parser.add_argument(
-        '--dry-run', '-d',
-        dest='dry_run',
-        action='store_true',
-        help='Output the compiled manifest to the console, don\'t actually run anything.'
-    )
-    parser.add_argument(
-        '--build-type',
-        dest='build_type',
-        default="",
-        type=str,
-        help='Run a specific builder from the compiled manifest'
-    )
-    parser.add_argument(
-        '--version',
-        action='version',
-        help='Show the current version of PyYam installed.',
-        version='%(prog)s {version}'.format(version=__version__)
-    )
-
-    return parser.parse_args(args)
-
-
-def merge_dicts(source, destination):
-    """
-    Deeply merges two dictionaries, included nested
-    keys, merging lists, and updating values.
-
-    NOTE: source has precendence over duplicated keys
-    """
-    for key, value in source.items():
-        if isinstance(value, dict):
-            # get node or create one
-            node = destination.setdefault(key, {})
-            merge_dicts(value, node)
-        elif isinstance(value, list):
-            if key in destination:
-                destination[key].extend(value)
-            else:
-                destination[key] = value
-        else:
-            destination[key] = value
-
-    return destination
-
-
-class BuildException(Exception):
-    """General exception raised for errors in the build process
-    """
-    pass
+# Environments used by render pool processes, by root directory. Filled in
+# before the pool starts, so forked processes inherit the compiled templates.
+_PROCESS_ENVIRONMENTS = {}
 
 
 class Configuration:
@@ -157,72 +72,77 @@ class Configuration:
             root_directory=root_directory,
             config_file_path=config_path,
             template_paths=data['templates'],
-            variable_paths=data.get('variables', [])
+            variable_paths=data.get('variables', []),
+            matrix=data.get('matrix'),
+            schema_paths=data.get('schema', []),
+            cache_dir=(
+                os.path.join(root_directory, data['cache_dir']) if data.get('cache_dir') else None
+            )
         )
 
 
 class VariableManager:
     """Loads and manages the pulling of variables from YAML files
+
+    Every file is parsed once, and values are only evaluated when first
+    looked up, in the order of the variables they reference, see `pacyam.resolver`.
     """
 
-    def __init__(self, variable_paths, variable_root, global_variables=None):
+    def __init__(self, variable_paths, variable_root, global_variables=None, environment=None):
         if not global_variables:
             global_variables = []
+        if not environment:
+            environment = RenderEnvironment(variable_root)
         self.variable_paths = variable_paths
         self.variable_root = variable_root
-        self.variable_data = OrderedDict()
-        self.variables = {}
+        self.environment = environment
+        self.resolver = VariableResolver(environment)
+        self.definitions = OrderedDict()
         self._load_variable_files()
         self._load_global_variables(global_variables)
-
-    def _yaml_block_to_dict(self, block_list, variables=None):
-        if not variables:
-            variables = self.variables
-        yaml_str = "\n".join(block_list)
-        jinja_env = Environment(
-            loader=BaseLoader,
-            trim_blocks=True,
-            lstrip_blocks=True
-        )
-        var_template = jinja_env.from_string(yaml_str)
-        rendered_data = var_template.render(**variables)
-        new_data = yaml.safe_load(rendered_data)
-        return new_data if new_data else {}
-
-    def _get_variables_from_file(self, full_path):
-        with open(full_path, 'r') as variable_file:
-            yaml_lines = list(variable_file.readlines())
-            yaml_data = {}
-            block = []
-            for line in yaml_lines:
-                if line.isspace() or line.startswith('#'):  # Ignore empty lines
-                    continue
-                if line.startswith(' '):  # Nested lines
-                    block.append(line)
-                else:                     # Brand new global block
-                    new_data = self._yaml_block_to_dict(block, yaml_data)
-                    yaml_data = merge_dicts(yaml_data, new_data)
-                    block = [line]
-
-            if block:  # Anything else remaining in the block
-                new_data = self._yaml_block_to_dict(block, yaml_data)
-                yaml_data = merge_dicts(yaml_data, new_data)
-        return yaml_data
+        self.variables = Variables(self.resolver)
 
     def _load_variable_files(self):
-        """Load each variable YAML file into a dict
+        """Parse each variable YAML file into definitions
         """
         for path in self.variable_paths:
-            variables = self._get_variables_from_file(self._build_path(path))
-            if variables:
-                self.variable_data[path] = variables
-                merge_dicts(variables, self.variables)
+            definitions = self.environment.load_variable_file(self._build_path(path))
+            self.definitions[path] = definitions
+            self.resolver.add(definitions)
 
     def _load_global_variables(self, global_variables):
+        """Add overrides, given as "name=value" strings or a mapping of values
+        """
+        if isinstance(global_variables, dict):
+            self.resolver.add([
+                VariableDefinition(name, '', 'overrides', data={name: value})
+                for name, value in global_variables.items()
+            ])
+            return
         for global_variable in global_variables:
-            yaml_str = global_variable.replace('=', ': ')
-            data = self._yaml_block_to_dict([yaml_str], self.variables)
-            merge_dicts(data, self.variables)
+            yaml_str = global_variable.replace('=', ': ', 1)
+            self.resolver.add(parse_variables(self.environment, yaml_str, '--var'))
+
+    @property
+    def variable_data(self):
+        """The variables defined by each file, which evaluates all of them
+        """
+        self.resolver.resolve_all()
+        return OrderedDict(
+            (path, merge_all([self.resolver.results[id(definition)] for definition in definitions]))
+            for path, definitions in self.definitions.items()
+        )
+
+    def unused_variables(self, used):
+        """Map each variable that neither `used` nor anything it references needs
+        to the files defining it
+        """
+        needed = self.resolver.dependencies(used)
+        paths = {os.path.abspath(self._build_path(path)): path for path in self.variable_paths}
+        return OrderedDict(
+            (name, [paths.get(origin, origin) for origin in self.resolver.origins(name)])
+            for name in self.resolver.definitions if name not in needed
+        )
 
     def _build_path(self, path):
         """Easy access to a specific variable path
@@ -230,15 +150,59 @@ class VariableManager:
         return os.path.join(self.variable_root, path)
 
 
+def render_file(environment, path, variables):
+    """Render and parse one template file, returning its data, the files it
+    loaded, and the files it hashed
+    """
+    with environment.track() as loaded, environment.track_hashed() as hashed:
+        template = environment.get_template(path)
+        yaml_string = template.render(variables)
+    return load_yaml(yaml_string), loaded, hashed
+
+
+def _render_in_process(root_directory, path, variables):
+    """Render one template in a render pool process
+    """
+    if root_directory not in _PROCESS_ENVIRONMENTS:
+        _PROCESS_ENVIRONMENTS[root_directory] = RenderEnvironment(root_directory)
+    return render_file(_PROCESS_ENVIRONMENTS[root_directory], path, variables)
+
+
 class TemplateManager:
     """Loads and manages the pulling and rendering of variables from YAML files
+
+    With a `render_cache` dictionary, a template is only rendered once for the
+    same content of its files and values of the variables it uses. The cache
+    may be shared between managers of different projects, whose manifests then
+    share structure and must not be modified.
+
+    With several `workers`, templates are rendered and parsed concurrently on a
+    pool of threads, or of processes with `pool='process'`, against a snapshot
+    of the variables they use. Results are still kept in `template_paths` order.
+
+    `dependencies` maps each template to the template files it loaded, and
+    `hashed` to the files hashed by it and by the variables it uses, whichever
+    template first evaluated them.
     """
 
-    def __init__(self, variable_manager, template_paths, template_root):
+    def __init__(self, variable_manager, template_paths, template_root, environment=None,
+                 render_cache=None, workers=1, pool='thread'):
+        if not environment:
+            if variable_manager.environment.root_directory == template_root:
+                environment = variable_manager.environment
+            else:
+                environment = RenderEnvironment(template_root)
         self.variables = variable_manager.variables
         self.template_paths = template_paths
         self.template_root = template_root
+        self.environment = environment
         self.template_data = OrderedDict()
+        self.dependencies = {}
+        self.hashed = {}
+        self.referenced = {}
+        self.render_cache = render_cache
+        self.workers = workers
+        self.pool = pool
         self._load_template_files_with_variables()
 
     def _load_template_files_with_variables(self):
@@ -246,24 +210,166 @@ class TemplateManager:
         Load each of the template files and render them with Jinja
         using the variable files.
         """
-        jinja_env = Environment(
-            loader=FileSystemLoader(self.template_root),
-            trim_blocks=True,
-            lstrip_blocks=True
-        )
+        self._prefetch_file_hashes()
+        if self.workers > 1 and len(set(self.template_paths)) > 1:
+            self._render_parallel()
+            return
+        for path in self.template_paths:
+            self.render_template(path)
+
+    def _prefetch_file_hashes(self):
+        """Hash every file the templates, and the variables they use, pass to
+        `file_hash` with known arguments, all at once
+        """
+        requests = []
+        names = set()
         for path in self.template_paths:
-            template = jinja_env.get_template(path)
-            yaml_string = template.render(self.variables)
-            self.template_data[path] = yaml.safe_load(yaml_string)
+            inputs = self.environment.template_inputs(path)
+            if inputs is None:
+                names = None
+                continue
+            if names is not None:
+                names |= inputs[0]
+            requests.extend(inputs[2] or [])
+
+        resolver = self.variables.resolver
+        needed = resolver.definitions if names is None else resolver.dependencies(names)
+        definitions = [definition for name in needed for definition in resolver.definitions[name]]
+        for definition in definitions + resolver.anonymous:
+            if not definition.templated or 'file_hash' not in definition.source:
+                continue
+            try:
+                ast = self.environment.jinja_env.parse(definition.source)
+                requests.extend(self.environment.hash_requests(ast, self.variables) or [])
+            except BuildException:
+                continue  # Reported when the definition is evaluated
+        self.environment.file_hasher.prefetch(requests)
+
+    def render_template(self, path):
+        """Render and parse one template file, recording every file it pulled in
+
+        Only the variables the template may look up are evaluated.
+        """
+        with profiling.span('template', path):
+            inputs = self.environment.template_inputs(path)
+            self.referenced[path] = None if inputs is None else inputs[0]
+            key = None
+            if self.render_cache is not None and inputs is not None and inputs[2] is not None:
+                key = self._render_key(inputs[0], inputs[1])
+                if key in self.render_cache:
+                    self._store(path, *self.render_cache[key])
+                    return
+            data, loaded, hashed = render_file(
+                self.environment, path, self.variables.select(self.referenced[path])
+            )
+        self._store(path, data, loaded, hashed)
+        if key is not None:
+            self.render_cache[key] = (data, loaded, hashed)
+
+    def _store(self, path, data, loaded, hashed):
+        """Keep a rendered template, and record the files it depends on in the
+        collections in progress, wherever it was rendered
+        """
+        self.template_data[path] = data
+        self.dependencies[path] = loaded
+        # Variables are evaluated once, by whichever template used them first
+        self.hashed[path] = hashed | self.variables.resolver.hashed_files(self.referenced[path])
+        self.environment.record(loaded)
+        self.environment.record_hashed(self.hashed[path])
+
+    def _render_parallel(self):
+        """Render the templates not in the render cache on a pool of workers
+        """
+        keys = {}
+        pending = []
+        for path in OrderedDict.fromkeys(self.template_paths):
+            self.template_data[path] = None  # Keeps the order of `template_paths`
+            inputs = self.environment.template_inputs(path)
+            self.referenced[path] = None if inputs is None else inputs[0]
+            if self.render_cache is not None and inputs is not None and inputs[2] is not None:
+                keys[path] = self._render_key(inputs[0], inputs[1])
+                if keys[path] in self.render_cache:
+                    self._store(path, *self.render_cache[keys[path]])
+                    continue
+            pending.append(path)
+
+        snapshot = self._variable_snapshot([self.referenced[path] for path in pending])
+        with profiling.span('template', '%d templates on %d %ss' % (
+                len(pending), self.workers, self.pool)):
+            for path, result in zip(pending, self._run_pool(pending, snapshot)):
+                # Files loaded in other threads or processes
+                self._store(path, *result)
+                if path in keys:
+                    self.render_cache[keys[path]] = result
+
+    def _variable_snapshot(self, referenced):
+        """Evaluate every variable in the referenced sets, any of which may be
+        None for all of them, into a plain dictionary the workers can share
+        """
+        if any(names is None for names in referenced):
+            names = self.variables.resolver.names()
+        else:
+            names = set().union(*referenced)
+        return {name: self.variables[name] for name in names if name in self.variables}
+
+    def _run_pool(self, paths, snapshot):
+        """Render each template, returning (data, files loaded, files hashed) in order
+        """
+        def variables(path):
+            names = self.referenced[path]
+            if names is None:
+                return snapshot
+            return {name: snapshot[name] for name in names if name in snapshot}
+
+        workers = min(self.workers, len(paths))
+        if self.pool == 'process':
+            root = self.environment.root_directory
+            _PROCESS_ENVIRONMENTS[root] = self.environment
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(_render_in_process, root, path, variables(path))
+                        for path in paths
+                    ]
+                    return [future.result() for future in futures]
+            finally:
+                _PROCESS_ENVIRONMENTS.pop(root, None)
+
+        def render(path):
+            with profiling.span('template', path):
+                return render_file(self.environment, path, variables(path))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(render, path) for path in paths]
+            return [future.result() for future in futures]
+
+    def _render_key(self, names, files):
+        """Key over a template's files and the values of the variables it uses
+        """
+        values = [
+            [name, self.variables[name]] for name in sorted(names) if name in self.variables
+        ]
+        return (
+            tuple(sorted(files.items())),
+            json.dumps(values, sort_keys=True, default=repr)
+        )
+
+    def referenced_variables(self):
+        """Names of the variables the templates may look up, or None for any
+        """
+        names = set()
+        for referenced in self.referenced.values():
+            if referenced is None:
+                return None
+            names |= referenced
+        return names
 
     def merge_template_data(self):
         """Merge each rendered template into one final template
         """
-        template = {}
-        for _, cur_template in reversed(self.template_data.items()):
-            if cur_template:
-                template = merge_dicts(cur_template, template)
-        return template
+        return merge_all([
+            cur_template for cur_template in reversed(self.template_data.values()) if cur_template
+        ])
 
 
 
@@ -272,71 +378,157 @@ class PackerTemplateMerger:
     """
 
     config = None
+    manifest = None
+    manifest_cache = None
+    # Every file the manifest was compiled from
+    dependencies = None
+    # File descriptors Packer needs to read an in-memory manifest
+    manifest_fds = ()
+    # Whether `packer build` ran
+    built = False
 
     template_manager = None
     variable_manager = None
 
     def __init__(self, options, configuration=None):
         """Load each manager to prepare for assembly
+
+        When a cache directory is given and none of the inputs changed since
+        the last compile, the managers are skipped and the cached manifest used.
+        The same goes when the manifest is compiled by a `pacyam serve` daemon.
+        The cache directory is `--cache-dir`, or else the config's `cache_dir`.
         """
         self.options = options
+        if self.options.depfile and not self.options.out_file:
+            raise BuildException('--depfile needs --out, the target to list dependencies for.')
         if not configuration:
             configuration = Configuration.load(
                 root_directory=options.directory,
                 config_file_name=options.config_path
             )
         self.config = configuration
-        self.variable_manager = VariableManager(
-            variable_paths=self.config.variable_paths,
-            variable_root=self.config.root_directory,
-            global_variables=self.options.vars
+        self.cache_dir = self.options.cache_dir or configuration.cache_dir
+        if self.cache_dir:
+            self.manifest_cache = ManifestCache(
+                self.cache_dir,
+                max_size=self.options.cache_size * 1024 * 1024,
+                version=__version__
+            )
+            self.manifest = self.manifest_cache.lookup(self.config, self.options.vars)
+        if self.manifest is None and self.options.daemon_socket:
+            self.manifest = self._compile_remote()
+        if self.manifest is None:
+            self._compile()
+
+    def _compile_remote(self):
+        """Have the daemon compile the manifest, returning None if it is not running
+        """
+        with profiling.span('daemon', self.options.daemon_socket):
+            manifest_data = request_manifest(
+                self.options.daemon_socket,
+                self.config.root_directory,
+                os.path.relpath(self.config.config_file_path, self.config.root_directory),
+                self.options.vars
+            )
+        if manifest_data is None:
+            return None
+        return json.loads(manifest_data.decode('utf-8'))
+
+    def _compile(self):
+        """Render the variables and templates into the merged manifest
+        """
+        environment = RenderEnvironment(
+            self.config.root_directory,
+            bytecode_cache=self._bytecode_cache(),
+            file_hasher=FileHasher(CacheDirectory(
+                self.cache_dir or user_cache_dir(),
+                max_size=self.options.cache_size * 1024 * 1024
+            ))
         )
-        self.template_manager = TemplateManager(
-            variable_manager=self.variable_manager,
-            template_paths=self.config.template_paths,
-            template_root=self.config.root_directory
+        with environment.track() as dependencies, environment.track_hashed() as hashed:
+            self.variable_manager = VariableManager(
+                variable_paths=self.config.variable_paths,
+                variable_root=self.config.root_directory,
+                global_variables=self.options.vars,
+                environment=environment
+            )
+            self.template_manager = TemplateManager(
+                variable_manager=self.variable_manager,
+                template_paths=self.config.template_paths,
+                template_root=self.config.root_directory,
+                workers=self.options.render_workers,
+                pool=self.options.render_pool
+            )
+            self.manifest = self._merge()
+        # Hashed files are inputs of the manifest as much as templates are
+        self.dependencies = dependencies | hashed
+        if environment.bytecode_cache:
+            environment.bytecode_cache.flush()
+        environment.file_hasher.flush()
+        if self.manifest_cache:
+            self.manifest_cache.store(
+                self.config, self.options.vars, self.manifest, self.dependencies
+            )
+
+    def _bytecode_cache(self):
+        """Cache of compiled templates in the cache directory, if there is one
+        """
+        if not self.cache_dir:
+            return None
+        # pylint: disable=import-outside-toplevel
+        from pacyam.bytecode import TemplateBytecodeCache
+        return TemplateBytecodeCache(
+            self.cache_dir, max_size=self.options.cache_size * 1024 * 1024
         )
 
+    def _merge(self):
+        """Merge the rendered templates into the final manifest
+        """
+        with profiling.span('merge', 'merge_template_data'):
+            return self.template_manager.merge_template_data()
 
     def assemble_template(self):
         """The core functionality that builds the template
 
-        Builds the template, and writes it to either a
-        temp file or to an output file given from command line.
+        Serializes the template once, and hands it to Packer in memory,
+        or through the output file given from command line.
         """
-        template = self.template_manager.merge_template_data()
-        if self.options.out_file and not self.options.dry_run:
-            manifest_file = self.options.out_file
-            out_file = open(manifest_file, 'w+')
-        else:
-            out_file = NamedTemporaryFile(delete=False, mode='w')
-            manifest_file = out_file.name
-
-        # When wrapped with context below, the file was unreachable
-        # later on in the validation/build periods.
-        json.dump(
-            template,
-            out_file,
-            sort_keys=True,
-            indent=4
-        )
-        out_file.close()
+        if self.options.unused_variables:
+            self._report_unused_variables()
+        if self.options.depfile:
+            self._write_depfile()
+        schema_valid = self.options.skip_schema or self._check_schema()
+
+        # Serialized once, and reused for the console output
+        with profiling.span('serialize', self.options.json_backend):
+            manifest_data = dump_manifest(self.manifest, self.options.json_backend)
+        if not schema_valid:
+            if self.options.dry_run:
+                self._dry_run(manifest_data, exit_code=1)
+            return 1
+        out_file = self.options.out_file if not self.options.dry_run else None
+
+        with open_manifest_file(manifest_data, out_file) as (manifest_file, fds):
+            self.manifest_fds = fds
+            try:
+                valid = self._validate_template(manifest_file)
+                exit_code = 0 if valid else 1
 
-        conditions_to_build = all([
-            self._validate_template(manifest_file),
-            not self.options.dry_run,
-            not self.options.skip_build
-        ])
+                conditions_to_build = all([
+                    valid,
+                    not self.options.dry_run,
+                    not self.options.skip_build
+                ])
 
-        if conditions_to_build:
-            self._build_template(manifest_file)
+                if conditions_to_build:
+                    exit_code = self._build_template(manifest_file)
+            finally:
+                self.manifest_fds = ()
 
         if self.options.dry_run:
-            self._dry_run(template)
+            self._dry_run(manifest_data)
 
-        # Unlink (Delete) the temporary file
-        if not self.options.out_file:
-            os.unlink(manifest_file)
+        return exit_code
 
     # pylint: disable=no-self-use
     def _divider(self, length=80):
@@ -344,73 +536,239 @@ class PackerTemplateMerger:
         """
         print('-' * length)
 
-    def _dry_run(self, template):
-        """Output the manifest to the console
+    def _report_unused_variables(self):
+        """Print the variables no template uses, along with where they are defined
         """
+        if self.template_manager is None:  # Loaded from the manifest cache
+            self._compile()
+        referenced = self.template_manager.referenced_variables()
         self._divider()
-        json_manifest = json.dumps(template, sort_keys=True, indent=4)
-        print(json_manifest)
-        exit(0)
+        if referenced is None:
+            print('-- Unused variables unknown, '
+                  'a template includes files chosen while rendering --')
+            return
+        unused = self.variable_manager.unused_variables(referenced)
+        print('-- %d Unused Variables --' % len(unused))
+        for name, origins in unused.items():
+            print('%s (%s)' % (name, ', '.join(origins)))
+
+    def _check_schema(self):
+        """Check the manifest against the bundled schema and the project's own,
+        printing every error and warning along with the template it came from
+
+        Returns False when there are errors.
+        """
+        # pylint: disable=import-outside-toplevel
+        from pacyam.schema import ManifestValidator, load_schema
+        with profiling.span('schema', 'check manifest'):
+            schema_paths = [
+                os.path.join(self.config.root_directory, path) for path in self.config.schema_paths
+            ]
+            sources = self.template_manager.template_data if self.template_manager else None
+            problems = ManifestValidator(load_schema(schema_paths)).validate(
+                self.manifest, sources
+            )
+        errors = [problem for problem in problems if not problem.warning]
+        warnings = [problem for problem in problems if problem.warning]
+        for kind, found in (('Warning', warnings), ('Error', errors)):
+            if not found:
+                continue
+            self._divider()
+            print('-- %d %s%s in the Manifest --' % (
+                len(found), kind, '' if len(found) == 1 else 's'
+            ))
+            for problem in found:
+                print('* %s' % problem)
+        return not errors
+
+    def _write_depfile(self):
+        """Write the config, variable files, and every template file loaded
+        while rendering, to the depfile
+        """
+        from pacyam.depfile import write_depfile  # pylint: disable=import-outside-toplevel
+        if self.dependencies is None:  # Loaded from the manifest cache or daemon
+            self._compile()
+        root = self.config.root_directory
+        files = [self.config.config_file_path]
+        files += [os.path.join(root, path) for path in self.config.variable_paths]
+        write_depfile(
+            self.options.depfile, self.options.out_file, files + list(self.dependencies)
+        )
+
+    def _dry_run(self, manifest_data, exit_code=0):
+        """Output the serialized manifest to the console
+        """
+        self._divider()
+        print(manifest_data.decode('utf-8'))
+        exit(exit_code)
+
+    def _supervisor(self):
+        """Supervisor for the Packer processes, importing asyncio only once one runs
+        """
+        from pacyam.supervisor import Supervisor  # pylint: disable=import-outside-toplevel
+        return Supervisor(timeout=self.options.timeout, pass_fds=self.manifest_fds)
 
     def _validate_template(self, manifest_file):
         """Run `packer validate` on a manifest_file path
+
+        Successful results are stored by manifest hash, Packer install and
+        working directory, so an unchanged manifest is not validated again unless
+        --force-validate is given. Failures are always checked again, as they may
+        come from local files the manifest refers to.
         """
-        process = subprocess.Popen(["packer", "validate", manifest_file], stdout=subprocess.PIPE)
-        output = process.communicate()[0].decode('utf-8')
-        if 'error' in output:
+        cache = ValidationCache(
+            self.cache_dir or user_cache_dir(),
+            max_size=self.options.cache_size * 1024 * 1024
+        )
+        key = cache.key(manifest_file)
+        cached = None
+        if key and not self.options.force_validate:
+            cached = cache.lookup(key)
+
+        if cached:
+            returncode, output, errors = cached
+        else:
+            supervisor = self._supervisor()
+            with profiling.span('packer', 'packer validate'):
+                result = supervisor.run(['packer', 'validate', manifest_file], capture=True)
+            returncode = result.returncode
+            output = result.stdout.decode('utf-8')
+            errors = result.stderr.decode('utf-8')
+            if key and not returncode and 'error' not in output:
+                cache.store(key, returncode, output, errors)
+
+        if returncode or 'error' in output:
             self._divider()
             print('-- Error validating template --')
             for error in output.split('*')[1:]:
                 print('* %s' % error)
+            if errors:
+                print(errors)
             return False
 
-        print('-- Template Passed Validation --')
+        print('-- Template Passed Validation%s --' % (' (cached)' if cached else ''))
         return True
 
+    def builder_names(self):
+        """Names of the builders to run, limited by --build-type if given
+        """
+        names = [
+            builder.get('name', builder.get('type'))
+            for builder in self.manifest.get('builders', [])
+        ]
+        if not self.options.build_type:
+            return names
+        selected = self.options.build_type.split(',')
+        missing = [name for name in selected if name not in names]
+        if missing:
+            raise BuildException('No builders named: %s' % ', '.join(missing))
+        return [name for name in names if name in selected]
+
+    def output_directories(self):
+        """The builders' output directories to clean up, except those the build
+        ledger keeps as artifacts
+        """
+        if self.manifest is None:
+            return []
+        # pylint: disable=import-outside-toplevel
+        from pacyam.ledger import LEDGER_FILE, BuildLedger
+        from pacyam.trash import output_directories
+        ledger = BuildLedger(os.path.join(self.config.root_directory, LEDGER_FILE))
+        kept = {path for name in ledger.builders for path in ledger.artifacts(name)}
+        return [
+            directory for directory in output_directories(self.manifest)
+            if os.path.abspath(directory) not in kept
+        ]
+
     def _build_template(self, manifest_file):
         """Run `packer build` on a manifest_file path
         """
+        if self.options.incremental:
+            return self._build_incremental(manifest_file)
+        if self.options.parallel:
+            results = self._build_parallel(manifest_file, self.builder_names())
+            return 0 if not any(results.values()) else 1
+
         arguments = []
         if self.options.build_type:
             arguments.append("--only=%s" % self.options.build_type)
+        return self._build_once(manifest_file, arguments)
 
-        process = subprocess.Popen(
-            'packer build %s %s' % (" ".join(arguments), manifest_file),
-            stdout=subprocess.PIPE,
-            shell=True
-        )
-        while True:
-            output = process.stdout.readline()
-            if output == b'' and process.poll() is not None:
-                break
-            if output:
-                print(output.strip().decode('utf-8'))
-            process.poll()
-
-
-def cleanup():
-    types = [
-        'virtualbox-iso',
-        'qemu',
-        'virtualbox-ovf'
-    ]
-    print('\nCleanup up output directories...')
-    for build_type in types:
-        directory = 'output-%s' % build_type
-        if os.path.exists(directory):
-            shutil.rmtree(directory, ignore_errors=True)
+    def _build_once(self, manifest_file, arguments):
+        """Run a single `packer build`, returning its exit code
+        """
+        supervisor = self._supervisor()
+        self.built = True
+        with profiling.span('packer', 'packer build'):
+            result = supervisor.run(['packer', 'build'] + arguments + [manifest_file])
+        if result.timed_out:
+            print('-- Build timed out after %s seconds --' % self.options.timeout)
+        return result.returncode
+
+    def _build_parallel(self, manifest_file, names):
+        """Run one `packer build --only=<name>` per builder, at most --parallel at once
+
+        Returns the exit code of each builder's build by name.
+        """
+        width = max([len(name) for name in names] or [0])
+        commands = [
+            (['packer', 'build', '--only=%s' % name, manifest_file], '%s | ' % name.ljust(width))
+            for name in names
+        ]
+        supervisor = self._supervisor()
+        self.built = True
+        with profiling.span('packer', 'packer build (%d builders)' % len(names)):
+            results = supervisor.run_all(commands, limit=self.options.parallel)
+        return_codes = [result.returncode for result in results]
 
+        self._divider()
+        print('-- Build Summary --')
+        for name, return_code in zip(names, return_codes):
+            status = 'succeeded' if return_code == 0 else 'failed (exit %d)' % return_code
+            print('%s | %s' % (name.ljust(width), status))
+        return dict(zip(names, return_codes))
+
+    def _build_incremental(self, manifest_file):
+        """Build only the builders whose fingerprint changed since their last
+        successful build, recording the new builds in the ledger
+        """
+        # pylint: disable=import-outside-toplevel
+        from pacyam.ledger import LEDGER_FILE, BuildLedger, builder_artifacts, builder_fingerprint
+        from pacyam.trash import cleanup
+        ledger = BuildLedger(os.path.join(self.config.root_directory, LEDGER_FILE))
+        names = self.builder_names()
+        file_hasher = FileHasher(CacheDirectory(
+            self.cache_dir or user_cache_dir(), max_size=self.options.cache_size * 1024 * 1024
+        ))
+        fingerprints = {
+            name: builder_fingerprint(self.manifest, name, file_hasher) for name in names
+        }
+        file_hasher.flush()
+        outdated = [name for name in names if not ledger.up_to_date(name, fingerprints[name])]
 
-def main():
-    """Setup and run the merger after figuring out command line arguments
-    """
-    command_line_args = parse_arguments(sys.argv[1:])
-    try:
-        merger = PackerTemplateMerger(command_line_args)
-        merger.assemble_template()
-    except KeyboardInterrupt:
-        pass
-    cleanup()
-
-if __name__ == '__main__':
-    main()
+        self._divider()
+        for name in names:
+            if name not in outdated:
+                artifacts = ', '.join(ledger.artifacts(name)) or 'no known artifacts'
+                print('-- Reusing %s, unchanged since its last build: %s --' % (name, artifacts))
+        if not outdated:
+            print('-- All builders are up to date --')
+            return 0
+
+        # Packer refuses to build into an existing output directory, such as
+        # one the ledger kept from the builder's last build
+        cleanup(
+            [path for name in outdated for path in ledger.artifacts(name)],
+            self.config.root_directory
+        )
+        if self.options.parallel:
+            results = self._build_parallel(manifest_file, outdated)
+        else:
+            return_code = self._build_once(manifest_file, ['--only=%s' % ','.join(outdated)])
+            results = {name: return_code for name in outdated}
+
+        for name, return_code in results.items():
+            if return_code == 0:
+                ledger.record(name, fingerprints[name], builder_artifacts(self.manifest, name))
+        ledger.save()
+        return 0 if not any(results.values()) else 1
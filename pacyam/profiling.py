@@ -0,0 +1,186 @@
+"""
+Optional timing of each compile phase, enabled with `--profile`.
+
+Code marks the work worth measuring with `span(category, name)`:
+
+    with profiling.span('template', path):
+        ...
+
+Until `enable()` is called, `span` returns one shared do-nothing context
+manager, so instrumented code costs a function call when profiling is off.
+When enabled, every span is recorded with its start and duration, and the
+time spent in nested spans is subtracted from the enclosing one for the
+summary. Recorded spans can be written as a Chrome trace-event file, to be
+opened in chrome://tracing or https://ui.perfetto.dev. `tracemalloc` is
+only imported when memory use is traced.
+"""
+
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import threading
+import time
+
+_NULL_SPAN = nullcontext()
+
+
+def _tracemalloc():
+    import tracemalloc  # pylint: disable=import-outside-toplevel
+    return tracemalloc
+
+
+class Span:
+    """One timed piece of work
+    """
+
+    def __init__(self, category, name, start, thread):
+        self.category = category
+        self.name = name
+        self.start = start
+        self.thread = thread
+        self.duration = 0
+        self.children = 0
+
+    @property
+    def self_time(self):
+        """Time spent in this span, excluding the spans nested in it
+        """
+        return self.duration - self.children
+
+
+class Profiler:
+    """Records spans, and optionally memory use through tracemalloc
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.spans = []
+        self.counters = []
+        self.origin = time.perf_counter_ns()
+        self.local = threading.local()
+        self.peak = None
+        self.started_tracing = memory and not _tracemalloc().is_tracing()
+        if self.started_tracing:
+            _tracemalloc().start()
+
+    @contextmanager
+    def span(self, category, name):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        current = Span(category, name, time.perf_counter_ns(), threading.get_ident())
+        stack.append(current)
+        try:
+            yield current
+        finally:
+            current.duration = time.perf_counter_ns() - current.start
+            stack.pop()
+            if stack:
+                stack[-1].children += current.duration
+            self.spans.append(current)
+            if self.memory:
+                memory, _ = _tracemalloc().get_traced_memory()
+                self.counters.append((time.perf_counter_ns(), memory))
+
+    def peak_memory(self):
+        """Highest memory traced in bytes, or None without tracemalloc
+        """
+        if not self.memory or self.peak is not None:
+            return self.peak
+        return _tracemalloc().get_traced_memory()[1]
+
+    def stop(self):
+        """Stop tracing memory, keeping the peak
+        """
+        if self.memory:
+            self.peak = self.peak_memory()
+        if self.started_tracing:
+            _tracemalloc().stop()
+            self.started_tracing = False
+
+    def summary(self, limit=20):
+        """Lines describing the total time per category and the slowest spans
+        """
+        totals = {}
+        for recorded in self.spans:
+            count, total = totals.get(recorded.category, (0, 0))
+            totals[recorded.category] = (count + 1, total + recorded.self_time)
+
+        lines = ['-- Profile --', '%-12s %8s %12s' % ('phase', 'count', 'total (ms)')]
+        for category, (count, total) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append('%-12s %8d %12.2f' % (category, count, total / 1e6))
+
+        lines.append('')
+        lines.append('%-12s %12s  %s' % ('slowest', 'self (ms)', 'name'))
+        slowest = sorted(self.spans, key=lambda recorded: -recorded.self_time)[:limit]
+        for recorded in slowest:
+            lines.append('%-12s %12.2f  %s'
+                         % (recorded.category, recorded.self_time / 1e6, recorded.name))
+
+        peak = self.peak_memory()
+        if peak is not None:
+            lines.append('')
+            lines.append('Peak memory: %.1f MB' % (peak / (1024 * 1024)))
+        return lines
+
+    def trace_events(self):
+        """The recorded spans as Chrome trace events, with times in microseconds
+        """
+        pid = os.getpid()
+        events = [
+            {
+                'name': recorded.name,
+                'cat': recorded.category,
+                'ph': 'X',
+                'ts': (recorded.start - self.origin) / 1000,
+                'dur': recorded.duration / 1000,
+                'pid': pid,
+                'tid': recorded.thread,
+                'args': {'self_ms': recorded.self_time / 1e6}
+            }
+            for recorded in sorted(self.spans, key=lambda recorded: recorded.start)
+        ]
+        events += [
+            {
+                'name': 'memory',
+                'ph': 'C',
+                'ts': (timestamp - self.origin) / 1000,
+                'pid': pid,
+                'args': {'traced_bytes': memory}
+            }
+            for timestamp, memory in self.counters
+        ]
+        return events
+
+    def write_trace(self, path):
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, trace_file)
+
+
+_profiler = None
+
+
+def enable(memory=False):
+    """Start recording spans, returning the Profiler
+    """
+    global _profiler  # pylint: disable=global-statement
+    _profiler = Profiler(memory)
+    return _profiler
+
+
+def disable():
+    """Stop recording spans, returning the Profiler that recorded them
+    """
+    global _profiler  # pylint: disable=global-statement
+    profiler, _profiler = _profiler, None
+    if profiler:
+        profiler.stop()
+    return profiler
+
+
+def span(category, name):
+    """Context manager timing a piece of work, when profiling is enabled
+    """
+    if _profiler is None:
+        return _NULL_SPAN
+    return _profiler.span(category, name)
@@ -0,0 +1,457 @@
+"""
+Dependency-aware resolution of variable files.
+
+Each variable file is parsed once into definitions, one per top-level key,
+and Jinja's static analysis finds the variables each one references. Values are
+evaluated in dependency order, so a variable may reference one defined
+further down, or in a later file, and each templated value is rendered once.
+
+Definitions without Jinja markup keep the value from the initial YAML parse
+and are never rendered. When a file is not valid YAML before rendering (for
+example an unquoted `key: {{ value }}`), it is split into top-level blocks
+by its lines instead, keeping Jinja statement blocks and column 0 list items
+with the key they belong to.
+
+Nothing is evaluated up front: `Variables` is a mapping that resolves each
+value the first time it is looked up, so only the variables the templates use,
+and the ones those depend on, are ever rendered.
+
+The files each definition hashes through `file_hash` are remembered, so the
+templates using a variable depend on them however it was first evaluated, and
+`invalidate` forgets the values computed from files that changed.
+"""
+
+from collections.abc import Mapping
+import re
+
+from jinja2 import meta, nodes
+import yaml
+
+from pacyam import profiling
+from pacyam.codec import load_yaml, safe_loader
+from pacyam.errors import BuildException
+from pacyam.merge import merge_dicts
+
+JINJA_MARKUP = ('{{', '{%', '{#')
+
+TOP_LEVEL_KEY = re.compile(r'^(["\']?)(?P<name>[^\s"\':#{\-][^"\':]*?)\1\s*:(\s|$)')
+BLOCK_START = re.compile(r'{%-?\s*(if|for|macro|call|filter|raw|set\s+\w+\s*-?%})')
+BLOCK_END = re.compile(r'{%-?\s*end(if|for|macro|call|filter|raw|set)\b')
+
+_MISSING = object()
+
+
+class VariableDefinition:
+    """One top-level block of a variable file, or one --var override
+
+    `name` is the key the block defines, or None when it could not be
+    determined before rendering, in which case every key it renders is used.
+    The variables a templated block references are found when first needed.
+    """
+
+    def __init__(self, name, source, origin, data=None, environment=None):
+        self.name = name
+        self.source = source
+        self.origin = origin
+        self.data = data
+        self.environment = environment
+        self._references = None if data is None else frozenset()
+
+    @property
+    def references(self):
+        if self._references is None:
+            ast = self.environment.jinja_env.parse(self.source)
+            self._references = frozenset(meta.find_undeclared_variables(ast))
+        return self._references
+
+    @property
+    def templated(self):
+        return self.data is None
+
+
+def _has_markup(text):
+    return any(markup in text for markup in JINJA_MARKUP)
+
+
+def _top_level_entries(text):
+    """Parse YAML text, returning (name, line, value) for each top-level key
+    """
+    loader = safe_loader()(text)
+    try:
+        node = loader.get_single_node()
+        if node is None:
+            return []
+        if not isinstance(node, yaml.MappingNode):
+            raise BuildException('Variable files must be YAML mappings.')
+        return [
+            (
+                loader.construct_object(key_node, deep=True),
+                key_node.start_mark.line,
+                loader.construct_object(value_node, deep=True)
+            )
+            for key_node, value_node in node.value
+        ]
+    finally:
+        loader.dispose()
+
+
+def _split_blocks(lines):
+    """Split lines into top-level blocks, returning (name, first line index) pairs
+    """
+    starts = []
+    depth = 0
+    for index, line in enumerate(lines):
+        if depth == 0 and line.strip() and not line[0].isspace() \
+                and not line.startswith(('- ', '---', '...')) and line.rstrip() != '-':
+            match = TOP_LEVEL_KEY.match(line)
+            starts.append((match.group('name') if match else None, index))
+        depth += len(BLOCK_START.findall(line)) - len(BLOCK_END.findall(line))
+        depth = max(depth, 0)
+    return starts
+
+
+def parse_variables(environment, text, origin):
+    """Parse the text of a variable file into a list of VariableDefinitions
+    """
+    # Comment lines are dropped, like they always have been
+    lines = [line for line in text.splitlines(True) if not line.startswith('#')]
+    text = ''.join(lines)
+
+    try:
+        entries = _top_level_entries(text)
+        starts = [(name, line) for name, line, _ in entries]
+        values = [value for _, _, value in entries]
+    except yaml.YAMLError:
+        starts = _split_blocks(lines)
+        values = [_MISSING] * len(starts)
+
+    definitions = []
+    bounds = [line for _, line in starts[1:]] + [len(lines)]
+    for (name, first), last, value in zip(starts, bounds, values):
+        source = ''.join(lines[first:last])
+        if _has_markup(source):
+            definitions.append(
+                VariableDefinition(name, source, origin, environment=environment)
+            )
+            continue
+        if value is _MISSING:
+            data = load_yaml(source) or {}
+            if name not in data:
+                name = None
+        else:
+            data = {name: value}
+        definitions.append(VariableDefinition(name, source, origin, data=data))
+    return definitions
+
+
+def _constant_names(node):
+    """Template names given by a constant include/import argument, or None
+    """
+    if isinstance(node, nodes.Const) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, nodes.Const) and isinstance(node.value, (list, tuple)):
+        return list(node.value)
+    if isinstance(node, (nodes.List, nodes.Tuple)):
+        names = [_constant_names(item) for item in node.items]
+        if None in names:
+            return None
+        return [name for item in names for name in item]
+    return None
+
+
+def _forwarded_templates(ast, forwarding):
+    """Template names passed as constants to macros including one of their
+    arguments, given as (macro name, argument index) pairs, or None when one
+    is only known at render time
+    """
+    included = set()
+    for call in ast.find_all(nodes.Call):
+        if not isinstance(call.node, nodes.Name):
+            continue
+        for macro_name, index in forwarding:
+            if call.node.name != macro_name:
+                continue
+            if index >= len(call.args) or call.dyn_args or call.kwargs:
+                return None
+            names = _constant_names(call.args[index])
+            if names is None:
+                return None
+            included.update(names)
+    return included
+
+
+def referenced_templates(ast):
+    """Names of the templates a parsed template includes or imports
+
+    Besides constant names, this follows macros including one of their arguments,
+    like the `include_file` macro, through the constant arguments they are called
+    with. Returns None when a template name is only known at render time.
+    """
+    included = set()
+    # (macro name, argument index) pairs whose argument is a template name
+    forwarding = set()
+    in_macros = set()
+
+    for macro in ast.find_all(nodes.Macro):
+        arguments = [argument.name for argument in macro.args]
+        for node in macro.find_all((nodes.Include, nodes.Import, nodes.FromImport)):
+            in_macros.add(id(node))
+            template = node.template
+            if isinstance(template, nodes.Name) and template.name in arguments:
+                forwarding.add((macro.name, arguments.index(template.name)))
+                continue
+            names = _constant_names(template)
+            if names is None:
+                return None
+            included.update(names)
+
+    for node in ast.find_all((nodes.Include, nodes.Import, nodes.FromImport)):
+        if id(node) in in_macros:
+            continue
+        names = _constant_names(node.template)
+        if names is None:
+            return None
+        included.update(names)
+
+    forwarded = _forwarded_templates(ast, forwarding)
+    if forwarded is None:
+        return None
+    return included | forwarded
+
+
+class VariableResolver:
+    """Evaluates variable definitions on demand, in dependency order
+
+    A name defined several times (in several files, or by an override) has its
+    definitions merged in order, with later ones taking precedence. A definition
+    referencing its own name sees the value of the definitions before it.
+    """
+
+    def __init__(self, environment):
+        self.environment = environment
+        self.definitions = {}
+        self.anonymous = []
+        self.anonymous_data = None
+        self.evaluating_anonymous = False
+        self.values = {}
+        self.results = {}
+        self.hashed = {}
+        self.resolving = []
+
+    def add(self, definitions):
+        """Add definitions, taking precedence over those already added
+        """
+        for definition in definitions:
+            if definition.name is None:
+                self.anonymous.append(definition)
+            else:
+                self.definitions.setdefault(definition.name, []).append(definition)
+
+    def names(self):
+        """Every variable name that has a definition
+        """
+        names = list(self.definitions)
+        if self.anonymous:
+            names += [name for name in self._anonymous_data() if name not in self.definitions]
+        return names
+
+    def origins(self, name):
+        """Where each definition of a variable came from
+        """
+        return [definition.origin for definition in self.definitions.get(name, [])]
+
+    def dependencies(self, names):
+        """The given names along with every variable their definitions reference
+        """
+        found = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name in found or name not in self.definitions:
+                continue
+            found.add(name)
+            for definition in self.definitions[name]:
+                pending.extend(definition.references)
+        return found
+
+    def _evaluate(self, definition, context):
+        if not definition.templated:
+            return definition.data
+        try:
+            with profiling.span('variable', definition.name or definition.origin), \
+                    self.environment.track_hashed() as hashed:
+                template = self.environment.compile_block(definition.source)
+                rendered = template.render(context)
+            self.hashed[id(definition)] = hashed
+            return load_yaml(rendered) or {}
+        except yaml.YAMLError as error:
+            raise BuildException(
+                'Error parsing variable "%s" from %s:\n%s' % (
+                    definition.name or '', definition.origin, error
+                )
+            )
+
+    def _context(self, references, own_name=None, own_value=_MISSING):
+        context = {}
+        for name in references:
+            if name == own_name:
+                if own_value is not _MISSING:
+                    context[name] = own_value
+            elif name in self.definitions:
+                context[name] = self.resolve(name)
+            elif self.anonymous and not self.evaluating_anonymous:
+                anonymous = self._anonymous_data()
+                if name in anonymous:
+                    context[name] = anonymous[name]
+        return context
+
+    def _anonymous_data(self):
+        """Variables from blocks whose names were only known after rendering
+        """
+        if self.anonymous_data is None:
+            data = {}
+            # Blocks may not look up each other's variables while being evaluated
+            self.evaluating_anonymous = True
+            try:
+                for definition in self.anonymous:
+                    context = self._context(definition.references)
+                    self.results[id(definition)] = self._evaluate(definition, context)
+                    data = merge_dicts(self.results[id(definition)], data)
+            finally:
+                self.evaluating_anonymous = False
+            self.anonymous_data = data
+        return self.anonymous_data
+
+    def resolve(self, name):
+        """Return the value of one variable, evaluating its dependencies first
+        """
+        if name in self.values:
+            return self.values[name]
+        if name not in self.definitions:
+            raise KeyError(name)
+        if name in self.resolving:
+            cycle = self.resolving[self.resolving.index(name):] + [name]
+            raise BuildException(
+                'Circular reference between variables: %s (defined in %s)' % (
+                    ' -> '.join(cycle), self.definitions[name][-1].origin
+                )
+            )
+
+        self.resolving.append(name)
+        try:
+            value = _MISSING
+            for definition in self.definitions[name]:
+                context = self._context(definition.references, name, value)
+                data = self._evaluate(definition, context)
+                self.results[id(definition)] = data
+                if name not in data:
+                    continue
+                if value is _MISSING:
+                    value = data[name]
+                else:
+                    value = merge_dicts({name: data[name]}, {name: value})[name]
+        finally:
+            self.resolving.pop()
+
+        self.values[name] = None if value is _MISSING else value
+        return self.values[name]
+
+    def lookup(self, name):
+        """Return the final value of a variable, including unnamed blocks
+        """
+        if not self.anonymous:
+            return self.resolve(name)
+        anonymous = self._anonymous_data()
+        if name not in anonymous:
+            return self.resolve(name)
+        if name not in self.definitions:
+            return anonymous[name]
+        return merge_dicts({name: anonymous[name]}, {name: self.resolve(name)})[name]
+
+    def _definitions(self, names):
+        if names is None:
+            names = self.definitions
+        return [definition for name in names for definition in self.definitions[name]]
+
+    def hashed_files(self, names=None):
+        """Files hashed while evaluating the named variables and those they
+        reference, or every variable for None, along with the unnamed blocks
+        """
+        names = None if names is None else self.dependencies(names)
+        files = set()
+        for definition in self._definitions(names) + self.anonymous:
+            files |= self.hashed.get(id(definition), set())
+        return files
+
+    def invalidate(self, files):
+        """Forget the values of the variables that hashed any of the files, and
+        of the variables referencing those, returning their names
+
+        They are evaluated again the next time they are looked up.
+        """
+        files = set(files)
+        stale = set()
+        anonymous_stale = False
+
+        def outdated(definition):
+            return bool(self.hashed.get(id(definition), set()) & files
+                        or definition.references & stale)
+
+        while True:
+            found = len(stale), anonymous_stale
+            stale |= {
+                name for name, definitions in self.definitions.items()
+                if any(outdated(definition) for definition in definitions)
+            }
+            if not anonymous_stale and any(outdated(definition) for definition in self.anonymous):
+                anonymous_stale = True
+                stale |= set(self.anonymous_data or {})
+            if (len(stale), anonymous_stale) == found:
+                break
+
+        for name in stale:
+            self.values.pop(name, None)
+        if anonymous_stale:
+            self.anonymous_data = None
+        return stale
+
+    def resolve_all(self):
+        """Evaluate every definition, returning all variables in definition order
+        """
+        return {name: self.lookup(name) for name in self.names()}
+
+
+class Variables(Mapping):
+    """Read-only mapping of variables, evaluated the first time each is looked up
+
+    Iterating only goes over `names` when given, which limits what is evaluated
+    when the mapping is copied, as Jinja does when rendering with it. Other
+    defined variables can still be looked up.
+    """
+
+    def __init__(self, resolver, names=None):
+        self.resolver = resolver
+        self.selected = names
+
+    def select(self, names):
+        """A view of these variables iterating only over the given names
+        """
+        if names is None:
+            return Variables(self.resolver)
+        return Variables(self.resolver, [name for name in self.resolver.names() if name in names])
+
+    def __getitem__(self, name):
+        return self.resolver.lookup(name)
+
+    def __contains__(self, name):
+        return name in self.resolver.definitions or name in self.resolver.names()
+
+    def __iter__(self):
+        if self.selected is None:
+            return iter(self.resolver.names())
+        return iter(self.selected)
+
+    def __len__(self):
+        if self.selected is None:
+            return len(self.resolver.names())
+        return len(self.selected)
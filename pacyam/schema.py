@@ -0,0 +1,233 @@
+"""
+Structural validation of merged manifests, before `packer validate` is spawned.
+
+The bundled `schema.yaml` lists the template's sections, and an index of the
+builder, provisioner and post-processor types with the keys they require.
+Checked in-process, on the merged dictionary:
+
+- required sections present, and no unknown ones
+- every builder, provisioner and post-processor has a `type`, and the
+  required keys the schema lists for it
+- builder names are unique, and `only`/`except` name existing builders
+- no Jinja markup was left unrendered, such as a `{{ name }}` which is not
+  a Packer template function
+
+Types missing from the schema, such as those of Packer plugins, are only
+warned about. Every error names the template its section came from. Merging shares the
+sections' objects with the rendered templates (see `pacyam.merge`), so they
+are found by identity.
+"""
+
+from collections import deque
+import os
+import re
+
+from pacyam.codec import load_yaml
+from pacyam.merge import merge_all
+
+BUNDLED_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.yaml')
+
+GO_TEMPLATE = re.compile(r'{{-?\s*(?P<expression>.*?)\s*-?}}')
+JINJA_STATEMENT = re.compile(r'{%.*?%}|{#.*?#}')
+IDENTIFIER = re.compile(r'[A-Za-z_]\w*')
+
+
+class ManifestError:
+    """One problem found in a manifest, at a location such as "builders[0].iso_url"
+
+    Warnings point at what may be fine, and do not make the manifest invalid.
+    """
+
+    def __init__(self, location, message, sources=(), warning=False):
+        self.location = location
+        self.message = message
+        self.sources = list(sources)
+        self.warning = warning
+
+    def __str__(self):
+        origin = ' (from %s)' % ', '.join(self.sources) if self.sources else ''
+        return '%s%s: %s' % (self.location, origin, self.message)
+
+
+def load_schema(paths=()):
+    """The bundled schema, with the schema files at `paths` merged over it
+    """
+    schemas = []
+    for path in [BUNDLED_SCHEMA] + list(paths):
+        with open(path, 'r') as schema_file:
+            schemas.append(load_yaml(schema_file) or {})
+    return merge_all(schemas)
+
+
+def _item_name(section, item):
+    if isinstance(item, str):
+        return item
+    if section == 'builders':
+        return item.get('name', item.get('type'))
+    return item.get('type')
+
+
+class ManifestValidator:
+    """Checks manifests against a schema, see `load_schema`
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.functions = set(schema.get('template_functions', []))
+        self.origins = {}
+        self.errors = []
+
+    def validate(self, manifest, sources=None):
+        """Return a ManifestError for every problem in the manifest, errors and warnings
+
+        `sources` maps template paths to their rendered data, as in
+        `TemplateManager.template_data`, to tell where each section came from.
+        """
+        self.origins = self._origins(sources or {})
+        self.errors = []
+        if not isinstance(manifest, dict):
+            return [ManifestError('manifest', 'must be a mapping')]
+
+        allowed = set(self.schema.get('sections', []))
+        for key in manifest:
+            if key not in allowed and not key.startswith('_'):
+                self._error(key, 'unknown section', self.origins.get(key))
+        for key in self.schema.get('required_sections', []):
+            if not manifest.get(key):
+                self._error(key, 'required section is missing or empty')
+
+        builder_names = self._check_builders(manifest.get('builders'))
+        self._check_section('provisioners', manifest.get('provisioners'), builder_names)
+        self._check_section('post-processors', manifest.get('post-processors'), builder_names)
+        self._check_markup(manifest)
+        return self.errors
+
+    def _origins(self, sources):
+        """Map each top-level key, and the id of each section item, to its templates
+        """
+        origins = {}
+        for path, data in sources.items():
+            if not isinstance(data, dict):
+                continue
+            for key, value in data.items():
+                origins.setdefault(key, []).append(path)
+                if not isinstance(value, list):
+                    continue
+                for item in value:
+                    for step in item if isinstance(item, list) else [item]:
+                        origins.setdefault(id(step), []).append(path)
+        return origins
+
+    def _error(self, location, message, sources=None, warning=False):
+        self.errors.append(ManifestError(location, message, sources or [], warning))
+
+    def _check_builders(self, builders):
+        names = {}
+        for index, builder in enumerate(builders or []):
+            location = 'builders[%d]' % index
+            if not self._check_item('builders', location, builder):
+                continue
+            name = _item_name('builders', builder)
+            if name in names:
+                self._error(
+                    location, 'duplicate builder name "%s", also used by %s' % (name, names[name]),
+                    self.origins.get(id(builder))
+                )
+            else:
+                names[name] = location
+        return set(names)
+
+    def _check_section(self, section, items, builder_names):
+        if items is None:
+            return
+        if not isinstance(items, list):
+            self._error(section, 'must be a list', self.origins.get(section))
+            return
+        for index, item in enumerate(items):
+            steps = item if section == 'post-processors' and isinstance(item, list) else [item]
+            for position, step in enumerate(steps):
+                location = '%s[%d]' % (section, index)
+                if steps is item:
+                    location += '[%d]' % position
+                if self._check_item(section, location, step):
+                    self._check_builder_filters(location, step, builder_names)
+
+    def _check_item(self, section, location, item):
+        """Check an item's type and required keys, returning False if it is unusable
+
+        Types the schema does not list are warned about, and their keys not checked.
+        """
+        types = self.schema.get(section, {})
+        sources = self.origins.get(id(item))
+        if section == 'post-processors' and isinstance(item, str):
+            item = {'type': item}
+        if not isinstance(item, dict):
+            self._error(location, 'must be a mapping', sources)
+            return False
+        item_type = item.get('type')
+        if not item_type:
+            self._error(location, 'missing required key "type"', sources)
+            return False
+        if item_type not in types:
+            self._error(location, 'unknown %s type "%s", not checked' % (
+                section[:-1], item_type
+            ), sources, warning=True)
+            return True
+
+        rules = types[item_type] or {}
+        for key in rules.get('required', []):
+            if key not in item:
+                self._error(location, 'missing required key "%s" for "%s"' % (key, item_type),
+                            sources)
+        for group in rules.get('one_of', []):
+            if not any(key in item for key in group):
+                self._error(location, 'one of %s is required for "%s"' % (
+                    ', '.join('"%s"' % key for key in group), item_type
+                ), sources)
+        return True
+
+    def _check_builder_filters(self, location, item, builder_names):
+        if not isinstance(item, dict):
+            return
+        for key in ('only', 'except'):
+            for name in item.get(key, []):
+                if name not in builder_names:
+                    self._error('%s.%s' % (location, key), 'no builder named "%s"' % name,
+                                self.origins.get(id(item)))
+
+    def _leftover_markup(self, value):
+        """The first piece of unrendered Jinja markup in a string, or None
+        """
+        statement = JINJA_STATEMENT.search(value)
+        if statement:
+            return statement.group(0)
+        for match in GO_TEMPLATE.finditer(value):
+            expression = match.group('expression')
+            if expression.startswith(('.', '"', '`', '$')):
+                continue
+            identifier = IDENTIFIER.match(expression)
+            if identifier and identifier.group(0) in self.functions:
+                continue
+            return match.group(0)
+        return None
+
+    def _check_markup(self, manifest):
+        """Report strings with Jinja markup left in them, anywhere in the manifest
+        """
+        pending = deque((key, value, self.origins.get(key)) for key, value in manifest.items())
+        while pending:
+            location, value, sources = pending.popleft()
+            if isinstance(value, dict):
+                sources = self.origins.get(id(value), sources)
+                pending.extend(
+                    ('%s.%s' % (location, key), child, sources) for key, child in value.items()
+                )
+            elif isinstance(value, list):
+                pending.extend(
+                    ('%s[%d]' % (location, index), child, sources)
+                    for index, child in enumerate(value)
+                )
+            elif isinstance(value, str):
+                markup = self._leftover_markup(value)
+                if markup:
+                    self._error(location, 'unrendered template markup "%s"' % markup, sources)
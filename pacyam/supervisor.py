@@ -0,0 +1,207 @@
+"""
+Asyncio based supervisor for the Packer processes.
+
+Processes run without a shell. Their stdout and stderr are read concurrently
+in large chunks and written out as whole chunks (or whole prefixed lines),
+instead of decoding and printing one line at a time. SIGINT and SIGTERM
+received by pacyam are forwarded to the children, and a timeout stops them.
+"""
+
+import asyncio
+import signal
+import sys
+
+# Bytes read from a child's pipe at once
+CHUNK_SIZE = 64 * 1024
+
+# Seconds a child has to exit after being interrupted, before it is killed
+KILL_GRACE_PERIOD = 10
+
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+class ProcessResult:
+    """Outcome of a supervised process
+    """
+
+    def __init__(self, returncode, stdout=b'', stderr=b'', timed_out=False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+
+
+class OutputWriter:
+    """Writes a child's raw output to a text stream, optionally prefixing every line
+    """
+
+    def __init__(self, stream, prefix=None):
+        self.stream = stream
+        self.prefix = prefix.encode('utf-8') if prefix is not None else None
+        self.partial = b''
+
+    def write(self, data):
+        if self.prefix is not None:
+            lines = (self.partial + data).split(b'\n')
+            self.partial = lines.pop()
+            if not lines:
+                return
+            data = b''.join(self.prefix + line + b'\n' for line in lines)
+        self._emit(data)
+
+    def close(self):
+        if self.partial:
+            self._emit(self.prefix + self.partial + b'\n')
+            self.partial = b''
+
+    def _emit(self, data):
+        buffer = getattr(self.stream, 'buffer', None)
+        if buffer is None:
+            self.stream.write(data.decode('utf-8', 'replace'))
+            return
+        # Keep ordering with anything print()ed before
+        self.stream.flush()
+        buffer.write(data)
+        buffer.flush()
+
+
+class CaptureWriter:
+    """Collects a child's output in memory
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def close(self):
+        pass
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+
+class Supervisor:
+    """Runs processes on an event loop, forwarding signals and enforcing a timeout
+
+    File descriptors in `pass_fds` are inherited by every process.
+    """
+
+    def __init__(self, timeout=None, pass_fds=()):
+        self.timeout = timeout
+        self.pass_fds = tuple(pass_fds)
+        self.processes = set()
+        self.received_signal = None
+
+    def run(self, argv, prefix=None, capture=False):
+        """Run one process to completion and return its ProcessResult
+        """
+        return self.run_all([(argv, prefix)], capture=capture)[0]
+
+    def run_all(self, commands, limit=None, capture=False):
+        """Run (argv, prefix) commands, at most `limit` at once, returning results in order
+        """
+        results = asyncio.run(self._run_all(commands, limit, capture))
+        if self.received_signal == signal.SIGINT:
+            raise KeyboardInterrupt
+        if self.received_signal is not None:
+            raise SystemExit(128 + self.received_signal)
+        return results
+
+    async def _run_all(self, commands, limit, capture):
+        loop = asyncio.get_running_loop()
+        forwarding = self._install_signal_handlers(loop)
+        semaphore = asyncio.Semaphore(limit or max(len(commands), 1))
+
+        async def run_limited(argv, prefix):
+            async with semaphore:
+                return await self._run(argv, prefix, capture, forwarding)
+
+        try:
+            return await asyncio.gather(*[
+                run_limited(argv, prefix) for argv, prefix in commands
+            ])
+        finally:
+            if forwarding:
+                for signum in FORWARDED_SIGNALS:
+                    loop.remove_signal_handler(signum)
+
+    def _install_signal_handlers(self, loop):
+        try:
+            for signum in FORWARDED_SIGNALS:
+                loop.add_signal_handler(signum, self._forward_signal, signum)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Not on the main thread, or not supported by the platform
+            return False
+        return True
+
+    def _forward_signal(self, signum):
+        self.received_signal = signum
+        for process in self.processes:
+            if process.returncode is None:
+                process.send_signal(signum)
+
+    async def _run(self, argv, prefix, capture, new_session):
+        if self.received_signal is not None:
+            return ProcessResult(128 + self.received_signal)
+
+        # In their own session, children only get the signals we forward,
+        # not a second copy of the terminal's Ctrl-C.
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=new_session,
+            pass_fds=self.pass_fds
+        )
+        self.processes.add(process)
+        if capture:
+            stdout, stderr = CaptureWriter(), CaptureWriter()
+        else:
+            stdout, stderr = OutputWriter(sys.stdout, prefix), OutputWriter(sys.stderr, prefix)
+
+        timed_out = False
+        try:
+            await asyncio.wait_for(self._communicate(process, stdout, stderr), self.timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await self._stop(process)
+        finally:
+            self.processes.discard(process)
+            stdout.close()
+            stderr.close()
+
+        if not capture:
+            return ProcessResult(process.returncode, timed_out=timed_out)
+        return ProcessResult(
+            process.returncode, stdout.getvalue(), stderr.getvalue(), timed_out
+        )
+
+    @staticmethod
+    async def _pump(stream, writer):
+        while True:
+            data = await stream.read(CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+
+    async def _communicate(self, process, stdout, stderr):
+        await asyncio.gather(
+            self._pump(process.stdout, stdout),
+            self._pump(process.stderr, stderr)
+        )
+        await process.wait()
+
+    @staticmethod
+    async def _stop(process):
+        """Interrupt a process like Ctrl-C would, killing it if it does not exit
+        """
+        if process.returncode is not None:
+            return
+        process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(process.wait(), KILL_GRACE_PERIOD)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
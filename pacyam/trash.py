@@ -0,0 +1,164 @@
+"""
+Clear Packer output directories without waiting on deleting them.
+
+Each builder writes to its `output_directory`, by default `output-<name>`.
+After a run these are renamed into a `.pacyam-trash` directory next to them,
+which is atomic and instant on the same filesystem, so the next build finds
+the location free. The multi-gigabyte deletes run in a detached process that
+outlives pacyam, and anything it did not get to is reaped by `pacyam gc`.
+
+Only directories inside the project, or inside the working directory that
+Packer resolves `output_directory` against, are moved. The working directory
+and the ones holding it never are, whatever `output_directory` a manifest names.
+
+    $ python -m pacyam.trash .pacyam-trash ...    # What the detached process runs
+"""
+
+from argparse import ArgumentParser
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from pacyam.errors import BuildException
+from pacyam.ledger import builder_name
+
+TRASH_DIRECTORY = '.pacyam-trash'
+
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def output_directories(manifest):
+    """Directories the manifest's builders write to, as Packer resolves them
+    """
+    directories = []
+    for builder in manifest.get('builders', []):
+        directory = builder.get('output_directory', 'output-%s' % builder_name(builder))
+        if '{{' not in directory and directory not in directories:
+            directories.append(directory)
+    return directories
+
+
+def trash_refusal(path, root):
+    """Why a directory must not be moved to the trash, or None when it may be
+    """
+    path = os.path.realpath(path)
+    root = os.path.realpath(root)
+    working_directory = os.path.realpath(os.getcwd())
+    if os.path.commonpath([path, working_directory]) == path:
+        return 'it holds the working directory'
+    for directory in (root, working_directory):
+        if path != directory and os.path.commonpath([path, directory]) == directory:
+            return None
+    return 'it is inside neither the project directory "%s" nor the working directory' % root
+
+
+def move_to_trash(path, root):
+    """Rename a directory of the project at `root` into the trash next to it,
+    returning that trash directory, or None when there was nothing to move
+
+    Raises a BuildException for directories outside both the project and the
+    working directory, and for the working directory or any directory holding it.
+    """
+    path = os.path.abspath(path)
+    if not os.path.isdir(path):
+        return None
+    refusal = trash_refusal(path, root)
+    if refusal:
+        raise BuildException('Not cleaning up "%s", %s.' % (path, refusal))
+    trash = os.path.join(os.path.dirname(path), TRASH_DIRECTORY)
+    os.makedirs(trash, exist_ok=True)
+    destination = os.path.join(
+        trash, '%s-%d-%d' % (os.path.basename(path), os.getpid(), time.time_ns())
+    )
+    os.rename(path, destination)
+    return trash
+
+
+def reap(trash_directories):
+    """Delete everything in the trash directories, returning how many entries went
+    """
+    removed = 0
+    for trash in trash_directories:
+        try:
+            entries = os.listdir(trash)
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            path = os.path.join(trash, entry)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        try:
+            os.rmdir(trash)
+        except OSError:  # Another run trashed something meanwhile
+            pass
+    return removed
+
+
+def reap_detached(trash_directories):
+    """Start a process, outliving this one, to delete the trash directories
+    """
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [PACKAGE_PARENT, environment.get('PYTHONPATH')])
+    )
+    arguments = [os.path.abspath(path) for path in trash_directories]
+    return subprocess.Popen(
+        [sys.executable, '-m', 'pacyam.trash'] + arguments,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=environment,
+        start_new_session=True
+    )
+
+
+def cleanup(directories, root):
+    """Move output directories of the project at `root` to the trash, and delete
+    them in a detached process, so exiting never waits on the deletes
+    """
+    trash_directories = set()
+    for directory in directories:
+        try:
+            trash = move_to_trash(directory, root)
+        except BuildException as error:
+            print(error)
+            continue
+        except OSError as error:
+            print('Could not move "%s" to the trash: %s' % (directory, error))
+            continue
+        if trash:
+            trash_directories.add(trash)
+    if trash_directories:
+        print('\nCleaning up output directories in the background...')
+        reap_detached(sorted(trash_directories))
+
+
+def gc_main(args):
+    """Entry point for `pacyam gc`
+    """
+    parser = ArgumentParser(
+        prog='pacyam gc',
+        description='Delete the output directories earlier runs moved to the trash.'
+    )
+    parser.add_argument(
+        'directories',
+        nargs='*',
+        default=[os.curdir],
+        help='Directories holding a "%s" to empty, by default the current one.' % TRASH_DIRECTORY
+    )
+    options = parser.parse_args(args)
+    removed = reap([os.path.join(directory, TRASH_DIRECTORY) for directory in options.directories])
+    print('-- Removed %d trashed output directories --' % removed)
+    return 0
+
+
+if __name__ == '__main__':
+    reap(sys.argv[1:])
@@ -0,0 +1,179 @@
+"""
+Watch a project and incrementally recompile its manifest on every change.
+
+The dependency graph goes from `config.json` to the variable files, and from
+each template to every file it pulled in while rendering (such as through the
+`include_file` macro). A changed template or included file re-renders only the
+templates depending on it. A changed variable file re-renders only the
+templates that reference a variable whose value changed. A changed file hashed
+through `file_hash`, such as an ISO, is not parsed: the variables computed from
+it are evaluated again, and the templates using them or hashing it re-rendered.
+"""
+
+import os
+import time
+
+from pacyam import profiling
+from pacyam.codec import dump_manifest
+from pacyam.handoff import manifest_file as open_manifest_file
+from pacyam.pacyam import (
+    Configuration, PackerTemplateMerger, VariableManager
+)
+
+
+def _modified_time(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class WatchingTemplateMerger(PackerTemplateMerger):
+    """Keeps the managers alive between compiles and re-renders only what changed
+    """
+
+    def __init__(self, options, configuration=None):
+        super().__init__(options, configuration)
+        if self.template_manager is None:  # Loaded from the manifest cache
+            self._compile()
+        self.template_variables = {}
+        self._index_template_variables(self.config.template_paths)
+        self.snapshot = self._snapshot()
+
+    @property
+    def variable_files(self):
+        return {
+            os.path.abspath(os.path.join(self.config.root_directory, path))
+            for path in self.config.variable_paths
+        }
+
+    def watched_files(self):
+        """Every file the current manifest was built from
+        """
+        files = {os.path.abspath(self.config.config_file_path)} | self.variable_files
+        for loaded in self.template_manager.dependencies.values():
+            files |= loaded
+        for hashed in self.template_manager.hashed.values():
+            files |= hashed
+        return files
+
+    def _snapshot(self):
+        return {path: _modified_time(path) for path in self.watched_files()}
+
+    def _index_template_variables(self, template_paths):
+        environment = self.template_manager.environment
+        for path in template_paths:
+            loaded = self.template_manager.dependencies[path]
+            self.template_variables[path] = environment.referenced_variables(loaded)
+
+    def changed_files(self):
+        """Files modified, created or removed since the last check
+        """
+        snapshot = self._snapshot()
+        changed = {
+            path for path in set(snapshot) | set(self.snapshot)
+            if snapshot.get(path) != self.snapshot.get(path)
+        }
+        self.snapshot = snapshot
+        return changed
+
+    def update(self, changed):
+        """Recompile after `changed` files were modified
+
+        Returns the template paths that were re-rendered.
+        """
+        if os.path.abspath(self.config.config_file_path) in changed:
+            self.config = Configuration.load(
+                root_directory=self.config.root_directory,
+                config_file_name=os.path.relpath(
+                    self.config.config_file_path, self.config.root_directory
+                )
+            )
+            self._compile()
+            self._index_template_variables(self.config.template_paths)
+            self.snapshot = self._snapshot()
+            return set(self.config.template_paths)
+
+        affected = {
+            path for path, loaded in self.template_manager.dependencies.items()
+            if loaded & changed
+        }
+
+        # Includes the templates using a variable computed from a hashed file
+        hashed_changed = {
+            path for path, hashed in self.template_manager.hashed.items() if hashed & changed
+        }
+        if hashed_changed:
+            self.variable_manager.resolver.invalidate(changed)
+            affected |= hashed_changed
+
+        if self.variable_files & changed:
+            old_variables = self.variable_manager.variables
+            self.variable_manager = VariableManager(
+                variable_paths=self.config.variable_paths,
+                variable_root=self.config.root_directory,
+                global_variables=self.options.vars,
+                environment=self.variable_manager.environment
+            )
+            new_variables = self.variable_manager.variables
+            # Only the variables templates look up are compared, and evaluated
+            used = set().union(*self.template_variables.values())
+            changed_names = {
+                name for name in used
+                if old_variables.get(name) != new_variables.get(name)
+            }
+            self.template_manager.variables = new_variables
+            affected |= {
+                path for path, names in self.template_variables.items()
+                if names & changed_names
+            }
+
+        for path in self.config.template_paths:
+            if path in affected:
+                self.template_manager.render_template(path)
+        self._index_template_variables(affected)
+        self.manifest = self._merge()
+        # Includes may have been added or removed
+        self.snapshot = self._snapshot()
+        return affected
+
+    def emit(self):
+        """Write the manifest and validate it, or print it for a dry run
+        """
+        with profiling.span('serialize', self.options.json_backend):
+            manifest_data = dump_manifest(self.manifest, self.options.json_backend)
+        if self.options.dry_run:
+            self._divider()
+            print(manifest_data.decode('utf-8'))
+            return
+
+        with open_manifest_file(manifest_data, self.options.out_file) as (manifest_file, fds):
+            self.manifest_fds = fds
+            try:
+                self._validate_template(manifest_file)
+            finally:
+                self.manifest_fds = ()
+
+    def watch(self):
+        """Poll for changes until interrupted, recompiling on each one
+        """
+        self.emit()
+        print('-- Watching %d files for changes --' % len(self.snapshot))
+        while True:
+            time.sleep(self.options.watch_interval)
+            changed = self.changed_files()
+            if not changed:
+                continue
+            self._divider()
+            for path in sorted(changed):
+                print('-- Changed: %s --' % os.path.relpath(path))
+            try:
+                rendered = self.update(changed)
+            except Exception as error:  # pylint: disable=broad-except
+                print('-- Error compiling template --')
+                print(error)
+                continue
+            print('-- Re-rendered %d of %d templates --' % (
+                len(rendered), len(self.config.template_paths)
+            ))
+            self.emit()
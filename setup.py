@@ -1,11 +1,18 @@
 import os
+import re
 import setuptools
 
-from pacyam.pacyam import __version__
+
+def _read_version():
+    """Read __version__ without importing pacyam and its dependencies
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pacyam', 'version.py')
+    with open(path) as version_file:
+        return re.search(r"__version__ = '([^']+)'", version_file.read()).group(1)
 
 
 name = 'pacyam'
-version = __version__
+version = _read_version()
 author = 'Daniel Starner'
 email = 'starner.daniel5@gmail.com'
 description = 'Command line program that makes designing and developing of multi-environment Packer images a breeze.'
@@ -56,6 +63,7 @@ setuptools.setup(
     url=repository,
     keywords=keywords,
     packages=setuptools.find_packages(exclude=('tests', 'pacyam.tests', 'pacyam/tests')),
+    package_data={'pacyam': ['schema.yaml']},
     install_requires=reqs('requirements.txt'),
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -64,6 +72,6 @@ setuptools.setup(
     ],
     python_requires='>=3.7',
     entry_points = {
-        'console_scripts': ['pacyam = pacyam.pacyam:main'],
+        'console_scripts': ['pacyam = pacyam.cli:main'],
     },
 )
\ No newline at end of file
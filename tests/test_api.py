@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import pacyam
+from pacyam.pacyam import BuildException
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class APITestCase(unittest.TestCase):
+
+    project_root = os.path.join(REPO_ROOT, 'tests', 'project')
+    configs_root = os.path.join(REPO_ROOT, 'tests', 'test-configs')
+
+    def test_compile_project(self):
+        manifest = pacyam.compile_project(self.project_root)
+        self.assertEqual(
+            manifest['builders'][0]['vm_name'], 'ubuntu-18.04.1-server-amd64-v0.1'
+        )
+
+    def test_overrides(self):
+        # Overrides are seen by the variables referencing them
+        from_mapping = pacyam.compile_project(self.project_root, overrides={'os': 'debian-10'})
+        from_strings = pacyam.compile_project(self.project_root, overrides=['os=debian-10'])
+        self.assertEqual(from_mapping, from_strings)
+        self.assertEqual(from_mapping['builders'][0]['vm_name'], 'debian-10-v0.1')
+
+    def test_import_keeps_tracebacks(self):
+        script = 'import sys, pacyam.api, pacyam.matrix; print(hasattr(sys, "tracebacklimit"))'
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=REPO_ROOT)
+        self.assertEqual(output.strip(), b'False')
+
+    def test_compiler_reuses_environments(self):
+        compiler = pacyam.Compiler()
+        first = compiler.compile(self.project_root)
+        environment = compiler.environment(self.project_root)
+        self.assertEqual(compiler.compile(self.project_root), first)
+        self.assertIs(compiler.environment(self.project_root), environment)
+
+    def test_errors_raise(self):
+        with self.assertRaises(BuildException):
+            pacyam.compile_project(self.configs_root, 'bad_json.json')
+        with self.assertRaises(BuildException):
+            pacyam.compile_project(self.configs_root, 'missing.json')
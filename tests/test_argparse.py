@@ -1,7 +1,9 @@
 import os
+import subprocess
+import sys
 import unittest
 
-from pacyam.pacyam import parse_arguments
+from pacyam.cli import parse_arguments
 
 
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -36,3 +38,13 @@ class CLITestCase(unittest.TestCase):
         arguments = '%s -v %s' % (self.project_root, variables)
         options = parse_arg_helper(arguments)
         self.assertEqual(options.vars, [variables])
+
+    def test_entry_point_imports(self):
+        # --help and --version must not load the compile dependencies
+        script = (
+            'import sys, pacyam.cli; '
+            'print(sorted(m for m in ("jinja2", "yaml", "asyncio", "pacyam.pacyam") '
+            'if m in sys.modules))'
+        )
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=REPO_ROOT)
+        self.assertEqual(output.strip(), b'[]')
@@ -0,0 +1,155 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pacyam import handoff
+from pacyam.cli import parse_arguments
+from pacyam.pacyam import BuildException, PackerTemplateMerger
+from tests.utils import FAKE_PACKER, fake_packer
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MANIFEST = {
+    'builders': [
+        {'type': 'qemu', 'iso_url': 'ubuntu.iso'},
+        {'type': 'virtualbox-iso', 'name': 'vbox-fail', 'iso_url': 'ubuntu.iso'},
+        {'type': 'docker', 'name': 'docker', 'image': 'ubuntu', 'commit': True}
+    ]
+}
+
+class BuildTestCase(unittest.TestCase):
+
+    project_root = os.path.join(REPO_ROOT, 'tests', 'project')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manifest_file = os.path.join(self.tmp_dir.name, 'manifest.json')
+        with open(self.manifest_file, 'w') as manifest:
+            json.dump(MANIFEST, manifest)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_merger(self, *extra):
+        cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+        arguments = [self.project_root, '--cache-dir', cache_dir] + list(extra)
+        merger = PackerTemplateMerger(parse_arguments(arguments))
+        merger.manifest = MANIFEST
+        return merger
+
+    def build(self, merger, script=FAKE_PACKER):
+        output = io.StringIO()
+        with fake_packer(self.tmp_dir.name, script), contextlib.redirect_stdout(output), \
+                contextlib.redirect_stderr(output):
+            # Builds the manifest file as is, without validating it first
+            # pylint: disable=protected-access
+            exit_code = merger._build_template(self.manifest_file)
+        return exit_code, output.getvalue()
+
+    def validate(self, merger):
+        """Run `packer validate` on the manifest file, whose content is not compiled
+        """
+        # pylint: disable=protected-access
+        return merger._validate_template(self.manifest_file)
+
+    def test_builder_names(self):
+        merger = self.create_merger('--build-type', 'docker,qemu')
+        self.assertEqual(merger.builder_names(), ['qemu', 'docker'])
+
+        merger = self.create_merger('--build-type', 'lxd')
+        with self.assertRaises(BuildException):
+            merger.builder_names()
+
+    def test_parallel_build(self):
+        exit_code, output = self.build(self.create_merger('--parallel', '2'))
+        self.assertEqual(exit_code, 1)
+        self.assertIn('qemu      | building --only=qemu', output)
+        self.assertIn('vbox-fail | Build errored', output)
+        self.assertIn('docker    | succeeded', output)
+        self.assertIn('vbox-fail | failed (exit 1)', output)
+
+    def test_parallel_build_type(self):
+        merger = self.create_merger('--parallel', '2', '--build-type', 'qemu,docker')
+        exit_code, output = self.build(merger)
+        self.assertEqual(exit_code, 0)
+        self.assertNotIn('vbox-fail', output)
+
+    def test_single_build(self):
+        exit_code, output = self.build(self.create_merger('--build-type', 'vbox-fail'))
+        self.assertEqual(exit_code, 1)
+        self.assertIn('building --only=vbox-fail', output)
+        self.assertIn('Build errored', output)
+
+    def test_validate(self):
+        merger = self.create_merger()
+        output = io.StringIO()
+        with fake_packer(self.tmp_dir.name), contextlib.redirect_stdout(output):
+            self.assertTrue(self.validate(merger))
+        self.assertIn('Passed Validation', output.getvalue())
+
+    def test_timeout(self):
+        merger = self.create_merger('--timeout', '0.5')
+        exit_code, output = self.build(merger, '#!/bin/sh\nexec sleep 30\n')
+        self.assertNotEqual(exit_code, 0)
+        self.assertIn('timed out', output)
+
+    def test_validation_cache(self):
+        counter = os.path.join(self.tmp_dir.name, 'validations')
+        script = '#!/bin/sh\necho x >> %s\necho "Template validated successfully."\n' % counter
+
+        def validate(*extra):
+            merger = self.create_merger(*extra)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertTrue(self.validate(merger))
+            with open(counter) as validations:
+                return len(validations.readlines())
+
+        with fake_packer(self.tmp_dir.name, script):
+            self.assertEqual(validate(), 1)
+            self.assertEqual(validate(), 1)
+            self.assertEqual(validate('--force-validate'), 2)
+
+    def test_failed_validation_not_cached(self):
+        counter = os.path.join(self.tmp_dir.name, 'validations')
+        script = '#!/bin/sh\necho x >> %s\necho "* missing script"\nexit 1\n' % counter
+
+        with fake_packer(self.tmp_dir.name, script), contextlib.redirect_stdout(io.StringIO()):
+            self.assertFalse(self.validate(self.create_merger()))
+            self.assertFalse(self.validate(self.create_merger()))
+        with open(counter) as validations:
+            self.assertEqual(len(validations.readlines()), 2)
+
+    def test_manifest_handoff(self):
+        seen = os.path.join(self.tmp_dir.name, 'seen')
+        script = (
+            '#!/bin/sh\nfor last; do :; done\n'
+            '(echo "$1 $last"; cat "$last"; echo) >> %s\n' % seen
+        )
+        merger = self.create_merger('--build-type', 'docker')
+        with fake_packer(self.tmp_dir.name, script), \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(merger.assemble_template(), 0)
+        with open(seen) as seen_file:
+            lines = seen_file.read().splitlines()
+
+        validate, build = [line for line in lines if line.startswith(('validate', 'build'))]
+        path = validate.split()[1]
+        if handoff.memfd_supported():
+            self.assertTrue(path.startswith('/dev/fd/'))
+        self.assertEqual(build.split()[-1], path)
+        self.assertFalse(os.path.exists(path))
+        # Both commands read the whole manifest
+        self.assertEqual(lines.count('    "builders": ['), 2)
+
+    def test_manifest_handoff_fallback(self):
+        with mock.patch.object(handoff, 'memfd_supported', return_value=False):
+            with handoff.manifest_file(b'{}') as (path, fds):
+                self.assertEqual(fds, ())
+                with open(path, 'rb') as manifest:
+                    self.assertEqual(manifest.read(), b'{}')
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,148 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pacyam.bytecode import TemplateBytecodeCache
+from pacyam.cache import CacheDirectory
+from pacyam.cli import parse_arguments
+from pacyam.environment import RenderEnvironment, TrackingEnvironment
+from pacyam.pacyam import PackerTemplateMerger
+from tests.utils import fake_packer
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class ManifestCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.project_root = os.path.join(self.tmp_dir, 'project')
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        shutil.copytree(os.path.join(REPO_ROOT, 'tests', 'project'), self.project_root)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_merger(self, *extra):
+        options = parse_arguments([self.project_root, '--cache-dir', self.cache_dir] + list(extra))
+        return PackerTemplateMerger(options)
+
+    def test_cache_hit(self):
+        first = self.create_merger()
+        self.assertIsNotNone(first.template_manager)
+
+        second = self.create_merger()
+        self.assertIsNone(second.variable_manager)
+        self.assertIsNone(second.template_manager)
+        self.assertEqual(first.manifest, second.manifest)
+
+    def test_overrides_change_key(self):
+        self.create_merger()
+        merger = self.create_merger('-v', 'vm_name=other')
+        self.assertIsNotNone(merger.template_manager)
+        self.assertEqual(merger.manifest['builders'][0]['vm_name'], 'other-v0.1')
+
+    def test_included_file_change(self):
+        self.create_merger()
+        with open(os.path.join(self.project_root, 'assets', 'boot_command.yaml'), 'a') as asset:
+            asset.write('\n  - "<extra>"')
+
+        merger = self.create_merger()
+        self.assertIsNotNone(merger.template_manager)
+        self.assertIn('<extra>', merger.manifest['builders'][0]['boot_command'])
+
+
+class CacheDirectoryTestCase(unittest.TestCase):
+
+    def test_size_eviction(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = CacheDirectory(cache_dir, max_size=25)
+            cache.write('entries', 'aaaa', b'0123456789')
+            cache.write('entries', 'bbbb', b'0123456789')
+            os.utime(cache.entry_path('entries', 'aaaa'), (0, 0))
+            cache.write('entries', 'cccc', b'0123456789')
+
+            self.assertIsNone(cache.read('entries', 'aaaa'))
+            self.assertEqual(cache.read('entries', 'bbbb'), b'0123456789')
+            self.assertEqual(cache.read('entries', 'cccc'), b'0123456789')
+
+
+class BytecodeCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.project_root = os.path.join(self.tmp_dir, 'project')
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        shutil.copytree(os.path.join(REPO_ROOT, 'tests', 'project'), self.project_root)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def environment(self):
+        return RenderEnvironment(
+            self.project_root, bytecode_cache=TemplateBytecodeCache(self.cache_dir)
+        )
+
+    def test_reuse_compiled(self):
+        environment = self.environment()
+        rendered = environment.get_template('builders/virtualbox.yaml').render(vm_name='x')
+        environment.compile_block('a: "{{ b }}"')
+
+        with mock.patch.object(TrackingEnvironment, 'compile', side_effect=AssertionError):
+            environment = self.environment()
+            self.assertEqual(
+                environment.get_template('builders/virtualbox.yaml').render(vm_name='x'),
+                rendered
+            )
+            self.assertEqual(environment.compile_block('a: "{{ b }}"').render(b=1), 'a: "1"')
+
+    def test_reuse_analysis(self):
+        with open(os.path.join(self.project_root, 'assets', 'boot_command.yaml'), 'a') as source:
+            source.write("# {{ file_hash('scripts/setup.sh') }}\n")
+        inputs = self.environment().template_inputs('builders/virtualbox.yaml')
+        self.assertEqual(inputs[2], [(os.path.join(self.project_root, 'scripts', 'setup.sh'),
+                                      'sha256')])
+
+        # A new environment, as in another process, skips parsing the templates
+        with mock.patch.object(TrackingEnvironment, 'parse', side_effect=AssertionError):
+            self.assertEqual(self.environment().template_inputs('builders/virtualbox.yaml'), inputs)
+
+    def test_source_change(self):
+        self.environment().get_template('builders/virtualbox.yaml')
+        with open(os.path.join(self.project_root, 'builders', 'virtualbox.yaml'), 'a') as source:
+            source.write('\n# {{ changed }}\n')
+
+        with mock.patch.object(TrackingEnvironment, 'compile', side_effect=AssertionError):
+            with self.assertRaises(AssertionError):
+                self.environment().get_template('builders/virtualbox.yaml')
+
+    def test_unusable_cache_dir(self):
+        blocked = os.path.join(self.tmp_dir, 'blocked')
+        with open(blocked, 'w') as blocked_file:
+            blocked_file.write('not a directory')
+        cache = CacheDirectory(os.path.join(blocked, 'pacyam'))
+        cache.write('manifests', 'key', b'data')
+        self.assertIsNone(cache.read('manifests', 'key'))
+
+        options = parse_arguments([self.project_root, '--skip', '--cache-dir', blocked])
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': blocked}), \
+                fake_packer(self.tmp_dir), contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(PackerTemplateMerger(options).assemble_template(), 0)
+
+    def test_config_cache_dir(self):
+        config_path = os.path.join(self.project_root, 'config.json')
+        with open(config_path) as config_file:
+            config = json.load(config_file)
+        config['cache_dir'] = '.pacyam-cache'
+        with open(config_path, 'w') as config_file:
+            json.dump(config, config_file)
+
+        merger = PackerTemplateMerger(parse_arguments([self.project_root]))
+        cache_dir = os.path.join(self.project_root, '.pacyam-cache')
+        self.assertEqual(merger.cache_dir, cache_dir)
+        self.assertTrue(os.listdir(os.path.join(cache_dir, 'bytecode')))
@@ -0,0 +1,25 @@
+import json
+import unittest
+
+from pacyam.codec import dump_manifest, load_yaml
+from pacyam.pacyam import BuildException
+
+
+MANIFEST = {'builders': [{'type': 'qemu', 'headless': True}], 'variables': {'b': 1, 'a': None}}
+
+class CodecTestCase(unittest.TestCase):
+
+    def test_load_yaml(self):
+        data = load_yaml('builders:\n- type: qemu\n  headless: true\n')
+        self.assertEqual(data, {'builders': [{'type': 'qemu', 'headless': True}]})
+
+    def test_json_backend(self):
+        expected = json.dumps(MANIFEST, sort_keys=True, indent=4).encode('utf-8')
+        self.assertEqual(dump_manifest(MANIFEST, 'json'), expected)
+
+    def test_auto_backend(self):
+        self.assertEqual(json.loads(dump_manifest(MANIFEST, 'auto').decode('utf-8')), MANIFEST)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(BuildException):
+            dump_manifest(MANIFEST, 'pickle')
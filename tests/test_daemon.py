@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from pacyam.cli import parse_arguments
+from pacyam.daemon import CompileServer, request_manifest
+from pacyam.pacyam import BuildException, PackerTemplateMerger, TemplateManager, VariableManager
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class DaemonTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.project_root = os.path.join(self.tmp_dir.name, 'project')
+        shutil.copytree(os.path.join(REPO_ROOT, 'tests', 'project'), self.project_root)
+        self.socket_path = os.path.join(self.tmp_dir.name, 'pacyam.sock')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def start_server(self):
+        server = CompileServer(self.socket_path)
+        ready = threading.Event()
+        thread = threading.Thread(target=server.serve, args=(ready,))
+        thread.start()
+        ready.wait()
+
+        def stop():
+            server.shutdown()
+            thread.join()
+        self.addCleanup(stop)
+        return server
+
+    def compile_locally(self, overrides=None):
+        with open(os.path.join(self.project_root, 'config.json')) as config_file:
+            config = json.load(config_file)
+        variable_manager = VariableManager(config['variables'], self.project_root, overrides)
+        return TemplateManager(
+            variable_manager, config['templates'], self.project_root
+        ).merge_template_data()
+
+    def test_no_server(self):
+        self.assertIsNone(request_manifest(self.socket_path, self.project_root))
+
+    def test_compile(self):
+        server = self.start_server()
+        manifest = request_manifest(
+            self.socket_path, self.project_root, overrides=['version=2.0']
+        )
+        self.assertEqual(json.loads(manifest), self.compile_locally(['version=2.0']))
+        self.assertIn(self.project_root, server.compiler.environments)
+
+    def test_invalidated_by_changes(self):
+        self.start_server()
+        before = json.loads(request_manifest(self.socket_path, self.project_root))
+        with open(os.path.join(self.project_root, 'variables', 'default.yaml'), 'a') as variables:
+            variables.write('\nssh_username: packer\n')
+        after = json.loads(request_manifest(self.socket_path, self.project_root))
+        self.assertNotEqual(before, after)
+        self.assertEqual(after, self.compile_locally())
+
+    def test_errors(self):
+        self.start_server()
+        with self.assertRaises(BuildException) as context:
+            request_manifest(self.socket_path, self.project_root, 'missing.json')
+        self.assertIn('missing.json', str(context.exception))
+
+    def test_merger_falls_back(self):
+        options = parse_arguments([self.project_root, '--daemon', self.socket_path])
+        merger = PackerTemplateMerger(options)
+        self.assertIsNotNone(merger.template_manager)
+        self.assertEqual(merger.manifest, self.compile_locally())
+
+        self.start_server()
+        merger = PackerTemplateMerger(options)
+        self.assertIsNone(merger.template_manager)
+        self.assertEqual(merger.manifest, self.compile_locally())
+
+    def test_open_socket_directory(self):
+        shared = os.path.join(self.tmp_dir.name, 'shared')
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        socket_path = os.path.join(shared, 'pacyam.sock')
+        with self.assertRaises(BuildException):
+            CompileServer(socket_path).serve()
+        with self.assertRaises(BuildException):
+            request_manifest(socket_path, self.project_root)
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_idle_client(self):
+        with mock.patch('pacyam.daemon.REQUEST_TIMEOUT', 0.2):
+            self.start_server()
+            idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.addCleanup(idle.close)
+            idle.connect(self.socket_path)
+            manifest = request_manifest(self.socket_path, self.project_root)
+        self.assertEqual(json.loads(manifest), self.compile_locally())
@@ -0,0 +1,54 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from pacyam.cli import parse_arguments
+from pacyam.depfile import format_depfile
+from pacyam.pacyam import BuildException, PackerTemplateMerger
+from tests.utils import fake_packer
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class DepfileTestCase(unittest.TestCase):
+
+    project_root = os.path.join(REPO_ROOT, 'tests', 'project')
+
+    def test_format(self):
+        self.assertEqual(
+            format_depfile('out.json', ['b file.yaml', 'a$1.yaml', 'b file.yaml']),
+            'out.json: \\\n  a$$1.yaml \\\n  b\\ file.yaml\n'
+        )
+
+    def test_needs_out(self):
+        with self.assertRaises(BuildException):
+            PackerTemplateMerger(parse_arguments([self.project_root, '--depfile', 'deps.d']))
+
+    def test_dependencies(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_file = os.path.join(tmp_dir, 'manifest.json')
+            depfile = os.path.join(tmp_dir, 'manifest.d')
+            options = parse_arguments([
+                self.project_root, '--out', out_file, '--depfile', depfile, '--skip'
+            ])
+            with fake_packer(tmp_dir), contextlib.redirect_stdout(io.StringIO()):
+                PackerTemplateMerger(options).assemble_template()
+
+            with open(depfile) as deps:
+                target, dependencies = deps.read().split(':', 1)
+        self.assertEqual(target, out_file)
+        dependencies = dependencies.replace('\\\n', ' ').split()
+        expected = [
+            'config.json',
+            'variables/default.yaml',
+            'builders/virtualbox.yaml',
+            'post-processors/vagrant.yaml',
+            'provisioners/core.yaml',
+            'assets/boot_command.yaml'
+        ]
+        for path in expected:
+            self.assertIn(os.path.relpath(os.path.join(self.project_root, path)), dependencies)
+        self.assertEqual(len(dependencies), len(expected))
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pacyam import hashing
+from pacyam.cache import CacheDirectory
+from pacyam.cli import parse_arguments
+from pacyam.environment import RenderEnvironment
+from pacyam.hashing import FileHasher
+from pacyam.pacyam import BuildException, TemplateManager, VariableManager
+from pacyam.watch import WatchingTemplateMerger
+
+
+class FileHashTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        self.files = {
+            'iso/ubuntu.iso': b'ubuntu' * 1000,
+            'iso/debian.iso': b'debian' * 1000,
+            'assets/empty': b'',
+            'variables.yaml': (
+                b'iso_path: iso/ubuntu.iso\n'
+                b'iso_checksum: "{{ file_hash(iso_path) }}"\n'
+                b'unused_checksum: "{{ file_hash(\'iso/debian.iso\', \'md5\') }}"\n'
+            ),
+            'template.yaml': (
+                b'builders:\n'
+                b'- iso_checksum: "{{ iso_checksum }}"\n'
+                b'  empty: "{{ file_hash(\'assets/empty\') }}"\n'
+                b'  debian: "{{ file_hash(\'iso/debian.iso\', \'sha1\') }}"\n'
+            )
+        }
+        for path, content in self.files.items():
+            full_path = self.path(path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'wb') as data:
+                data.write(content)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def path(self, path):
+        return os.path.join(self.root, path)
+
+    def test_digest_file(self):
+        with mock.patch.object(hashing, 'CHUNK_SIZE', 1000):
+            self.assertEqual(
+                hashing.digest_file(self.path('iso/ubuntu.iso')),
+                hashlib.sha256(self.files['iso/ubuntu.iso']).hexdigest()
+            )
+        self.assertEqual(
+            hashing.digest_file(self.path('assets/empty'), 'md5'), hashlib.md5(b'').hexdigest()
+        )
+
+    def test_persistent_cache(self):
+        cache = CacheDirectory(os.path.join(self.root, 'cache'))
+        iso = self.path('iso/ubuntu.iso')
+        digest = FileHasher(cache).hash(iso)
+
+        with mock.patch.object(hashing, 'digest_file', side_effect=AssertionError):
+            self.assertEqual(FileHasher(cache).hash(iso), digest)
+
+        with open(iso, 'ab') as data:
+            data.write(b'changed')
+        self.assertNotEqual(FileHasher(cache).hash(iso), digest)
+
+    def test_evicts_once(self):
+        cache = CacheDirectory(os.path.join(self.root, 'cache'))
+        hasher = FileHasher(cache)
+        with mock.patch.object(cache, 'evict') as evict:
+            hasher.prefetch([(self.path(path), 'sha256') for path in self.files])
+            self.assertEqual(evict.call_count, 1)
+            hasher.flush()
+            self.assertEqual(evict.call_count, 1)
+
+    def test_templates(self):
+        environment = RenderEnvironment(self.root)
+        prefetch = mock.patch.object(
+            environment.file_hasher, 'prefetch', wraps=environment.file_hasher.prefetch
+        )
+        with prefetch as prefetched, environment.track() as loaded, \
+                environment.track_hashed() as hashed:
+            variable_manager = VariableManager(
+                ['variables.yaml'], self.root, environment=environment
+            )
+            manager = TemplateManager(variable_manager, ['template.yaml'], self.root)
+
+        # Hashed together before rendering, except for the unused variable
+        self.assertEqual(sorted(prefetched.call_args[0][0]), [
+            (self.path('assets/empty'), 'sha256'),
+            (self.path('iso/debian.iso'), 'sha1'),
+            (self.path('iso/ubuntu.iso'), 'sha256')
+        ])
+        self.assertEqual(manager.merge_template_data()['builders'][0], {
+            'iso_checksum': hashlib.sha256(self.files['iso/ubuntu.iso']).hexdigest(),
+            'empty': hashlib.sha256(b'').hexdigest(),
+            'debian': hashlib.sha1(self.files['iso/debian.iso']).hexdigest()
+        })
+        # Hashed files are dependencies, but not templates to parse
+        self.assertEqual(loaded, {self.path('template.yaml')})
+        self.assertEqual(hashed, {
+            self.path('iso/ubuntu.iso'), self.path('iso/debian.iso'), self.path('assets/empty')
+        })
+        self.assertEqual(manager.hashed['template.yaml'], hashed)
+
+    def test_variables_hashed_elsewhere(self):
+        with open(self.path('other.yaml'), 'w') as other:
+            other.write('checksum: "{{ iso_checksum }}"\n')
+        templates = ['other.yaml', 'template.yaml', 'template.yaml']
+        iso = self.path('iso/ubuntu.iso')
+        for workers in (1, 2):
+            variable_manager = VariableManager(['variables.yaml'], self.root)
+            manager = TemplateManager(variable_manager, templates, self.root, workers=workers)
+            # The variable was evaluated for the first template, or the pool's snapshot
+            self.assertIn(iso, manager.hashed['other.yaml'])
+            self.assertIn(iso, manager.hashed['template.yaml'])
+
+    def test_invalidate(self):
+        variable_manager = VariableManager(['variables.yaml'], self.root)
+        variables = variable_manager.variables
+        before = variables['iso_checksum']
+        iso = self.path('iso/ubuntu.iso')
+        self.assertEqual(variable_manager.resolver.invalidate({self.path('assets/empty')}), set())
+        with open(iso, 'ab') as data:
+            data.write(b'changed')
+        self.assertEqual(variable_manager.resolver.invalidate({iso}), {'iso_checksum'})
+        self.assertNotEqual(variables['iso_checksum'], before)
+
+    def test_watch(self):
+        with open(self.path('config.json'), 'w') as config:
+            json.dump({'templates': ['template.yaml'], 'variables': ['variables.yaml']}, config)
+        iso = self.path('iso/ubuntu.iso')
+        with open(iso, 'wb') as data:
+            data.write(bytes(range(256)))  # Not text
+        merger = WatchingTemplateMerger(parse_arguments([self.root, '--watch']))
+        self.assertIn(iso, merger.watched_files())
+
+        with open(iso, 'ab') as data:
+            data.write(b'changed')
+        self.assertEqual(merger.update({iso}), {'template.yaml'})
+        self.assertEqual(
+            merger.manifest['builders'][0]['iso_checksum'],
+            hashlib.sha256(bytes(range(256)) + b'changed').hexdigest()
+        )
+
+    def test_missing_file(self):
+        environment = RenderEnvironment(self.root)
+        with self.assertRaises(BuildException):
+            environment.file_hash('iso/missing.iso')
+        with self.assertRaises(BuildException):
+            environment.file_hash('iso/ubuntu.iso', 'rot13')
@@ -0,0 +1,137 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pacyam.cli import parse_arguments
+from pacyam.ledger import builder_artifacts, builder_fingerprint, builder_sections, local_files
+from pacyam.pacyam import PackerTemplateMerger
+from tests.utils import fake_packer
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BuildLedgerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.project_root = os.path.join(self.tmp_dir, 'project')
+        shutil.copytree(os.path.join(REPO_ROOT, 'tests', 'project'), self.project_root)
+        self.iso = os.path.join(self.tmp_dir, 'disk.iso')
+        with open(self.iso, 'w') as iso:
+            iso.write('iso')
+        self.outputs = {}
+        for name in ('qemu', 'docker'):
+            self.outputs[name] = os.path.join(self.project_root, 'output-%s' % name)
+            os.mkdir(self.outputs[name])
+        self.manifest = {
+            'builders': [
+                {'type': 'qemu', 'iso_url': self.iso, 'output_directory': self.outputs['qemu']},
+                {'type': 'docker', 'image': 'ubuntu', 'output_directory': self.outputs['docker']}
+            ],
+            'provisioners': [{'type': 'shell', 'inline': ['apt-get update'], 'only': ['docker']}]
+        }
+        self.manifest_file = os.path.join(self.tmp_dir, 'manifest.json')
+        with open(self.manifest_file, 'w') as manifest:
+            json.dump(self.manifest, manifest)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def build(self, *extra):
+        merger = PackerTemplateMerger(
+            parse_arguments([self.project_root, '--incremental'] + list(extra))
+        )
+        merger.manifest = self.manifest
+        output = io.StringIO()
+        with fake_packer(self.tmp_dir), contextlib.redirect_stdout(output), \
+                mock.patch('pacyam.trash.reap_detached'):
+            # Builds the manifest file as is, without validating it first
+            # pylint: disable=protected-access
+            exit_code = merger._build_template(self.manifest_file)
+        self.assertEqual(exit_code, 0)
+        return output.getvalue()
+
+    def test_fingerprint(self):
+        qemu = builder_fingerprint(self.manifest, 'qemu')
+        docker = builder_fingerprint(self.manifest, 'docker')
+
+        # Provisioners only count for the builders they run for
+        self.manifest['provisioners'][0]['inline'].append('apt-get upgrade')
+        self.assertEqual(builder_fingerprint(self.manifest, 'qemu'), qemu)
+        self.assertNotEqual(builder_fingerprint(self.manifest, 'docker'), docker)
+
+        with open(self.iso, 'a') as iso:
+            iso.write('changed')
+        self.assertNotEqual(builder_fingerprint(self.manifest, 'qemu'), qemu)
+
+    def test_fingerprint_variables(self):
+        self.manifest['variables'] = {'image': 'ubuntu', 'tag': 'lts', 'unused': 'a'}
+        self.manifest['builders'][1]['image'] = '{{user `image`}}:{{ user `tag` }}'
+        qemu = builder_fingerprint(self.manifest, 'qemu')
+        docker = builder_fingerprint(self.manifest, 'docker')
+
+        # Only the variables a builder refers to count for it
+        self.manifest['variables']['unused'] = 'b'
+        self.assertEqual(builder_fingerprint(self.manifest, 'docker'), docker)
+        self.manifest['variables']['tag'] = '{{user `release`}}'
+        self.manifest['variables']['release'] = '18.04'
+        self.assertEqual(builder_fingerprint(self.manifest, 'qemu'), qemu)
+        self.assertNotEqual(builder_fingerprint(self.manifest, 'docker'), docker)
+
+        # Including the variables those refer to
+        docker = builder_fingerprint(self.manifest, 'docker')
+        self.manifest['variables']['release'] = '20.04'
+        self.assertNotEqual(builder_fingerprint(self.manifest, 'docker'), docker)
+
+    def test_artifacts(self):
+        self.manifest['post-processors'] = [
+            {'type': 'vagrant', 'output': 'qemu.box', 'only': ['qemu']},
+            {'type': 'vagrant', 'output': '{{.BuildName}}.box', 'only': ['docker']}
+        ]
+        self.assertEqual(builder_artifacts(self.manifest, 'qemu'), [os.path.abspath('qemu.box')])
+        # Outputs only known once built fall back to the output directory
+        self.assertEqual(builder_artifacts(self.manifest, 'docker'), [self.outputs['docker']])
+
+    def test_local_files(self):
+        script = os.path.join(self.project_root, 'scripts', 'update.sh')
+        os.makedirs(os.path.dirname(script), exist_ok=True)
+        with open(script, 'w') as script_file:
+            script_file.write('apt-get update')
+        self.manifest['variables'] = {'iso': self.iso}
+        self.manifest['builders'][0]['iso_url'] = '{{user `iso`}}'
+        self.manifest['provisioners'] = [
+            {'type': 'shell', 'script': script, 'execute_command': self.tmp_dir},
+            {'type': 'file', 'source': self.project_root, 'destination': self.tmp_dir},
+            {'type': 'file', 'source': self.manifest_file, 'destination': self.tmp_dir,
+             'direction': 'download'}
+        ]
+        files = local_files(builder_sections(self.manifest, 'qemu'))
+        project_files = [path for path in files if path.startswith(self.project_root + os.sep)]
+        # Guest paths, like destinations, are not read on the host
+        self.assertEqual(sorted(set(files) - set(project_files)), [self.iso])
+        self.assertIn(script, project_files)
+
+    def test_incremental_build(self):
+        self.assertIn('building --only=qemu,docker', self.build())
+        self.assertIn('All builders are up to date', self.build())
+
+        self.manifest['builders'][1]['image'] = 'debian'
+        output = self.build()
+        self.assertIn('building --only=docker', output)
+        self.assertIn('Reusing qemu, unchanged since its last build: %s' % self.outputs['qemu'],
+                      output)
+        # The output directory kept from the last build was cleared for Packer
+        self.assertFalse(os.path.exists(self.outputs['docker']))
+        self.assertTrue(os.path.isdir(self.outputs['qemu']))
+        os.mkdir(self.outputs['docker'])
+
+        os.rmdir(self.outputs['qemu'])
+        output = self.build('--parallel', '2')
+        self.assertIn('qemu | building --only=qemu', output)
+        self.assertIn('Reusing docker', output)
@@ -0,0 +1,69 @@
+import os
+import unittest
+
+from pacyam.cli import parse_arguments
+from pacyam.matrix import MatrixBuilder, compile_matrix, expand_matrix
+from pacyam.pacyam import BuildException, Configuration
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class MatrixTestCase(unittest.TestCase):
+
+    project_root = os.path.join(REPO_ROOT, 'tests', 'test-configs')
+
+    def load_config(self):
+        return Configuration.load(
+            root_directory=self.project_root,
+            config_file_name='matrix.json'
+        )
+
+    def test_expand_axes(self):
+        combinations = expand_matrix(self.load_config().matrix)
+        names = [combination['name'] for combination in combinations]
+        self.assertEqual(names, ['dev-qemu', 'dev-docker', 'prod-qemu', 'prod-docker'])
+        self.assertEqual(combinations[1]['variables'], ['variables/list.yaml'])
+        self.assertEqual(combinations[1]['vars'], ['type=docker'])
+
+    def test_expand_list(self):
+        combinations = expand_matrix([{'name': 'a', 'vars': ['x=1']}, {'name': 'b'}])
+        self.assertEqual(combinations[0], {'name': 'a', 'variables': [], 'vars': ['x=1']})
+        self.assertEqual(combinations[1], {'name': 'b', 'variables': [], 'vars': []})
+
+    def test_duplicate_names(self):
+        with self.assertRaises(BuildException):
+            expand_matrix([{'name': 'a'}, {'name': 'a'}])
+
+    def test_compile_matrix(self):
+        config = self.load_config()
+        combinations = expand_matrix(config.matrix)
+
+        serial = compile_matrix(config, combinations)
+        parallel = compile_matrix(config, combinations, workers=2)
+        self.assertEqual(serial, parallel)
+
+        names = [name for name, _ in serial]
+        self.assertEqual(names, ['dev-qemu', 'dev-docker', 'prod-qemu', 'prod-docker'])
+        builder_types = [manifest['builders'][0]['type'] for _, manifest in serial]
+        self.assertEqual(builder_types, ['qemu', 'docker', 'qemu', 'docker'])
+
+    def test_command_line_overrides(self):
+        config = self.load_config()
+        combinations = expand_matrix(config.matrix)
+        results = compile_matrix(config, combinations, overrides=['type=lxd'])
+        builder_types = {manifest['builders'][0]['type'] for _, manifest in results}
+        self.assertEqual(builder_types, {'lxd'})
+
+    def test_matrix_flag(self):
+        options = parse_arguments([self.project_root, '--matrix'])
+        self.assertEqual(options.matrix, '')
+        builder = MatrixBuilder(options, self.load_config())
+        self.assertEqual(len(builder.combinations), 4)
+
+        self.assertIsNone(parse_arguments([self.project_root]).matrix)
+        config = Configuration.load(
+            root_directory=self.project_root,
+            config_file_name='some-unique-name.json'
+        )
+        with self.assertRaises(BuildException):
+            MatrixBuilder(options, config)
@@ -1,6 +1,6 @@
 import unittest
 
-from pacyam.pacyam import merge_dicts
+from pacyam.pacyam import merge_all, merge_dicts
 
 
 class MergeDictTestCase(unittest.TestCase):
@@ -54,3 +54,49 @@ class MergeDictTestCase(unittest.TestCase):
 
         result = merge_dicts(a, b)
         self.assertEqual(expected, result)
+
+    def test_merge_does_not_mutate(self):
+        a = {'a': {'d': [1, 2]}, 'e': [1]}
+        b = {'a': {'c': 5, 'd': [3, 4]}, 'e': [2]}
+
+        merge_dicts(a, b)
+        self.assertEqual(a, {'a': {'d': [1, 2]}, 'e': [1]})
+        self.assertEqual(b, {'a': {'c': 5, 'd': [3, 4]}, 'e': [2]})
+
+    def test_merge_shares_unchanged(self):
+        a = {'a': {'b': 1}}
+        b = {'c': {'d': 2}}
+
+        result = merge_dicts(a, b)
+        self.assertIs(result['a'], a['a'])
+        self.assertIs(result['c'], b['c'])
+
+    def test_merge_very_deep(self):
+        a, b = {}, {}
+        node_a, node_b = a, b
+        for _ in range(5000):
+            node_a['x'], node_b['x'] = {}, {}
+            node_a, node_b = node_a['x'], node_b['x']
+        node_a['value'] = 1
+
+        result = merge_dicts(a, b)
+        for _ in range(5000):
+            result = result['x']
+        self.assertEqual(result, {'value': 1})
+
+    def test_merge_all_matches_pairwise(self):
+        dicts = [
+            {'a': [1], 'b': {'c': 1, 'd': [1]}, 'e': 1},
+            {'a': [2], 'b': {'d': [2]}, 'e': {'f': 1}},
+            {'a': 'replaced', 'b': {'c': 3}, 'e': {'g': 2}},
+            {'a': [4], 'b': {'d': [4]}}
+        ]
+
+        expected = {}
+        for cur_dict in dicts:
+            expected = merge_dicts(cur_dict, expected)
+        self.assertEqual(merge_all(dicts), expected)
+        self.assertEqual(
+            merge_all(dicts),
+            {'a': [4], 'b': {'c': 3, 'd': [1, 2, 4]}, 'e': {'f': 1, 'g': 2}}
+        )
@@ -0,0 +1,93 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from pacyam import monorepo
+from pacyam.cli import parse_arguments
+
+
+FILES = {
+    'shared/builders/qemu.yaml': 'builders:\n- type: qemu\n  vm_name: "{{ vm_name }}"\n',
+    'shared/post-processors/vagrant.yaml': 'post-processors:\n- type: vagrant\n',
+    'shared/variables/common.yaml': 'vm_name: "{{ os }}-base"\nos: ubuntu\n',
+    'images/ubuntu/variables.yaml': 'disk: 10\n',
+    'images/debian/variables.yaml': 'os: debian\n',
+    'images/broken/variables.yaml': 'os: broken\n',
+    # Not a pacyam config
+    'tools/config.json': '{"name": "some other tool"}',
+}
+
+
+def project_config(variables, templates=('../../shared/builders/qemu.yaml',)):
+    return json.dumps({
+        'templates': list(templates) + ['../../shared/post-processors/vagrant.yaml'],
+        'variables': ['../../shared/variables/common.yaml'] + variables
+    })
+
+
+class MonorepoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        files = dict(FILES)
+        files['images/ubuntu/config.json'] = project_config(['variables.yaml'])
+        files['images/debian/config.json'] = project_config(['variables.yaml'])
+        files['images/broken/config.json'] = project_config(
+            ['variables.yaml'], ['missing.yaml']
+        )
+        for path, content in files.items():
+            full_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'w') as project_file:
+                project_file.write(content)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def project(self, name):
+        return os.path.join(self.root, 'images', name)
+
+    def test_find_projects(self):
+        self.assertEqual(
+            monorepo.find_projects(self.root),
+            [self.project('broken'), self.project('debian'), self.project('ubuntu')]
+        )
+
+    def test_shared_renders(self):
+        results = monorepo.compile_projects(
+            [self.project('debian'), self.project('ubuntu')]
+        )
+        (_, debian, _, _), (_, ubuntu, _, _) = results
+        self.assertEqual(debian['builders'], [{'type': 'qemu', 'vm_name': 'debian-base'}])
+        self.assertEqual(ubuntu['builders'], [{'type': 'qemu', 'vm_name': 'ubuntu-base'}])
+        # Rendered once, as it uses no variables that differ
+        self.assertIs(debian['post-processors'][0], ubuntu['post-processors'][0])
+
+    def assemble(self, *extra):
+        options = parse_arguments([self.root, '--all'] + list(extra))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            exit_code = monorepo.MonorepoBuilder(options).assemble_templates()
+        return exit_code, output.getvalue()
+
+    def test_assemble(self):
+        exit_code, output = self.assemble('--workers', '2')
+        self.assertEqual(exit_code, 1)
+        self.assertIn('images-broken', output)
+        self.assertIn('3 projects, 1 failed', output)
+
+        with open(os.path.join(self.project('ubuntu'), 'manifest.json')) as manifest:
+            self.assertEqual(json.load(manifest)['builders'][0]['vm_name'], 'ubuntu-base')
+        self.assertFalse(os.path.exists(os.path.join(self.project('broken'), 'manifest.json')))
+
+    def test_out_pattern(self):
+        out_dir = os.path.join(self.root, 'out')
+        os.mkdir(out_dir)
+        self.assemble('--out', os.path.join(out_dir, '{name}.json'), '--workers', '1')
+        self.assertEqual(
+            sorted(os.listdir(out_dir)), ['images-debian.json', 'images-ubuntu.json']
+        )
@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+import unittest
+
+from pacyam import profiling
+from pacyam.pacyam import TemplateManager, VariableManager
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class ProfilingTestCase(unittest.TestCase):
+
+    project_root = os.path.join(REPO_ROOT, 'tests', 'test-configs')
+
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled_spans_are_shared(self):
+        self.assertIs(profiling.span('template', 'a'), profiling.span('variable', 'b'))
+
+    def test_nested_self_time(self):
+        profiler = profiling.enable()
+        with profiling.span('template', 'outer') as outer:
+            with profiling.span('variable', 'inner') as inner:
+                pass
+        self.assertEqual([span.name for span in profiler.spans], ['inner', 'outer'])
+        self.assertEqual(outer.children, inner.duration)
+        self.assertEqual(outer.self_time, outer.duration - inner.duration)
+
+    def test_compile_spans(self):
+        profiler = profiling.enable(memory=True)
+        variable_manager = VariableManager(
+            ['variables/out_of_order.yaml'], self.project_root, ['type=qemu']
+        )
+        TemplateManager(variable_manager, ['templates/included.yaml'], self.project_root)
+        profiling.disable()
+
+        names = {(span.category, span.name) for span in profiler.spans}
+        self.assertIn(('template', 'templates/included.yaml'), names)
+        self.assertIn(('variable', 'vm_name'), names)
+        self.assertGreater(profiler.peak_memory(), 0)
+        self.assertIn('-- Profile --', profiler.summary())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_file = os.path.join(tmp_dir, 'trace.json')
+            profiler.write_trace(trace_file)
+            with open(trace_file) as trace:
+                events = json.load(trace)['traceEvents']
+        self.assertEqual(
+            {event['ph'] for event in events}, {'X', 'C'}
+        )
@@ -0,0 +1,114 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+from pacyam.cli import parse_arguments
+from pacyam.merge import merge_all
+from pacyam.pacyam import PackerTemplateMerger
+from pacyam.schema import ManifestValidator, load_schema
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEMPLATES = OrderedDict([
+    ('builders/qemu.yaml', {'builders': [
+        {'type': 'qemu', 'iso_url': 'ubuntu.iso', 'vm_name': '{{ vm_name }}-{{timestamp}}'}
+    ]}),
+    ('builders/docker.yaml', {'builders': [
+        {'type': 'docker'},
+        {'type': 'qemu', 'iso_urls': ['a.iso'], 'output_directory': '{{ .Name }}'}
+    ]}),
+    ('provisioners/core.yaml', {
+        'provisioners': [
+            {'type': 'shell', 'inline': ['{% if debug %}set -x{% endif %}'], 'only': ['lxd']},
+            {'type': 'bash', 'script': 'setup.sh'}
+        ],
+        'post-processors': [[{'type': 'docker-tag', 'repository': 'x'}, 'docker-push']],
+        'builder': {}
+    })
+])
+
+
+class SchemaTestCase(unittest.TestCase):
+
+    def validate(self, templates, schema_paths=()):
+        manifest = merge_all(list(templates.values()))
+        errors = ManifestValidator(load_schema(schema_paths)).validate(manifest, templates)
+        return [str(error) for error in errors]
+
+    def merger(self, manifest, *extra):
+        options = parse_arguments([os.path.join(REPO_ROOT, 'tests', 'project')] + list(extra))
+        merger = PackerTemplateMerger(options)
+        merger.manifest = manifest
+        return merger
+
+    def test_errors(self):
+        self.assertEqual(sorted(self.validate(TEMPLATES)), sorted([
+            'builder (from provisioners/core.yaml): unknown section',
+            'builders[1] (from builders/docker.yaml): missing required key "image" for "docker"',
+            'builders[1] (from builders/docker.yaml): '
+            'one of "commit", "discard", "export_path" is required for "docker"',
+            'builders[2] (from builders/docker.yaml): '
+            'duplicate builder name "qemu", also used by builders[0]',
+            'provisioners[0].only (from provisioners/core.yaml): no builder named "lxd"',
+            'provisioners[1] (from provisioners/core.yaml): '
+            'unknown provisioner type "bash", not checked',
+            'builders[0].vm_name (from builders/qemu.yaml): '
+            'unrendered template markup "{{ vm_name }}"',
+            'provisioners[0].inline[0] (from provisioners/core.yaml): '
+            'unrendered template markup "{% if debug %}"',
+        ]))
+
+    def test_valid(self):
+        templates = OrderedDict([
+            ('builders/qemu.yaml', {'builders': [{'type': 'qemu', 'iso_url': 'ubuntu.iso'}]}),
+            ('post-processors/vagrant.yaml', {
+                'post-processors': ['compress', {'type': 'vagrant', 'output': '{{.Provider}}.box'}]
+            })
+        ])
+        self.assertEqual(self.validate(templates), [])
+
+    def test_extended_schema(self):
+        templates = OrderedDict([
+            ('builders/custom.yaml', {'builders': [{'type': 'custom'}]})
+        ])
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml') as schema:
+            schema.write('builders:\n  custom:\n    required: [image]\n')
+            schema.flush()
+            self.assertEqual(self.validate(templates, [schema.name]), [
+                'builders[0] (from builders/custom.yaml): missing required key "image" for "custom"'
+            ])
+
+    def test_plugin_types(self):
+        templates = OrderedDict([
+            ('builders/plugin.yaml', {'builders': [{'type': 'plugin-builder', 'name': 'custom'}]}),
+            ('provisioners/plugin.yaml', {
+                'provisioners': [{'type': 'plugin-provisioner', 'only': ['custom']}]
+            })
+        ])
+        manifest = merge_all(list(templates.values()))
+        problems = ManifestValidator(load_schema()).validate(manifest, templates)
+        self.assertEqual(len(problems), 2)
+        self.assertTrue(all(problem.warning for problem in problems))
+
+    def test_dry_run_prints_invalid_manifest(self):
+        merger = self.merger({'builders': [{'type': 'qemu'}]}, '--dry-run')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), self.assertRaises(SystemExit) as context:
+            merger.assemble_template()
+        self.assertEqual(context.exception.code, 1)
+        self.assertIn('-- 1 Error in the Manifest --', output.getvalue())
+        self.assertIn('"type": "qemu"', output.getvalue())
+
+    def test_fails_before_packer(self):
+        merger = self.merger({'builders': [{'type': 'qemu'}]})
+        output = io.StringIO()
+        with mock.patch.object(PackerTemplateMerger, '_supervisor', side_effect=AssertionError), \
+                contextlib.redirect_stdout(output):
+            self.assertEqual(merger.assemble_template(), 1)
+        self.assertIn('-- 1 Error in the Manifest --', output.getvalue())
+        self.assertIn('one of "iso_url", "iso_urls" is required for "qemu"', output.getvalue())
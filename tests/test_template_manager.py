@@ -52,3 +52,76 @@ class TemplateManagerTestCase(unittest.TestCase):
         )
         data = manager.merge_template_data()
         self.assertEqual(data, expected)
+
+    def test_shared_environment(self):
+        variable_manager = create_variable_manager(self.project_root, ['type=qemu'])
+        manager = TemplateManager(
+            variable_manager,
+            ['templates/templated.yaml'],
+            self.project_root
+        )
+        self.assertIs(manager.environment, variable_manager.environment)
+
+    def test_merge_is_repeatable(self):
+        variable_manager = create_variable_manager(self.project_root, ['type=docker'])
+        manager = TemplateManager(
+            variable_manager,
+            ['templates/static.yaml', 'templates/templated.yaml'],
+            self.project_root
+        )
+        first = manager.merge_template_data()
+        self.assertEqual(len(first['builders']), 2)
+        self.assertEqual(first, manager.merge_template_data())
+
+    def test_template_variables(self):
+        environment = create_variable_manager(self.project_root).environment
+        self.assertEqual(environment.template_variables('templates/templated.yaml'), {'type'})
+        # Followed through the constant argument of include_file
+        self.assertEqual(
+            environment.template_variables('templates/included.yaml'), {'type', 'vm_name'}
+        )
+        self.assertIsNone(environment.template_variables('templates/dynamic.yaml'))
+
+    def test_only_referenced_variables_evaluated(self):
+        variable_manager = VariableManager(
+            ['variables/out_of_order.yaml', 'variables/cycle.yaml'],
+            self.project_root,
+            ['type=qemu']
+        )
+        manager = TemplateManager(
+            variable_manager,
+            ['templates/included.yaml'],
+            self.project_root
+        )
+        self.assertEqual(manager.merge_template_data(), {
+            'builders': [{'type': 'qemu', 'vm_name': 'ubuntu-18.04'}]
+        })
+        # The circular variables are never looked up
+        self.assertEqual(
+            set(variable_manager.resolver.values), {'type', 'vm_name', 'os', 'version'}
+        )
+
+    def test_render_pool(self):
+        templates = [
+            'templates/included.yaml', 'templates/static.yaml',
+            'templates/templated.yaml', 'templates/static.yaml'
+        ]
+
+        def render(**pool):
+            variable_manager = VariableManager(
+                ['variables/out_of_order.yaml'], self.project_root, ['type=qemu']
+            )
+            environment = variable_manager.environment
+            with environment.track() as loaded:
+                manager = TemplateManager(
+                    variable_manager, templates, self.project_root, **pool
+                )
+            return manager, loaded
+
+        serial, serial_loaded = render()
+        for pool in ('thread', 'process'):
+            manager, loaded = render(workers=3, pool=pool)
+            self.assertEqual(list(manager.template_data), list(serial.template_data))
+            self.assertEqual(manager.merge_template_data(), serial.merge_template_data())
+            self.assertEqual(manager.dependencies, serial.dependencies)
+            self.assertEqual(loaded, serial_loaded)
@@ -0,0 +1,115 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pacyam import trash
+from pacyam.cli import parse_arguments, run_project
+from pacyam.ledger import LEDGER_FILE
+from pacyam.pacyam import BuildException, PackerTemplateMerger
+from tests.utils import fake_packer
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TrashTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_output(self, name):
+        path = os.path.join(self.tmp_dir, name)
+        os.makedirs(os.path.join(path, 'disk'))
+        with open(os.path.join(path, 'disk', 'image.qcow2'), 'w') as image:
+            image.write('image')
+        return path
+
+    def test_output_directories(self):
+        manifest = {'builders': [
+            {'type': 'qemu'},
+            {'type': 'virtualbox-iso', 'name': 'vbox'},
+            {'type': 'docker', 'output_directory': 'build/docker'},
+            {'type': 'lxd', 'output_directory': 'output-{{ timestamp }}'}
+        ]}
+        self.assertEqual(
+            trash.output_directories(manifest), ['output-qemu', 'output-vbox', 'build/docker']
+        )
+
+    def test_move_and_reap(self):
+        output = self.make_output('output-qemu')
+        trash_directory = trash.move_to_trash(output, self.tmp_dir)
+        self.assertEqual(trash_directory, os.path.join(self.tmp_dir, trash.TRASH_DIRECTORY))
+        self.assertFalse(os.path.exists(output))
+        self.assertEqual(len(os.listdir(trash_directory)), 1)
+        self.assertIsNone(trash.move_to_trash(output, self.tmp_dir))
+
+        process = trash.reap_detached([trash_directory])
+        self.assertEqual(process.wait(timeout=30), 0)
+        self.assertFalse(os.path.exists(trash_directory))
+
+    def test_refused_directories(self):
+        project_root = os.path.join(self.tmp_dir, 'project')
+        working_directory = self.make_output(os.path.join('project', 'work'))
+        outside = self.make_output('outside')
+        previous = os.getcwd()
+        os.chdir(working_directory)
+        try:
+            for path in ('.', project_root, outside, '/'):
+                with self.assertRaises(BuildException):
+                    trash.move_to_trash(path, project_root)
+        finally:
+            os.chdir(previous)
+        self.assertTrue(os.path.isdir(os.path.join(working_directory, 'disk')))
+        self.assertTrue(os.path.isdir(outside))
+        self.assertIsNotNone(trash.move_to_trash(working_directory, project_root))
+
+    def test_inside_working_directory(self):
+        # As when running `pacyam project` from the directory holding it
+        project_root = os.path.join(self.tmp_dir, 'project')
+        os.makedirs(project_root)
+        output = self.make_output('output-qemu')
+        previous = os.getcwd()
+        os.chdir(self.tmp_dir)
+        try:
+            self.assertIsNotNone(trash.move_to_trash('output-qemu', project_root))
+        finally:
+            os.chdir(previous)
+        self.assertFalse(os.path.exists(output))
+
+    def test_cleanup_after_build_only(self):
+        project_root = os.path.join(self.tmp_dir, 'project')
+        shutil.copytree(os.path.join(REPO_ROOT, 'tests', 'project'), project_root)
+        output = self.make_output(os.path.join('project', 'output-virtualbox-iso'))
+        previous = os.getcwd()
+        os.chdir(project_root)
+        try:
+            with fake_packer(self.tmp_dir), contextlib.redirect_stdout(io.StringIO()), \
+                    mock.patch('pacyam.trash.reap_detached') as reap_detached:
+                self.assertEqual(run_project(parse_arguments(['.', '--skip'])), 0)
+                self.assertTrue(os.path.isdir(output))
+                self.assertEqual(run_project(parse_arguments(['.'])), 0)
+        finally:
+            os.chdir(previous)
+        self.assertFalse(os.path.exists(output))
+        reap_detached.assert_called_once_with([os.path.join(project_root, trash.TRASH_DIRECTORY)])
+
+    def test_ledger_artifacts_kept(self):
+        project_root = os.path.join(self.tmp_dir, 'project')
+        shutil.copytree(os.path.join(REPO_ROOT, 'tests', 'project'), project_root)
+        kept = self.make_output('kept')
+        with open(os.path.join(project_root, LEDGER_FILE), 'w') as ledger:
+            json.dump({'builders': {'qemu': {'fingerprint': '', 'artifacts': [kept]}}}, ledger)
+
+        merger = PackerTemplateMerger(parse_arguments([project_root]))
+        merger.manifest = {'builders': [
+            {'type': 'qemu', 'output_directory': kept}, {'type': 'docker'}
+        ]}
+        self.assertEqual(merger.output_directories(), ['output-docker'])
@@ -1,7 +1,7 @@
 import os
 import unittest
 
-from pacyam.pacyam import VariableManager
+from pacyam.pacyam import BuildException, VariableManager
 
 
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -78,3 +78,75 @@ class VariableManagerTestCase(unittest.TestCase):
         )
         variables = manager.variables
         self.assertEqual(variables, expected)
+
+    def test_block_cache(self):
+        manager = VariableManager([], self.project_root)
+        compile_block = manager.environment.compile_block
+        self.assertIs(compile_block('a: "{{ b }}"'), compile_block('a: "{{ b }}"'))
+
+    def test_out_of_order_variables(self):
+        manager = VariableManager(['variables/out_of_order.yaml'], self.project_root)
+        self.assertEqual(manager.variables, {
+            'vm_name': 'ubuntu-18.04',
+            'iso_url': 'iso/ubuntu-18.04.iso',
+            'os': 'ubuntu',
+            'version': 18.04
+        })
+
+    def test_circular_variables(self):
+        manager = VariableManager(['variables/cycle.yaml'], self.project_root)
+        with self.assertRaises(BuildException) as context:
+            manager.variables.resolver.resolve('first')
+        self.assertIn('first -> second -> third -> first', str(context.exception))
+
+    def test_variables_from_unnamed_blocks(self):
+        manager = VariableManager(['variables/anonymous.yaml'], self.project_root)
+        self.assertEqual(manager.variables['size'], '10G')
+        self.assertEqual(manager.variables, {'type': 'qemu', 'disk': 10, 'size': '10G'})
+
+    def test_column_zero_values(self):
+        manager = VariableManager(['variables/column_zero.yaml'], self.project_root)
+        self.assertEqual(manager.variables['packages'], ['curl', 'vim'])
+        self.assertEqual(
+            manager.variables['description'],
+            'a description that continues at column 0'
+        )
+
+    def test_later_files_override(self):
+        manager = VariableManager(
+            ['variables/out_of_order.yaml', 'variables/column_zero.yaml',
+             'variables/basic.yaml', 'variables/override.yaml'],
+            self.project_root
+        )
+        variables = manager.variables
+        # Earlier files see values overridden by later ones
+        self.assertEqual(variables['vm_name'], 'centos-0.1')
+        self.assertEqual(variables['packages'], ['curl', 'vim', 'git'])
+        # A value referencing itself sees the previous definition
+        self.assertEqual(variables['disk_device'], '/dev/sda1')
+        self.assertEqual(manager.variable_data['variables/override.yaml']['os'], 'centos')
+
+    def test_unquoted_templates(self):
+        manager = VariableManager(['variables/unquoted.yaml'], self.project_root)
+        self.assertEqual(
+            manager.variables,
+            {'headless': True, 'display': 'none', 'gui': 'off'}
+        )
+
+    def test_global_variables_referenced(self):
+        manager = VariableManager(
+            ['variables/out_of_order.yaml'],
+            self.project_root,
+            global_variables=['os=debian']
+        )
+        self.assertEqual(manager.variables['iso_url'], 'iso/debian-18.04.iso')
+
+    def test_unused_variables(self):
+        manager = VariableManager(
+            ['variables/out_of_order.yaml', 'variables/basic.yaml'],
+            self.project_root
+        )
+        unused = manager.unused_variables({'vm_name'})
+        self.assertEqual(list(unused), ['iso_url', 'disk_device', 'preseed_location'])
+        self.assertEqual(unused['iso_url'], ['variables/out_of_order.yaml'])
+        self.assertEqual(manager.resolver.values, {})
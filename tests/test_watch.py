@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pacyam.cli import parse_arguments
+from pacyam.watch import WatchingTemplateMerger
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class WatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.project_root = os.path.join(self.tmp_dir, 'project')
+        shutil.copytree(os.path.join(REPO_ROOT, 'tests', 'project'), self.project_root)
+        options = parse_arguments([self.project_root, '--watch'])
+        self.merger = WatchingTemplateMerger(options)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def project_path(self, *parts):
+        return os.path.abspath(os.path.join(self.project_root, *parts))
+
+    def edit(self, path, old, new):
+        with open(path, 'r') as edited_file:
+            content = edited_file.read()
+        with open(path, 'w') as edited_file:
+            edited_file.write(content.replace(old, new))
+
+    def test_watched_files(self):
+        watched = self.merger.watched_files()
+        self.assertIn(self.project_path('config.json'), watched)
+        self.assertIn(self.project_path('variables', 'default.yaml'), watched)
+        self.assertIn(self.project_path('assets', 'boot_command.yaml'), watched)
+
+    def test_included_file_change(self):
+        path = self.project_path('assets', 'boot_command.yaml')
+        self.edit(path, '" noapic<wait>"', '" apic<wait>"')
+
+        rendered = self.merger.update({path})
+        self.assertEqual(rendered, {'builders/virtualbox.yaml'})
+        self.assertIn(' apic<wait>', self.merger.manifest['builders'][0]['boot_command'])
+
+    def test_variable_change(self):
+        path = self.project_path('variables', 'default.yaml')
+        self.edit(path, 'ssh_username: vagrant', 'ssh_username: packer')
+
+        # The provisioners reference ssh_username inside a YAML comment
+        rendered = self.merger.update({path})
+        self.assertEqual(rendered, {'builders/virtualbox.yaml', 'provisioners/core.yaml'})
+        self.assertEqual(self.merger.manifest['builders'][0]['ssh_password'], 'packer')
+
+    def test_config_change_in_subdirectory(self):
+        os.mkdir(self.project_path('configs'))
+        path = self.project_path('configs', 'packer.json')
+        shutil.copy(self.project_path('config.json'), path)
+        options = parse_arguments([self.project_root, '--watch', '--config', 'configs/packer.json'])
+        merger = WatchingTemplateMerger(options)
+
+        self.edit(path, '"post-processors/vagrant.yaml",', '')
+        merger.update({path})
+        self.assertEqual(merger.config.config_file_path, path)
+        self.assertNotIn('post-processors', merger.manifest)
+
+    def test_merge_is_repeatable(self):
+        # An update without changes merges the same templates again
+        first = self.merger.manifest
+        self.assertEqual(self.merger.update(set()), set())
+        self.assertIsNot(self.merger.manifest, first)
+        self.assertEqual(self.merger.manifest, first)
@@ -0,0 +1,29 @@
+import os
+import stat
+from unittest import mock
+
+
+FAKE_PACKER = """#!/bin/sh
+# Stand-in for the packer binary, driven by the template being built
+case "$1" in
+    validate) echo "Template validated successfully." ;;
+    build)
+        echo "building $2"
+        case "$2" in
+            *fail*) echo "Build errored" >&2; exit 1 ;;
+        esac
+        ;;
+esac
+"""
+
+
+def fake_packer(directory, script=FAKE_PACKER):
+    """Put a fake `packer` executable first on PATH while the patch is active
+    """
+    path = os.path.join(directory, 'packer')
+    with open(path, 'w') as packer:
+        packer.write(script)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return mock.patch.dict(
+        os.environ, {'PATH': directory + os.pathsep + os.environ.get('PATH', '')}
+    )